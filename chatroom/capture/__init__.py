@@ -0,0 +1,5 @@
+from .capture_file import CaptureWriter
+from .capture_file import CapturedMessage
+from .capture_file import read_capture
+from .replay import ReplayReport
+from .replay import replay_capture
@@ -0,0 +1,149 @@
+""" PURPOSE:
+
+	Records the messages that clients send to the server, so that real
+	traffic can be replayed against another build (see capture.replay).
+
+   FORMAT:
+
+	The file starts with the magic bytes b"CRCP", a version byte and the
+	time the capture started (a double, in seconds since the epoch). Each
+	record after it is:
+
+		time(d)     Seconds since the capture started.
+		session(I)  The id of the session the message came from.
+		type(B)     The message's frame type. frames.CLOSE marks the
+			    client disconnecting.
+		seq(I)      The message's seq, or 0 if the client did not send one.
+		length(I)   The length of the text, followed by its UTF-8 bytes.
+
+	All numbers are little endian.
+"""
+
+import collections
+import struct
+import threading
+import time
+
+MAGIC = b"CRCP"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBd")
+_RECORD = struct.Struct("<dIBII")
+
+#: A message read back from a capture.
+CapturedMessage = collections.namedtuple("CapturedMessage", ["time", "session", "type", "seq", "text"])
+
+class CaptureWriter:
+	""" CLASS DEFINITION
+
+		Appends messages to a capture file. Messages may be recorded from
+		any thread.
+
+	"""
+
+	def __init__(self, path: str):
+		""" self.__init__(str)
+
+			Creates the capture file, replacing any file already at path.
+
+			Args:
+				path(str): Where to write the capture.
+		"""
+
+		self.path = path
+		self.started = time.time()
+		self.count = 0
+
+		#: Times are taken from the monotonic clock, so that changes to
+		#: the system clock during a capture don't reorder it.
+		self._start = time.monotonic()
+
+		self._file = open(path, 'wb')
+		self._file.write(_HEADER.pack(MAGIC, VERSION, self.started))
+		self._lock = threading.Lock()
+
+	@property
+	def closed(self):
+		return self._file.closed
+
+	def record(self, session: int, frame_type: int, text: str, seq: int = None, at: float = None):
+		""" self.record(int, int, str, int, float)
+
+			Records a message sent by a client.
+
+			Args:
+				session(int): The id of the client's session.
+				frame_type(int): The message's frame type.
+				text(str): The message.
+				seq(int): The message's seq, if it had one.
+				at(float): When the message arrived, in seconds since the
+					   capture started. Defaults to now. Passing it
+					   allows captures to be built, eg for benchmarks.
+		"""
+
+		if at is None:
+			at = time.monotonic() - self._start
+
+		data = text.encode()
+		record = _RECORD.pack(at, session, frame_type, seq or 0, len(data))
+
+		with self._lock:
+			if self._file.closed:
+				return
+
+			self._file.write(record + data)
+			self.count += 1
+
+	def close(self):
+		""" Writes out anything buffered, and closes the file. """
+
+		with self._lock:
+			if not self._file.closed:
+				self._file.close()
+
+def read_capture(path: str):
+	""" read_capture(str)
+
+		Reads a capture file.
+
+		Args:
+			path(str): The capture file.
+
+		Returns:
+			A tuple of the time the capture started, and a list of its
+			CapturedMessages, in the order they were recorded.
+
+		Raises:
+			ValueError: If the file is not a capture, or is truncated.
+	"""
+
+	with open(path, 'rb') as c_file:
+		data = c_file.read()
+
+	if len(data) < _HEADER.size:
+		raise ValueError("{} is not a capture file.".format(path))
+
+	magic, version, started = _HEADER.unpack_from(data, 0)
+
+	if magic != MAGIC or version != VERSION:
+		raise ValueError("{} is not a capture file.".format(path))
+
+	messages = []
+	offset = _HEADER.size
+
+	while offset < len(data):
+		if offset + _RECORD.size > len(data):
+			raise ValueError("Capture is truncated.")
+
+		timestamp, session, frame_type, seq, length = _RECORD.unpack_from(data, offset)
+		offset += _RECORD.size
+
+		if offset + length > len(data):
+			raise ValueError("Capture is truncated.")
+
+		text = bytes(data[offset:offset + length]).decode()
+		offset += length
+
+		messages.append(CapturedMessage(timestamp, session, frame_type, seq, text))
+
+	return started, messages
@@ -0,0 +1,414 @@
+""" PURPOSE:
+
+	Replays a capture (see capture_file) against a fresh server, and
+	reports how quickly the chat in it was delivered. This gives a
+	benchmark built from real traffic, rather than a synthetic one.
+
+	Each captured session is replayed as its own client, sending the
+	same messages in the same order, at the captured pace, a multiple of
+	it, or as fast as possible. The server is run in this process over a
+	MemoryTransport, so that every client has its own address (as they
+	did when captured), and the network is not part of what is measured.
+
+   MEASUREMENTS:
+
+	The latency of a chat message is the time from its sender sending it
+	to each other client recieving it. Deliveries are matched to what was
+	sent by the sender's username and the text, in the order they were
+	sent, so a message sent twice in a row by the same user is matched to
+	each of the two in turn.
+
+	A session's username is the one the server accepted when it logged
+	in, so rejected usernames and commands sent before logging in (eg
+	resuming with a token) are not mistaken for it.
+
+	Throughput is the number of messages delivered per second, from the
+	first chat message being sent to the last being delivered.
+"""
+
+import argparse
+import collections
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from .capture_file import read_capture
+
+#: Allow this to be run as a module, or py file.
+try:
+	from protocol import frames, FrameReader
+	from transport import MemoryTransport
+except ImportError:
+	from chatroom.protocol import frames, FrameReader
+	from chatroom.transport import MemoryTransport
+
+#: How many seconds to wait for the server to answer a login attempt.
+LOGIN_TIMEOUT = 5
+
+class ReplayReport:
+	""" CLASS DEFINITION
+
+		The results of a replay.
+
+	"""
+
+	def __init__(self, sessions: int, sent: int, chat: int, delivered: int, duration: float,
+		     latencies: list):
+		""" self.__init__(int, int, int, int, float, list)
+
+			Args:
+				sessions(int): The number of sessions replayed.
+				sent(int): The number of messages sent, of any type.
+				chat(int): The number of chat messages sent.
+				delivered(int): The number of chat messages recieved, by
+						every client.
+				duration(float): The seconds from the first chat message
+						 being sent to the last being delivered.
+				latencies(list): The latency of each delivery that could be
+						 matched to a sent message, in seconds.
+		"""
+
+		self.sessions = sessions
+		self.sent = sent
+		self.chat = chat
+		self.delivered = delivered
+		self.duration = duration
+		self.latencies = sorted(latencies)
+
+	@property
+	def throughput(self):
+		""" Returns the messages delivered per second. """
+		return self.delivered / self.duration if self.duration > 0 else 0.0
+
+	def percentile(self, percent: float):
+		""" self.percentile(float)
+
+			Returns the latency that percent of deliveries were at or under,
+			or None if there were no deliveries.
+		"""
+
+		if len(self.latencies) == 0:
+			return None
+
+		index = min(len(self.latencies) - 1, int(len(self.latencies) * percent / 100))
+		return self.latencies[index]
+
+	def summary(self):
+		""" Returns the report as lines of text. """
+
+		lines = [
+			"Replayed {} messages ({} chat) from {} sessions in {:.2f}s.".format(
+				self.sent, self.chat, self.sessions, self.duration),
+			"Delivered {} messages, {:.1f}/s.".format(self.delivered, self.throughput)
+		]
+
+		if len(self.latencies) != 0:
+			lines.append("Latency: {:.2f}ms average, {:.2f}ms p50, {:.2f}ms p99, {:.2f}ms longest.".format(
+				sum(self.latencies) / len(self.latencies) * 1000, self.percentile(50) * 1000,
+				self.percentile(99) * 1000, self.latencies[-1] * 1000))
+
+		return lines
+
+class ReplayClient:
+	""" CLASS DEFINITION
+
+		One replayed session. Messages are sent by the replay, and a thread
+		reads what the server sends back, recording when chat arrives.
+
+	"""
+
+	def __init__(self, transport, address: tuple, on_chat):
+		""" self.__init__(MemoryTransport, tuple, function)
+
+			Connects to the server, and asks for frames without compression.
+
+			Args:
+				transport(MemoryTransport): The transport the server is on.
+				address(tuple): The server's address.
+				on_chat(function): Called with (this client, username, text,
+						   time recieved) for each chat message
+						   recieved.
+		"""
+
+		self.connection = transport.connect(address)
+		self.on_chat = on_chat
+		self.seq = 0
+
+		#: The username the server accepted, and an event set each time the
+		#: server answers a login attempt.
+		self.username = None
+		self.answered = threading.Event()
+
+		hello = frames.encode_hello(frames.VERSION, 0)
+		self.connection.sendall(hello)
+
+		#: The server may send plain text (eg its prompt) before it reads
+		#: the hello, so wait for the response, and skip what came before.
+		response = b""
+		while hello not in response:
+			data = self.connection.recv(65536)
+			if len(data) == 0:
+				raise ConnectionError("The server closed the connection.")
+			response += data
+
+		self.thread = threading.Thread(target=self.read, args=(response.partition(hello)[2],), daemon=True)
+		self.thread.start()
+
+	def send(self, frame_type: int, text: str):
+		""" Sends a message, with the next seq. """
+
+		self.seq += 1
+		self.connection.sendall(frames.encode_frame(frame_type, self.seq, 0, text.encode()))
+
+	def log_in(self, frame_type: int, text: str):
+		""" Sends a login attempt, and waits for the server to answer it,
+		    as a client would before sending anything else. """
+
+		self.answered.clear()
+		self.send(frame_type, text)
+		self.answered.wait(LOGIN_TIMEOUT)
+
+	def read(self, data: bytes = b""):
+		""" Reads from the server until the connection is closed, starting
+		    with data, which was recieved after the hello. """
+
+		reader = FrameReader()
+
+		while True:
+			if len(data) == 0:
+				try:
+					data = self.connection.recv(65536)
+				except OSError:
+					return
+
+				if len(data) == 0:
+					return
+
+			try:
+				recieved = reader.feed(data)
+			except frames.ProtocolError:
+				return
+
+			data = b""
+
+			now = time.monotonic()
+
+			for frame in recieved:
+				if frame.type == frames.PING:
+
+					#: Pings depend on the replay's pace, not the capture's,
+					#: so they are answered here rather than replayed.
+					try:
+						self.send(frames.PONG, "")
+					except OSError:
+						return
+
+				elif frame.type == frames.CHAT:
+
+					#: Chat is sent as "(username - permission): text".
+					payload = frame.payload.decode()
+					head, _, text = payload.partition("): ")
+					username = head[1:].rpartition(" - ")[0]
+
+					self.on_chat(self, username, text, now)
+
+				elif self.username is None and frame.type in (frames.NOTICE, frames.ERROR):
+
+					#: The server's answer to a login attempt.
+					payload = frame.payload.decode()
+
+					if payload.startswith("Username set to "):
+						self.username = payload[len("Username set to "):-1]
+						self.answered.set()
+					elif payload == "Invalid username. Please try again.":
+						self.answered.set()
+
+	def close(self):
+		self.connection.close()
+
+def replay_capture(path: str, speed: float = 1.0, settle: float = 1.0, keep_limits: bool = False,
+		   server=None):
+	""" replay_capture(str, float, float, bool, chatroomServer)
+
+		Replays a capture against a fresh server.
+
+		Args:
+			path(str): The capture file.
+			speed(float): How many times faster than captured to send the
+				      messages, or None to send them as fast as possible.
+			settle(float): How many seconds to wait for deliveries after the
+				       last message is sent, once they stop arriving.
+			keep_limits(bool): If False, then the server's rate limits and
+					   admission limits are lifted, so that a replay
+					   faster than captured is not throttled.
+			server(chatroomServer): The server to replay against, which must
+						be on a MemoryTransport and not yet
+						started. Defaults to a new server.
+
+		Returns:
+			A ReplayReport.
+	"""
+
+	#: Allow this to be run as a module, or py file.
+	try:
+		from host import chatroomServer
+	except ImportError:
+		from chatroom.host import chatroomServer
+
+	_, messages = read_capture(path)
+
+	#: Keep the replay's snapshot and mailboxes away from the real server's.
+	directory = tempfile.mkdtemp()
+
+	if server is None:
+		#: The replayed sessions are local, so that they are not saved
+		#: to the permission files.
+		server = chatroomServer('localhost', 34343, transport=MemoryTransport(local=True))
+
+		server.mailboxes.close()
+		server.mailboxes = type(server.mailboxes)(os.path.join(directory, "mailboxes.db"))
+
+	server.snapshot_path = os.path.join(directory, "server.snapshot")
+
+	if not keep_limits:
+		for kind in ("message", "command"):
+			server.set_rate_limit(kind, 10 ** 6, 10 ** 6)
+			server.set_rate_limit(kind, 10 ** 6, 10 ** 6, per_ip=True)
+
+		server.admission.max_sessions = max(server.admission.max_sessions,
+						    len({message.session for message in messages}))
+		server.admission.set_accept_rate(10 ** 6, 10 ** 6)
+
+	#: When each (username, text) was sent, how many of those each client
+	#: has recieved, how many messages have been delivered, and the latency
+	#: of those that were matched.
+	sent = collections.defaultdict(list)
+	matched = collections.Counter()
+	latencies = []
+	delivered = [0, 0.0]
+	lock = threading.Lock()
+
+	def on_chat(client: ReplayClient, username: str, text: str, recieved: float):
+		with lock:
+			delivered[0] += 1
+			delivered[1] = recieved
+
+			#: Each client recieves a user's messages in the order they were
+			#: sent, so its nth delivery of a message is the nth time it was
+			#: sent. Every other client recieves the same sends, so they are
+			#: counted per client rather than removed once matched.
+			times = sent.get((username, text), [])
+			index = matched[(client, username, text)]
+
+			if index < len(times):
+				matched[(client, username, text)] += 1
+				latencies.append(recieved - times[index])
+
+	clients = {}
+	chat = 0
+	count = 0
+	first_chat = None
+
+	server.start(no_console=True)
+
+	try:
+		first = messages[0].time if len(messages) != 0 else 0.0
+		start = time.monotonic()
+
+		for message in messages:
+
+			#: Wait until the message is due, at the replay's pace.
+			if speed:
+				delay = start + (message.time - first) / speed - time.monotonic()
+				if delay > 0:
+					time.sleep(delay)
+
+			client = clients.get(message.session)
+
+			if message.type == frames.CLOSE:
+				if client is not None:
+					client.close()
+				continue
+
+			#: Pongs were answers to the server's pings, which are answered
+			#: by each ReplayClient as they arrive.
+			if message.type == frames.PONG:
+				continue
+
+			if client is None:
+				client = clients[message.session] = ReplayClient(server.transport,
+										 (server.host, server.port), on_chat)
+
+			try:
+				#: Until the server accepts a username, whatever the session
+				#: sends (a username, or a command such as resuming with a
+				#: token) is an attempt to log in.
+				if client.username is None and message.type in (frames.CHAT, frames.COMMAND):
+					client.log_in(message.type, message.text)
+					count += 1
+					continue
+
+				if message.type == frames.CHAT:
+					chat += 1
+
+					if first_chat is None:
+						first_chat = time.monotonic()
+
+					with lock:
+						sent[(client.username, message.text)].append(time.monotonic())
+
+				client.send(message.type, message.text)
+				count += 1
+			except OSError:
+				#: The server closed the connection, eg it was refused.
+				pass
+
+		finished = time.monotonic()
+
+		#: Wait for the last deliveries, until none arrive for settle seconds.
+		last = -1
+		while last != delivered[0]:
+			last = delivered[0]
+			time.sleep(settle)
+
+	finally:
+		for client in clients.values():
+			client.close()
+
+		server.stop()
+		shutil.rmtree(directory, ignore_errors=True)
+
+	if first_chat is None:
+		first_chat = start
+
+	return ReplayReport(len(clients), count, chat, delivered[0], max(finished, delivered[1]) - first_chat,
+			    latencies)
+
+if __name__ == "__main__":
+
+	#: Create an argument parser to parse the arguments.
+	parser = argparse.ArgumentParser(description="Replays a capture made with the server's --capture option, and reports how quickly it was delivered.")
+
+	parser.add_argument('capture', type=str,
+			     help='The capture file to replay.')
+
+	parser.add_argument('-s', '--speed', type=float, default=1.0,
+			     help='How many times faster than captured to replay (Default: 1).')
+
+	parser.add_argument('--max-speed', action='store_true',
+			     help='Replay as fast as possible, ignoring the captured times.')
+
+	parser.add_argument('--keep-limits', action='store_true',
+			     help='Keep the server\'s rate and admission limits, rather than lifting them.')
+
+	args = parser.parse_args()
+
+	if args.speed <= 0:
+		parser.error("--speed must be more than 0.")
+
+	report = replay_capture(args.capture, None if args.max_speed else args.speed, keep_limits=args.keep_limits)
+
+	for line in report.summary():
+		print(line)
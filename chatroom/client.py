@@ -6,6 +6,17 @@ import sys
 import os
 import time
 
+try:
+	from protocol import frames
+	from protocol import tls
+	from protocol import StreamDecompressor
+	from scrollback import Scrollback
+except ImportError:
+	from chatroom.protocol import frames
+	from chatroom.protocol import tls
+	from chatroom.protocol import StreamDecompressor
+	from chatroom.scrollback import Scrollback
+
 class chatroomClient:
 	""" CLASS DEFINITION
 
@@ -13,19 +24,35 @@ class chatroomClient:
 
 	"""
 
-	def __init__(self):
-		""" self.__init__(str, int)
+	def __init__(self, binary: bool = True, compress: bool = True, tls_context=None, tls_session=None,
+		     transport=None, scrollback=None):
+		""" self.__init__(bool, bool, SSLContext, SSLSession, Transport, Scrollback)
 
-			Connects to a host server over port port.
+			Creates a client, ready to join a server.
 
 			Args:
-				host(str): The ip address of the server.
-				port(int): the TCP that the server talks over.
+				binary(bool): If True then the client asks the server to use
+					      the binary protocol, rather than plain text.
+				compress(bool): If True then the client asks the server to
+						compress large messages. Only used with binary.
+				tls_context(SSLContext): If given, then TCP connections are
+							 encrypted with TLS. See protocol.tls.
+				tls_session(SSLSession): A session from a previous client's
+							 tls_session, to resume rather than
+							 doing a full handshake.
+				transport(Transport): What to connect over, when a port is
+						      given to join. Defaults to TCP. See
+						      the transport package.
+				scrollback(Scrollback): Where recieved messages are kept,
+							to /scroll and /find through.
+							Defaults to a temporary file,
+							with 256KB kept in memory.
 
 		"""
 
 		#: Create the client and connect it to the host server.
 		self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.transport = transport
 
 		#: Create a seperate thread to control listening to messages
 		#: coming from the server.
@@ -41,27 +68,87 @@ class chatroomClient:
 		#: Have a most recent message for testing purposes.
 		self.most_recent_message = ""
 
+		#: Every message recieved, for the user to look back through. The
+		#: last /scroll or /find is kept, so that /more can carry it on.
+		self.scrollback = scrollback if scrollback is not None else Scrollback()
+		self.browsing = None
+
 		self.joined = True
 
 		#: Used to ensure you: doesnt appear twice.
 		self.displayed_you = False
 
-	def join(self, host: str, port: int, silent: bool = False):
+		#: Whether frames are being used, and the state needed to use them.
+		#: Until the server acknowledges the HELLO, it speaks plain text.
+		self.binary = binary
+		self.hello_sent = False
+		self.negotiated = False
+		self.seq = 0
+		self.reader = frames.FrameReader()
+
+		#: The options asked for, and those the server accepted.
+		self.requested_options = frames.OPTION_COMPRESSION if compress else 0
+		self.options = 0
+		self.decompressor = StreamDecompressor()
+
+		#: The listen thread answers pings while the main thread sends
+		#: messages, so sends are locked to keep frames whole.
+		self.send_lock = threading.RLock()
+
+		#: The responses to requests sent with self.request, by request id.
+		#: None until the response arrives.
+		self.replies = {}
+		self.replies_ready = threading.Condition()
+
+		#: The usernames in the room, kept up to date after calling
+		#: self.subscribe_presence.
+		self.members = set()
+
+		#: The TLS context, and the session to resume. Once connected, the
+		#: session is kept up to date, so that it can be passed to the
+		#: next client that connects to the same server.
+		self.tls_context = tls_context
+		self.tls_session = tls_session
+
+		#: The host that files are uploaded to and downloaded from, which is
+		#: the host that was joined. See self.upload and self.download.
+		self.transfer_host = "localhost"
+
+	def join(self, host: str, port: int = None, silent: bool = False):
 		""" self.join(str, int)
 
 			Join the chatroom hosted on host port port.
 
 			Args:
-				host(str): The IP address of the host.
+				host(str): The IP address of the host, or the path of the
+					   server's Unix socket if port is None.
 				port(int): The port that the chatroom is hosted on.
 				silent(bool): If True then this client does not run
 					      the message sending loop.
 
 		"""
 
+		#: If no port was given, then connect over the server's Unix socket.
+		if port is None:
+			self.client.close()
+			self.client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+			#: Connect to the room.
+			self.client.connect(host)
+		else:
+
+			#: Connect to the room.
+			if self.transport is None:
+				self.client.connect((host, port))
+			else:
+				self.client.close()
+				self.client = self.transport.connect((host, port))
+
+			self.transfer_host = host
 
-		#: Connect to the room.
-		self.client.connect((host, port))
+			if self.tls_context is not None:
+				self.client = self.tls_context.wrap_socket(self.client, server_hostname=host,
+									   session=self.tls_session)
 
 		self.silent = silent
 
@@ -80,20 +167,31 @@ class chatroomClient:
 				self.displayed_you = False
 				msg = str(input())
 
+			#: Looking back through the scrollback is done locally.
+			lines = self.browse(msg)
+			if lines is not None:
+				print("\n".join(lines))
+				continue
+
+			#: Files are sent over their own connection, in the background,
+			#: so that chat carries on while they transfer.
+			if self.joined and self.binary and msg.startswith(("/upload ", "/download ")):
+				threading.Thread(target=self.transfer, args=(msg,), daemon=True).start()
+
 			#: If the client is a part of the server, send
 			#: the message.
-			if self.joined:
+			elif self.joined:
 				self.send(msg)
 
 			if msg == "/quit":
 				self.quit(True)
 
-			#: Server waits .25s after a recieved message.
-			#: This ensures that a user's message will not be
-			#: concatinated if they send them too quickly.
+			#: Wait between messages. This ensures that a user's
+			#: message will not be concatinated if they send them
+			#: too quickly, and keeps the user within the server's
+			#: rate limit.
 			#: No security risk, if this is changed, only
 			#: lost UX.
-			#: This may fail with a ping higher than 250.
 			time.sleep(.5)
 
 	def quit(self, server_alerted: bool):
@@ -109,10 +207,21 @@ class chatroomClient:
 				#: to clean up.
 				pass
 
+		#: Keep the TLS session, which may have been replaced by a newer
+		#: ticket since connecting, so that the next connection can resume it.
+		if getattr(self.client, "session", None) is not None:
+			self.tls_session = self.client.session
+
 		#: Close down the threads and the connection.
 		self.joined = False
 		self.client.close()
 
+		#: Stop waiting for responses that will never come.
+		with self.replies_ready:
+			self.replies_ready.notify_all()
+
+		self.scrollback.close()
+
 	def display_messages(self):
 		"""
 			Displays recieved messages.
@@ -122,21 +231,17 @@ class chatroomClient:
 
 		while self.joined:
 			if len(self.messages) != 0:
-				for msg in self.messages:
-					#: If the message is empty, ignore it.
-					if msg == "":
-						continue
+				for message in list(self.messages):
+					frame_type, msg = message
 
-					#: If the message is close", then the server has told the client
-					#: to shut down, so it will. This is not an issue, as users
-					#: messages will always have an identifier and : before their
-					#: message, thus,the only messages that don't include an
-					#: identifier will be from the server itself.
-					elif msg[:5] == "close":
+					#: If the message is empty, ignore it.
+					if msg == "" and frame_type != frames.CLOSE:
+						pass
 
-						reason = msg[6:]
+					#: The server has told the client to shut down, so it will.
+					elif frame_type == frames.CLOSE:
 
-						print("This client was closed due to {}.".format(reason))
+						print("This client was closed due to {}.".format(msg))
 						self.quit(True)
 
 					#: Otherwise, print the message to the commandline.
@@ -147,7 +252,9 @@ class chatroomClient:
 						self.displayed_you = True
 
 					#: Remove the processed message
-					self.messages.remove(msg)
+					self.messages.remove(message)
+
+			time.sleep(.05)
 
 	def listen(self):
 		"""
@@ -161,18 +268,384 @@ class chatroomClient:
 
 			#: Wait for a message to be recieved from the server.
 			try:
-				#: Store a most recent message for testing purposes.
-				self.most_recent_message = self.client.recv(1024).decode()
-				self.messages.append(self.most_recent_message)
+				data = self.client.recv(1024)
+
+				#: The server has closed the connection.
+				if len(data) == 0:
+					raise OSError
+
+				for frame_type, msg, ref in self.decode(data):
+
+					#: The server pings clients that have been quiet for a while
+					#: to check that they are still connected. Respond straight
+					#: away, without displaying anything.
+					if frame_type == frames.PING:
+						self.send("/pong")
+						continue
+
+					#: Keep the member list up to date, without displaying anything.
+					if frame_type == frames.PRESENCE:
+						self.update_members(msg)
+						continue
+
+					#: Hand responses to whoever is waiting for them.
+					if ref is not None:
+						with self.replies_ready:
+							if ref in self.replies:
+								self.replies[ref] = (frame_type, msg)
+								self.replies_ready.notify_all()
+
+					#: Store a most recent message for testing purposes.
+					self.most_recent_message = msg
+					self.messages.append((frame_type, msg))
+					self.scrollback.add(frame_type, msg)
+			except frames.ProtocolError as e:
+				print("The server sent an invalid message: {}".format(e))
+
+				#: The rest of the stream can not be trusted.
+				self.quit(False)
 			except OSError:
 				print("Connection to the server has been lost.")
 
 				#: Quit from the server to do cleanup.
 				self.quit(False)
 
+	def decode(self, data: bytes):
+		""" self.decode(bytes)
+
+			Converts data recieved from the server into messages.
+
+			Args:
+				data(bytes): The data recieved.
+
+			Returns:
+				A list of (frame type, text, ref) tuples, where ref is the
+				request id that the message answers, or None.
+		"""
+
+		messages = []
+
+		#: The server speaks plain text until it acknowledges the HELLO,
+		#: and each recv holds a single plain text message.
+		if not self.negotiated:
+			text, hello, data = data.partition(frames.HELLO)
+
+			if len(text) != 0:
+				messages.append(frames.from_server_text(text.decode()) + (None,))
+
+			if len(hello) == 0:
+				return messages
+
+			#: The version is followed by the accepted options from version 2.
+			self.negotiated = True
+			version, data = data[0], data[1:]
+
+			if version >= 2:
+				self.options, data = data[0], data[1:]
+
+		for frame in self.reader.feed(data):
+			payload = self.decompressor.decompress(frame.flags, frame.payload)
+			messages.append((frame.type, payload.decode(), frame.ref))
+
+		return messages
+
 	def send(self, msg: str):
-		""" Sends the message msg to the server to be processed. """
-		self.client.send(msg.encode())
+		""" self.send(str)
+
+			Sends the message msg to the server to be processed.
+
+			Args:
+				msg(str): The message, or a command starting with "/".
+
+			Returns:
+				The message's seq, or None if using plain text.
+		"""
+
+		if not self.binary:
+			self.client.send(msg.encode())
+			return None
+
+		frame_type, text = frames.from_client_text(msg)
+
+		with self.send_lock:
+			self.seq += 1
+			data = frames.encode_frame(frame_type, self.seq, 0, text.encode())
+
+			#: Ask to use frames along with the first message. The server
+			#: switches to frames as soon as it sees the HELLO, so this
+			#: message, and everything after it, is sent as a frame.
+			if not self.hello_sent:
+				self.hello_sent = True
+				data = frames.encode_hello(frames.VERSION, self.requested_options) + data
+
+			self.client.sendall(data)
+
+			return self.seq
+
+	def request(self, command: str):
+		""" self.request(str)
+
+			Sends a command without waiting for its response, so that many
+			commands can be sent at once. Use self.get_reply to get the
+			response.
+
+			Args:
+				command(str): The command, eg "/permissions Bob".
+
+			Returns:
+				The request id, used to get the response.
+		"""
+
+		if not self.binary:
+			raise ValueError("Requests can only be matched to responses when using frames.")
+
+		if not command.startswith("/"):
+			command = "/" + command
+
+		#: Register the request before sending it, so that a fast response
+		#: is not missed. The lock keeps the seq from changing in between.
+		with self.send_lock:
+			request_id = (self.seq + 1) & 0xFFFFFFFF
+
+			with self.replies_ready:
+				self.replies[request_id] = None
+
+			self.send(command)
+
+		return request_id
+
+	def subscribe_presence(self, timeout: float = 5):
+		""" self.subscribe_presence(float)
+
+			Gets every username in the room, and asks the server to send
+			each change to them, which is kept in self.members.
+
+			Args:
+				timeout(float): The number of seconds to wait for the list.
+
+			Returns:
+				True if subscribed, or False if the server did not respond.
+		"""
+
+		reply = self.get_reply(self.request("/user_list subscribe"), timeout)
+
+		#: The list is sent a part at a time, each starting with the number
+		#: of users left, so ask for the users after the last one until
+		#: there are none left.
+		while reply is not None and reply[0] == frames.REPLY:
+			remaining, *names = reply[1].split("\n")
+
+			#: Changes may have arrived before the list, so add to the
+			#: members rather than replacing them.
+			self.members.update(name for name in names if len(name) != 0)
+
+			if int(remaining) == 0 or len(names) == 0:
+				return True
+
+			reply = self.get_reply(self.request("/user_list after {}".format(names[-1])), timeout)
+
+		return False
+
+	def update_members(self, changes: str):
+		""" self.update_members(str)
+
+			Applies changes to the user list sent by the server.
+
+			Args:
+				changes(str): Lines of "+" or "-" followed by a username.
+		"""
+
+		for change in changes.split("\n"):
+			if change.startswith("+"):
+				self.members.add(change[1:])
+			elif change.startswith("-"):
+				self.members.discard(change[1:])
+
+	def upload(self, path: str, timeout: float = 5):
+		""" self.upload(str, float)
+
+			Shares a file with the room.
+
+			Args:
+				path(str): The file's path.
+				timeout(float): The seconds to wait for the server to accept
+						the upload.
+
+			Returns:
+				The shared file's id.
+
+			Raises:
+				OSError: If the file can't be read, or the transfer failed.
+		"""
+
+		size = os.path.getsize(path)
+		reply = self.get_reply(self.request("/upload {} {}".format(os.path.basename(path), size)), timeout)
+
+		if reply is None or reply[0] != frames.REPLY:
+			raise OSError(reply[1] if reply is not None else "The server did not respond.")
+
+		_, ticket, port = reply[1].split(" ")
+
+		with socket.create_connection((self.transfer_host, int(port))) as conn, open(path, "rb") as f:
+			conn.sendall((ticket + "\n").encode())
+			conn.sendfile(f)
+
+			status = conn.makefile("r").readline().strip()
+
+		if not status.startswith("OK "):
+			raise OSError(status or "The upload failed.")
+
+		return int(status[3:])
+
+	def download(self, file_id: int, directory: str = ".", timeout: float = 5):
+		""" self.download(int, str, float)
+
+			Gets a file that was shared with the room.
+
+			Args:
+				file_id(int): The file's id, as announced when it was shared.
+				directory(str): Where to save the file.
+				timeout(float): The seconds to wait for the server to accept
+						the download.
+
+			Returns:
+				The path the file was saved to.
+
+			Raises:
+				OSError: If the transfer failed.
+		"""
+
+		reply = self.get_reply(self.request("/download {}".format(file_id)), timeout)
+
+		if reply is None or reply[0] != frames.REPLY:
+			raise OSError(reply[1] if reply is not None else "The server did not respond.")
+
+		_, ticket, port, size, name = reply[1].split(" ", 4)
+		path = os.path.join(directory, os.path.basename(name))
+		remaining = int(size)
+
+		with socket.create_connection((self.transfer_host, int(port))) as conn:
+			conn.sendall((ticket + "\n").encode())
+			stream = conn.makefile("rb")
+
+			status = stream.readline().decode().strip()
+			if not status.startswith("OK "):
+				raise OSError(status or "The download failed.")
+
+			with open(path, "wb") as f:
+				while remaining > 0:
+					chunk = stream.read(min(remaining, 64 * 1024))
+
+					if len(chunk) == 0:
+						raise OSError("The download ended early.")
+
+					f.write(chunk)
+					remaining -= len(chunk)
+
+		return path
+
+	def browse(self, command: str, size: int = 20):
+		""" self.browse(str, int)
+
+			Runs a command that looks back through the scrollback, without
+			involving the server:
+
+				/scroll [page]  Shows a page of messages. Page 1 is the newest.
+				/find [text]    Shows the newest messages containing text.
+				/more           Shows the next page of the last /scroll or /find.
+
+			Args:
+				command(str): What the user typed.
+				size(int): The number of messages shown at once.
+
+			Returns:
+				The lines to show, or None if command is not one of these.
+		"""
+
+		kind, _, argument = command.partition(" ")
+		argument = argument.strip()
+
+		if kind == "/scroll":
+			if argument != "" and (not argument.isdigit() or int(argument) < 1):
+				return ["Usage: /scroll [page]"]
+
+			self.browsing = ("/scroll", int(argument) if argument != "" else 1)
+
+		elif kind == "/find":
+			if argument == "":
+				return ["Usage: /find [text]"]
+
+			self.browsing = ("/find", argument, None)
+
+		elif kind == "/more" and argument == "":
+			if self.browsing is None:
+				return ["Nothing to show more of. Use /scroll or /find first."]
+
+		else:
+			return None
+
+		if self.browsing[0] == "/scroll":
+			page = self.browsing[1]
+			found = self.scrollback.page(page, size)
+
+			self.browsing = ("/scroll", page + 1)
+			header = "Page {} of {}:".format(page, max(1, self.scrollback.pages(size)))
+		else:
+			_, text, before = self.browsing
+
+			#: Carry on from the oldest message already shown, and show them
+			#: oldest first, like the chat itself.
+			found = self.scrollback.find(text, size, before)
+			if len(found) != 0:
+				self.browsing = ("/find", text, found[-1].number)
+
+			found.reverse()
+			header = "Messages containing \"{}\":".format(text)
+
+		if len(found) == 0:
+			return ["No more messages."]
+
+		return [header] + ["[{}] {}".format(time.strftime("%H:%M:%S", time.localtime(line.time)),
+						    line.text.strip()) for line in found]
+
+	def transfer(self, command: str):
+		""" self.transfer(str)
+
+			Runs an /upload [path] or /download [id] typed by the user, and
+			shows how it went.
+		"""
+
+		kind, _, argument = command.partition(" ")
+
+		try:
+			if kind == "/upload":
+				print("Shared {} as file {}.".format(argument, self.upload(argument.strip())))
+			else:
+				print("Saved file {} to {}.".format(argument, self.download(int(argument))))
+		except (OSError, ValueError) as e:
+			print("The transfer failed: {}".format(e))
+
+	def get_reply(self, request_id: int, timeout: float = None):
+		""" self.get_reply(int, float)
+
+			Waits for the response to a request sent with self.request.
+
+			Args:
+				request_id(int): The id returned by self.request.
+				timeout(float): The number of seconds to wait, or None to wait
+						until the response arrives.
+
+			Returns:
+				A tuple of the response's frame type (frames.REPLY, or
+				frames.ERROR if the command failed) and text, or None if
+				no response arrived in time.
+		"""
+
+		with self.replies_ready:
+			self.replies_ready.wait_for(lambda: self.replies.get(request_id) is not None
+						    or not self.joined, timeout)
+
+			return self.replies.pop(request_id, None)
 
 
 if __name__ == "__main__":
@@ -189,9 +662,42 @@ if __name__ == "__main__":
 	#: Add an argument to get the host port.
 	parser.add_argument('-p', '--port', type=int, help='The port the server is on.')
 
+	#: Add an argument to connect to a server on this machine over its Unix socket.
+	parser.add_argument('-u', '--unix', type=str, metavar='PATH',
+			    help='The path of the server\'s Unix socket, to connect locally.')
+
+	#: Add an argument to speak plain text, for servers without frames.
+	parser.add_argument('--text', action='store_true',
+			    help='Use the plain text protocol rather than frames.')
+
+	parser.add_argument('--no-compression', action='store_true',
+			    help='Do not ask the server to compress messages.')
+
+	#: Add arguments to encrypt the connection.
+	parser.add_argument('--tls', action='store_true',
+			    help='Encrypt the connection with TLS.')
+
+	parser.add_argument('--tls-ca', type=str, metavar='PATH',
+			    help='Trust the server certificate(s) in this file, eg a self-signed '
+				 'certificate. Implies --tls.')
+
+	#: Add arguments to choose where the scrollback is kept.
+	parser.add_argument('--scrollback', type=str, metavar='PATH',
+			    help='Keep older messages in this file, rather than a temporary one. It is replaced if it exists.')
+
+	parser.add_argument('--scrollback-memory', type=int, default=256, metavar='KB',
+			    help='The most message text kept in memory, in KB (Default: 256).')
+
 	#: Parse the arguments
 	args = parser.parse_args()
 
+	scrollback = Scrollback(args.scrollback, args.scrollback_memory * 1024)
+
+	if args.unix is not None:
+		client = chatroomClient(not args.text, not args.no_compression, scrollback=scrollback)
+		client.join(args.unix)
+		sys.exit()
+
 	#: Get the information passed by the argument parser and store it.
 	if args.server is None:
 		server = str(input("Please enter the IP address to connect to: "))
@@ -210,5 +716,7 @@ if __name__ == "__main__":
 	else:
 		port = int(port)
 
-	client = chatroomClient()
+	tls_context = tls.client_context(args.tls_ca) if args.tls or args.tls_ca is not None else None
+
+	client = chatroomClient(not args.text, not args.no_compression, tls_context, scrollback=scrollback)
 	client.join(server, port)
@@ -1,2 +1,4 @@
 from .command_controller import client_command_list
 from .command_controller import server_command_list
+from .registry import Command
+from .registry import CommandRegistry
@@ -19,60 +19,59 @@
 		address(str): The IP address of the client..
 		command_args(list): A list of the arguments passed with the command.
 
-	The docstring for any defined command here must have 2 parts:
-		1) A description for what the command will do.
-		2) "Permission_level = " and a number defining the minimum permission
-		    level needed to run the command.
+	Each command is registered with the @client_registry.command decorator,
+	which is passed the minimum permission level needed to run the command.
+	A command that may be slow (eg one that rewrites files) should also be
+	passed blocking=True, so that it is run by the server's worker pool
+	rather than holding up the client's thread.
+
+	The docstring for any defined command here should describe what the
+	command will do.
 
 	Finally, The /command command will show the client all available commands.
 	Further, the docstring of each function will also be shown to the user, so
 	that they have a better understanding of what each function does.
 """
 
+from .registry import client_registry
+
+#: Allow this to be run as a module, or py file.
+try:
+	from protocol import frames
+except ImportError:
+	from chatroom.protocol import frames
+
+#: The number of users on each page of /user_list.
+USER_LIST_PAGE_SIZE = 20
+
+#: The most users, and bytes of usernames, sent at once by /user_list
+#: subscribe and /user_list after, which must fit in a frame.
+USER_LIST_CHUNK_SIZE = 1000
+USER_LIST_CHUNK_BYTES = 64 * 1024
+
+@client_registry.command(permission=0)
 def quit(server_object, client, address, command_args):
 	"""
 		Closes the connection to the chatroom.
-
-		Permission_level = 0
 	"""
 
 	#: Close the server's connection to the client.
 	server_object.close_client(client, address, "quit command")
 
+@client_registry.command(permission=0)
 def commands(server_object, client, address, command_args):
 	"""
 		Lists out all of the commands for the client.
-
-		Permission_level = 0
 	"""
 
-	#: Import inspect so that we can get the docstring.
-	import inspect
-
-	msg = ""
-
-	#: Create a formatted string of all the commands, and what they do.
-	for command in server_object.client_command_list.keys():
-
-		msg += "\n/" + command + " - "
-
-		#: Get the docstring
-		docstring = inspect.getdoc(server_object.client_command_list[command][0])
-
-		#: Ignore the portion containing the permission level.
-		docstring = docstring[:docstring.index("Permission_level")]
-
-		msg += docstring.strip()
-		msg += "\n"
-
-	client.send(msg.encode())
+	#: The list is built once, and cached until a command is added.
+	server_object.reply(client, server_object.client_command_list.help_payload())
 
+@client_registry.command(permission=2, blocking=True)
 def promote_user(server_object, client, address, command_args):
 	"""
 		Changes the permissions of the passed user to the passed permission level.
 		eg) /promote_user Bob admin
-
-		Permission_level = 2
 	"""
 
 	#: Get the information for who's changing the permission of whose client,
@@ -98,22 +97,21 @@ def promote_user(server_object, client, address, command_args):
 
 	#: If the code is -1, then an invalid permission type was passed.
 	if code == -1:
-		client.send("{} is not a valid permission type.".format(new_permission).encode())
+		server_object.reply(client, "{} is not a valid permission type.".format(new_permission))
 
 	#: If the code is 0, then the user was already that permission level
 	elif code == 0:
-		client.send("{} is already {}".format(changee, new_permission).encode())
+		server_object.reply(client, "{} is already {}".format(changee, new_permission))
 
 	#: Otherwise no error was encountered, and the user's permission was changed.
 	else:
-		client.send("{}'s permission has been updated".format(changee).encode())
+		server_object.reply(client, "{}'s permission has been updated".format(changee))
 
+@client_registry.command(permission=1)
 def permissions(server_object, client, address, command_args):
 	"""
 		Gets the permission level for the passed user.
 		Eg) /permissions Bob
-
-		Permission_level = 1
 	"""
 
 	usr = command_args[1]
@@ -122,19 +120,178 @@ def permissions(server_object, client, address, command_args):
 	permission_level = server_object.permissions[server_object.get_ip(usr)].permission
 
 	#: Send that permission level to the caller.
-	client.send(permission_level.encode())
+	server_object.reply(client, permission_level)
 
+@client_registry.command(permission=0)
 def user_list(server_object, client, address, command_args):
 	"""
-		Gets a list of all of the active users in the server.
+		Gets a page of the active users in the server, optionally only
+		those whose names start with the passed text. Use subscribe to
+		be sent each change to the list, along with the first users.
+		The rest are got with after, starting after the last user got.
+		Both reply with the number of users left, then a line per user.
+		eg) /user_list 2
+		eg) /user_list 1 bo
+		eg) /user_list subscribe
+		eg) /user_list after Bob
+	"""
+
+	if len(command_args) > 1 and command_args[1] in ("subscribe", "unsubscribe", "after"):
+
+		if command_args[1] != "after":
+			session = server_object.sessions[client]
+
+			#: Subscribe before getting the list, so that no change is missed.
+			#: A change that is already in the list does no harm.
+			session.subscribed = command_args[1] == "subscribe"
+
+			if not session.subscribed:
+				server_object.reply(client, "Unsubscribed from changes to the user list.")
+				return
+
+		#: Usernames may have spaces, which the command was split on.
+		names, remaining = server_object.usernames.after(" ".join(command_args[2:]), USER_LIST_CHUNK_SIZE)
+
+		#: Leave the rest for the next request, rather than sending more
+		#: than fits in a frame.
+		size = 0
+		for i, name in enumerate(names):
+			size += len(name.encode()) + 1
+
+			if size > USER_LIST_CHUNK_BYTES and i != 0:
+				remaining += len(names) - i
+				names = names[:i]
+				break
 
-		Permission_level = 0
+		server_object.reply(client, "\n".join([str(remaining)] + names))
+		return
+
+	page = int(command_args[1]) if len(command_args) > 1 else 1
+	prefix = command_args[2] if len(command_args) > 2 else ""
+
+	names, total = server_object.usernames.page(page, USER_LIST_PAGE_SIZE, prefix)
+	pages = max(1, -(-total // USER_LIST_PAGE_SIZE))
+
+	if len(names) == 0:
+		server_object.reply(client, "There is no page {} of users, there are {} pages.".format(page, pages),
+				    frames.ERROR)
+		return
+
+	server_object.reply(client, "Users (page {} of {}):\n{}".format(page, pages, "\n".join(names)))
+
+@client_registry.command(permission=0)
+def history(server_object, client, address, command_args):
+	"""
+		Shows the most recent messages sent to the room.
+		eg) /history 20
 	"""
 
-	msg = ""
+	#: Default to the last 20 messages.
+	count = 20
+	if len(command_args) > 1:
+		count = int(command_args[1])
+
+	messages = list(server_object.history)[-count:] if count > 0 else []
+
+	if len(messages) == 0:
+		server_object.reply(client, "No messages have been sent yet.")
+		return
+
+	server_object.reply(client, "\n".join(message for message, _ in messages))
+
+@client_registry.command(permission=0)
+def token(server_object, client, address, command_args):
+	"""
+		Gets a token that can be used to reclaim your username after
+		reconnecting. Enter /resume [token] when asked for a username.
+	"""
+
+	server_object.reply(client, server_object.get_resume_token(server_object.usrs[address]))
+
+@client_registry.command(permission=0)
+def msg(server_object, client, address, command_args):
+	"""
+		Sends a message that only the passed user will see. If they
+		are not online, they will get it when they next connect.
+		eg) /msg Bob hello
+	"""
+
+	username = command_args[1]
+	text = " ".join(command_args[2:])
+
+	if len(text) == 0:
+		server_object.reply(client, "There is no message to send to {}.".format(username), frames.ERROR)
+		return
+
+	#: The message goes straight to the user, so only tell the sender
+	#: whether it arrived.
+	code = server_object.direct_message(client, address, username, text)
+
+	if code == 1:
+		server_object.reply(client, "Message sent to {}.".format(username))
+	elif code == 0:
+		server_object.reply(client, "{} is not online, so they will get your message when they next connect."
+				    .format(username))
+	elif code == -2:
+		server_object.reply(client, "{} can't be sent messages.".format(username), frames.ERROR)
+	else:
+		server_object.reply(client, "{} is not online, and no more messages can be kept for them right now."
+				    .format(username), frames.ERROR)
+
+@client_registry.command(permission=0)
+def upload(server_object, client, address, command_args):
+	"""
+		Starts sharing a file with the room. The client is given a ticket,
+		and sends the file over a separate connection.
+		eg) /upload notes.txt 2048
+	"""
+
+	if len(command_args) < 3 or not command_args[-1].isdigit():
+		server_object.reply(client, "The file's name and size are needed, eg /upload notes.txt 2048.",
+				    frames.ERROR)
+		return
+
+	if not server_object.transfers.running:
+		server_object.reply(client, "This server does not accept files.", frames.ERROR)
+		return
+
+	#: The name may have spaces in it, but the size is always last.
+	name = " ".join(command_args[1:-1])
+	owner = server_object.usrs.get(address, address)
+
+	try:
+		ticket = server_object.transfers.expect_upload(name, int(command_args[-1]), owner)
+	except ValueError as e:
+		server_object.reply(client, str(e), frames.ERROR)
+		return
+
+	server_object.reply(client, "upload {} {}".format(ticket, server_object.transfers.port))
+
+@client_registry.command(permission=0)
+def download(server_object, client, address, command_args):
+	"""
+		Gets a file that was shared with the room. The client is given a
+		ticket, and gets the file over a separate connection. Without a file
+		id, lists the shared files.
+		eg) /download
+		eg) /download 3
+	"""
+
+	spool = server_object.spool
+
+	if len(command_args) < 2:
+		files = ["{}: {} ({} bytes, from {})".format(spooled.id, spooled.name, spooled.size, spooled.owner)
+			 for spooled in list(spool.files.values())]
+
+		server_object.reply(client, "\n".join(files) if len(files) != 0 else "No files have been shared.")
+		return
+
+	spooled = spool.get(int(command_args[1])) if command_args[1].isdigit() else None
 
-	#: Create a formatted string of all the users.
-	for usr in server_object.usrs.values():
-		msg += usr + '\n'
+	if spooled is None or not server_object.transfers.running:
+		server_object.reply(client, "There is no file {}.".format(command_args[1]), frames.ERROR)
+		return
 
-	client.send(msg.encode())
+	ticket = server_object.transfers.expect_download(spooled.id)
+	server_object.reply(client, "download {} {} {} {}".format(ticket, server_object.transfers.port,
+								 spooled.size, spooled.name))
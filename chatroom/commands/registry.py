@@ -0,0 +1,185 @@
+""" PURPOSE:
+
+	Registries of the commands that clients and the server console can
+	run. Commands are added with the command decorator, eg
+
+		@client_registry.command(permission=1)
+		def permissions(server_object, client, address, command_args):
+			\""" Gets the permission level for the passed user. \"""
+
+	Each command's help text is worked out once, when it is registered.
+
+   PLUGINS:
+
+	Modules of commands are added with add_plugin, and are only imported
+	once one of their commands is needed, so that adding commands does
+	not slow down starting the server. A plugin that names its commands
+	is only imported when one of those commands is run. Otherwise, it is
+	imported the first time any command is looked up.
+"""
+
+import collections
+import importlib
+import inspect
+import threading
+
+#: A registered command. The order of the first three fields matches the
+#: tuples that command lists used to hold.
+Command = collections.namedtuple("Command", ["func", "permission", "blocking", "name", "help"])
+
+class CommandRegistry:
+	""" CLASS DEFINITION
+
+		A mapping of command names to Commands.
+
+	"""
+
+	def __init__(self):
+		""" Creates an empty registry. """
+
+		self._commands = {}
+
+		#: Plugins that have not been imported yet, as (module, names).
+		self._plugins = []
+
+		#: Importing a plugin registers its commands, so this is reentrant.
+		self._lock = threading.RLock()
+
+		#: The encoded /commands reply, which is rebuilt when a command is added.
+		self._help = None
+
+	def command(self, name: str = None, permission: int = 0, blocking: bool = False):
+		""" self.command(str, int, bool)
+
+			A decorator that registers a function as a command.
+
+			Args:
+				name(str): The command's name. Defaults to the function's name.
+				permission(int): The minimum permission level needed to run
+						 the command.
+				blocking(bool): If True then the command may be slow (eg it
+						rewrites files), and is run by the server's
+						worker pool rather than the client's thread.
+
+			Returns:
+				The decorator, which returns the function unchanged.
+		"""
+
+		def register(func):
+			self.register(func, name, permission, blocking)
+			return func
+
+		return register
+
+	def register(self, func, name: str = None, permission: int = 0, blocking: bool = False):
+		""" self.register(function, str, int, bool)
+
+			Registers a function as a command. See self.command.
+		"""
+
+		name = name or func.__name__
+
+		#: Work out the help text now, rather than every time it is shown.
+		docstring = inspect.getdoc(func) or ""
+
+		with self._lock:
+			self._commands[name] = Command(func, permission, blocking, name, docstring.strip())
+			self._help = None
+
+	def add_plugin(self, module: str, names: list = None):
+		""" self.add_plugin(str, list)
+
+			Adds a module of commands, to be imported when it is needed.
+
+			Args:
+				module(str): The module's name, relative to this package
+					     (eg ".client_commands") or absolute.
+				names(list): The names of the commands in the module, if
+					     known. If given, the module is only imported
+					     when one of them is run.
+		"""
+
+		with self._lock:
+			self._plugins.append((module, set(names) if names is not None else None))
+			self._help = None
+
+	def _load(self, name: str = None):
+		""" self._load(str)
+
+			Imports the plugins that may hold the command name, or every
+			plugin if name is None.
+		"""
+
+		with self._lock:
+			for plugin in list(self._plugins):
+				module, names = plugin
+
+				if name is None or names is None or name in names:
+					self._plugins.remove(plugin)
+					importlib.import_module(module, __package__)
+
+	def get(self, name: str, default=None):
+		""" self.get(str, Command)
+
+			Gets a command, importing its plugin if it has not been yet.
+
+			Returns:
+				The Command, or default if there is no such command.
+		"""
+
+		command = self._commands.get(name)
+
+		if command is None and len(self._plugins) != 0:
+			self._load(name)
+			command = self._commands.get(name)
+
+		return command if command is not None else default
+
+	def help_payload(self):
+		""" self.help_payload()
+
+			Returns the UTF-8 encoded text listing every command and what it
+			does. This is cached until a command or plugin is added.
+		"""
+
+		payload = self._help
+
+		if payload is None:
+			with self._lock:
+				self._load()
+
+				commands = sorted(self._commands.values(), key=lambda command: command.name)
+				payload = "".join("\n/{} - {}\n".format(command.name, command.help)
+						  for command in commands).encode()
+				self._help = payload
+
+		return payload
+
+	def keys(self):
+		""" Returns the name of every command. """
+
+		self._load()
+		return self._commands.keys()
+
+	def __contains__(self, name: str):
+		return self.get(name) is not None
+
+	def __getitem__(self, name: str):
+		command = self.get(name)
+
+		if command is None:
+			raise KeyError(name)
+
+		return command
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+#: The commands that clients can run, eg /quit.
+client_registry = CommandRegistry()
+
+#: The commands that can be run from the server's console, eg stop.
+server_registry = CommandRegistry()
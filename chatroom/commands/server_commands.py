@@ -17,10 +17,16 @@
 					access to things in the server.
 		command_args(list): A list of the arguments passed with the command.
 
+	Each command is registered with the @server_registry.command decorator.
+
 	Finally, The /help command will show all available commands.
 	Further, the docstring of each function will also be shown to the user, so
 	that they have a better understanding of what each function does.
 """
+
+from .registry import server_registry
+
+@server_registry.command()
 def stop(server_object, command_args):
 	""" Stops the server. """
 
@@ -31,6 +37,7 @@ def stop(server_object, command_args):
 	#: Exit.
 	#os._exit(0)
 
+@server_registry.command()
 def change_permission(server_object, command_args):
 	"""
 		Changes the permissions of a specified user to a specified permission level.
@@ -54,12 +61,14 @@ def change_permission(server_object, command_args):
 	else:
 		print("{} is an invalid permission type.".format(new_permissions))
 
+@server_registry.command()
 def cp(server_object, command_args):
 	"""
 		Shortcut for change_permission command.
 	"""
 	change_permission(server_object, command_args)
 
+@server_registry.command()
 def say(server_object, command_args):
 	"""
 		Sends a message to the server
@@ -70,3 +79,214 @@ def say(server_object, command_args):
 
 	#: Send the message.
 	server_object.send_all(msg)
+
+@server_registry.command()
+def rate_limit(server_object, command_args):
+	"""
+		Changes how quickly clients may send messages or commands.
+		eg) rate_limit message 2 5
+		eg) rate_limit command 10 20 ip
+	"""
+
+	kind = command_args[1]
+	rate = float(command_args[2])
+	burst = int(command_args[3])
+
+	#: If "ip" is passed, change the limit shared by each IP address.
+	per_ip = len(command_args) > 4 and command_args[4] == "ip"
+
+	code = server_object.set_rate_limit(kind, rate, burst, per_ip)
+
+	if code == 1:
+		print("Successfully changed the {} rate limit.".format(kind))
+	else:
+		print("{} is an invalid kind of traffic.".format(kind))
+
+@server_registry.command()
+def upgrade(server_object, command_args):
+	"""
+		Hands the server over to a new server, then exits. The new server
+		must already be started with --inherit [path]. If the handoff
+		fails, then this server carries on with its clients.
+		Pass "listener" to only hand over new connections, and keep the
+		current clients here until they leave.
+		eg) upgrade /tmp/chatroom.sock
+		eg) upgrade /tmp/chatroom.sock listener
+	"""
+
+	import os
+
+	include_clients = not (len(command_args) > 2 and command_args[2] == "listener")
+
+	if not server_object.upgrade(command_args[1], include_clients):
+		print("Handoff to {} failed, still serving.".format(command_args[1]))
+		return
+
+	#: Exit without waiting for the threads, which are still blocked
+	#: on the sockets that were handed over.
+	os._exit(0)
+
+@server_registry.command()
+def workers(server_object, command_args):
+	"""
+		Shows how busy the pool that runs blocking client commands is.
+	"""
+
+	pool = server_object.command_pool
+
+	print("{} commands waiting (of {}), {} running on {} workers.".format(
+		pool.depth, pool.max_queue, pool.active, pool.workers))
+
+@server_registry.command()
+def lanes(server_object, command_args):
+	"""
+		Shows how long messages to clients have waited in each priority
+		lane (control, direct and chat) before being sent.
+	"""
+
+	for name, (count, average, longest) in server_object.lane_metrics.summary().items():
+		print("{}: {} sent, {:.3f}s average wait, {:.3f}s longest.".format(
+			name, count, average, longest))
+
+@server_registry.command()
+def lag(server_object, command_args):
+	"""
+		Shows how far behind each client is, as the bytes queued for it and
+		how long the oldest of them has waited.
+	"""
+
+	for client, address in list(server_object.clientlist):
+		session = server_object.sessions.get(client)
+
+		if session is None:
+			continue
+
+		queued, age = session.lag()
+
+		print("{} ({}): {} bytes queued, oldest {:.1f}s, {}.".format(
+			server_object.usrs.get(address, "[NO USERNAME]"), address, queued, age,
+			server_object.lag_policy.STATES[session.lag_state]))
+
+@server_registry.command()
+def memory(server_object, command_args):
+	"""
+		Shows the estimated memory held by the server, and the load shed to
+		keep it within the budget.
+	"""
+
+	summary = server_object.memory_budget.summary()
+
+	print("{} of {} bytes, at the {} stage.".format(
+		sum(summary["usage"].values()), summary["limit"], summary["stage"]))
+
+	for kind, size in summary["usage"].items():
+		print("  {}: {} bytes".format(kind, size))
+
+	print("Stages entered: {}".format(", ".join("{} {}".format(stage, count)
+						   for stage, count in summary["entered"].items())))
+	print("Shed: {}".format(", ".join("{} {}".format(kind, count)
+					  for kind, count in summary["shed"].items())))
+
+@server_registry.command()
+def admission(server_object, command_args):
+	"""
+		Shows the number of sessions, the limits on new connections, and how
+		many connections have been refused.
+	"""
+
+	control = server_object.admission
+
+	print("{} sessions (of {}), at most {} per address, accepting {}/s.".format(
+		control.total, control.max_sessions, control.max_per_address, control.accepts.rate))
+	print("Refused: {}".format(", ".join("{} {}".format(reason, count)
+					     for reason, count in control.refused.items())))
+
+	if len(control.denied) != 0:
+		print("Denied: {}".format(", ".join(sorted(control.denied))))
+
+@server_registry.command()
+def deny(server_object, command_args):
+	"""
+		Refuses all future connections from an IP address, without reading
+		any permission files. Connected clients are not removed.
+		eg) deny 10.0.0.5
+	"""
+
+	if len(command_args) < 2:
+		print("An address is needed, eg deny 10.0.0.5")
+		return
+
+	server_object.admission.deny(command_args[1])
+	print("Refusing connections from {}.".format(command_args[1]))
+
+@server_registry.command()
+def allow(server_object, command_args):
+	"""
+		Stops refusing connections from an IP address that was denied.
+		eg) allow 10.0.0.5
+	"""
+
+	if len(command_args) < 2:
+		print("An address is needed, eg allow 10.0.0.5")
+		return
+
+	if server_object.admission.allow(command_args[1]):
+		print("Accepting connections from {}.".format(command_args[1]))
+	else:
+		print("{} was not denied.".format(command_args[1]))
+
+@server_registry.command()
+def filters(server_object, command_args):
+	"""
+		Shows how long each moderation filter takes, and how many messages it
+		has blocked. Pass "reload" to reload the rules, optionally from
+		another file.
+		eg) filters
+		eg) filters reload
+		eg) filters reload /etc/chatroom/filters.rules
+	"""
+
+	if len(command_args) > 1 and command_args[1] == "reload":
+		server_object.load_filters(command_args[2] if len(command_args) > 2 else None)
+		return
+
+	names = [message_filter.name for message_filter in server_object.filters.filters]
+	print("Filters: {}".format(", ".join(names) if len(names) != 0 else "[NONE]"))
+
+	for name, (count, average, longest, blocked) in server_object.filters.summary().items():
+		print("{}: {} checked, {} blocked, {:.1f}us average, {:.1f}us longest.".format(
+			name, count, blocked, average * 1e6, longest * 1e6))
+
+@server_registry.command()
+def capture(server_object, command_args):
+	"""
+		Starts recording the messages that clients send to a file, so that
+		they can be replayed later, or stops recording.
+		eg) capture /tmp/afternoon.capture
+		eg) capture stop
+	"""
+
+	if len(command_args) < 2:
+		if server_object.capture is None:
+			print("Not capturing. Pass a file to start, eg capture /tmp/afternoon.capture")
+		else:
+			print("Capturing to {}, {} messages so far.".format(server_object.capture.path,
+									   server_object.capture.count))
+		return
+
+	if command_args[1] == "stop":
+		count = server_object.stop_capture()
+
+		if count is None:
+			print("Not capturing.")
+		else:
+			print("Stopped capturing, after {} messages.".format(count))
+		return
+
+	try:
+		server_object.start_capture(command_args[1])
+	except OSError as e:
+		print("Could not capture to {}: {}".format(command_args[1], e))
+		return
+
+	print("Capturing to {}.".format(command_args[1]))
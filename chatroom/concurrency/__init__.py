@@ -0,0 +1,4 @@
+from .sharded import Shards
+from .sharded import ShardedDict
+from .sharded import SHARDS
+from .lane_queue import LaneQueue
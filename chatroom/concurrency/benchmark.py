@@ -0,0 +1,162 @@
+""" PURPOSE:
+
+	Measures how the server scales with the clients' threads running at
+	once, so that builds of Python with and without the GIL can be
+	compared.
+
+	A capture is built of [clients] users joining, then each sending
+	[messages] chat messages all at once, and it is replayed as fast as
+	possible (see capture.replay). Every client's thread on the server
+	reads, checks and broadcasts its messages at the same time.
+
+   USAGE:
+
+	python -m chatroom.concurrency.benchmark --clients 32 --messages 200
+
+	To compare builds, pass each interpreter with --python. The benchmark
+	is run once with each, and the results are shown side by side.
+
+	python -m chatroom.concurrency.benchmark --python python3.13 --python python3.13t
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tempfile
+
+#: Allow this to be run as a module, or py file.
+try:
+	from capture import CaptureWriter, replay_capture
+	from protocol import frames
+except ImportError:
+	from chatroom.capture import CaptureWriter, replay_capture
+	from chatroom.protocol import frames
+
+def build_name():
+	""" build_name()
+
+		Returns the kind of build running, eg "free-threaded (GIL disabled)".
+	"""
+
+	if not sysconfig.get_config_var("Py_GIL_DISABLED"):
+		return "GIL"
+
+	#: A free-threaded build can still turn the GIL on, eg with PYTHON_GIL=1.
+	if sys._is_gil_enabled():
+		return "free-threaded (GIL enabled)"
+
+	return "free-threaded (GIL disabled)"
+
+def run_benchmark(clients: int = 16, messages: int = 200):
+	""" run_benchmark(int, int)
+
+		Runs the benchmark with this interpreter.
+
+		Args:
+			clients(int): The number of clients.
+			messages(int): The number of chat messages each client sends.
+
+		Returns:
+			A dictionary of the results.
+	"""
+
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory, "benchmark.capture")
+
+	#: Give every client a second to join before the chat starts, so that
+	#: they all recieve all of it. The wait is not counted in the results.
+	writer = CaptureWriter(path)
+
+	for session in range(1, clients + 1):
+		writer.record(session, frames.CHAT, "bench{}".format(session), at=0)
+
+	for i in range(messages):
+		for session in range(1, clients + 1):
+			writer.record(session, frames.CHAT, "message {} from {}".format(i, session), at=1)
+
+	writer.close()
+
+	try:
+		report = replay_capture(path, speed=1.0, settle=0.5)
+	finally:
+		shutil.rmtree(directory, ignore_errors=True)
+
+	return {
+		"python": platform.python_version(),
+		"build": build_name(),
+		"cpus": os.cpu_count(),
+		"clients": clients,
+		"messages": report.chat,
+		"delivered": report.delivered,
+		"seconds": report.duration,
+		"throughput": report.throughput,
+		"p50": report.percentile(50),
+		"p99": report.percentile(99)
+	}
+
+def format_results(results: list):
+	""" format_results(list)
+
+		Returns the results of one or more runs as a table, one line per run.
+	"""
+
+	lines = ["{:<10} {:<30} {:>10} {:>10} {:>14} {:>10} {:>10}".format(
+		"Python", "Build", "Delivered", "Seconds", "Delivered/s", "p50 ms", "p99 ms")]
+
+	for result in results:
+		lines.append("{:<10} {:<30} {:>10} {:>10.2f} {:>14.1f} {:>10} {:>10}".format(
+			result["python"], result["build"], result["delivered"], result["seconds"], result["throughput"],
+			*("{:.2f}".format(result[key] * 1000) if result[key] is not None else "-" for key in ("p50", "p99"))))
+
+	return lines
+
+if __name__ == "__main__":
+
+	#: Create an argument parser to parse the arguments.
+	parser = argparse.ArgumentParser(description="Measures how the server scales across threads, to compare builds of Python with and without the GIL.")
+
+	parser.add_argument('--clients', type=int, default=16,
+			     help='The number of clients sending at once (Default: 16).')
+
+	parser.add_argument('--messages', type=int, default=200,
+			     help='The number of messages each client sends (Default: 200).')
+
+	parser.add_argument('--python', type=str, action='append', metavar='EXECUTABLE',
+			     help='Run the benchmark with this interpreter. Pass more than once to compare them.')
+
+	parser.add_argument('--json', action='store_true',
+			     help='Print the results as JSON.')
+
+	args = parser.parse_args()
+
+	if args.python is None:
+		results = [run_benchmark(args.clients, args.messages)]
+
+	else:
+
+		#: Run each interpreter from the directory holding the chatroom
+		#: package, so that it can import it.
+		root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+		results = []
+
+		for executable in args.python:
+			completed = subprocess.run([executable, "-m", "chatroom.concurrency.benchmark", "--json",
+						    "--clients", str(args.clients), "--messages", str(args.messages)],
+						   cwd=root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+			if completed.returncode != 0:
+				parser.error("The benchmark failed with {}.".format(executable))
+
+			#: The server prints as it runs, so the results are the last line.
+			results += json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+	if args.json:
+		print(json.dumps(results))
+	else:
+		for line in format_results(results):
+			print(line)
@@ -0,0 +1,123 @@
+""" PURPOSE:
+
+	A queue whose items are split into lanes by priority, for state that
+	many threads add to while another takes from it (eg the messages
+	waiting to be broadcast).
+
+	Each lane is a deque, so taking the next item never has to search
+	past lower priority items, and throwing away a whole lane doesn't
+	have to search the others. Both stay quick however large the queue
+	grows.
+"""
+
+import collections
+import threading
+
+class LaneQueue:
+	""" CLASS DEFINITION
+
+		Items split into lanes. Items are taken from the first lane that
+		has any, in the order they were added to it. Every method may be
+		called from any thread.
+
+	"""
+
+	def __init__(self, lane_for, lanes: int):
+		""" self.__init__(function, int)
+
+			Args:
+				lane_for(function): Called with an item, and returns the
+						    number of its lane. Lane 0 goes first.
+				lanes(int): The number of lanes.
+		"""
+
+		self.lane_for = lane_for
+		self._lanes = [collections.deque() for _ in range(lanes)]
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return sum(len(lane) for lane in self._lanes)
+
+	def __iter__(self):
+		""" Iterates over a copy of the items, in the order they would be taken. """
+		return iter(self.items())
+
+	def __eq__(self, other):
+		return self.items() == list(other)
+
+	def __repr__(self):
+		return "LaneQueue({!r})".format(self.items())
+
+	def append(self, item):
+		""" Adds an item to the end of its lane. """
+
+		lane = self._lanes[self.lane_for(item)]
+
+		with self._lock:
+			lane.append(item)
+
+	def pop(self):
+		""" Removes and returns the next item, or None if there are none. """
+
+		with self._lock:
+			for lane in self._lanes:
+				if len(lane) != 0:
+					return lane.popleft()
+
+		return None
+
+	def requeue(self, items: list):
+		""" self.requeue(list)
+
+			Puts items back at the front of their lanes, eg ones taken by
+			self.drain that could not be used. Their order is kept.
+		"""
+
+		with self._lock:
+			for item in reversed(items):
+				self._lanes[self.lane_for(item)].appendleft(item)
+
+	def drop(self, lane: int):
+		""" self.drop(int)
+
+			Throws away every item in a lane.
+
+			Returns:
+				The number of items thrown away.
+		"""
+
+		with self._lock:
+			dropped = len(self._lanes[lane])
+			self._lanes[lane].clear()
+
+		return dropped
+
+	def drain(self):
+		""" Removes and returns every item, in the order they would be taken. """
+
+		with self._lock:
+			items = [item for lane in self._lanes for item in lane]
+
+			for lane in self._lanes:
+				lane.clear()
+
+		return items
+
+	def replace(self, items: list):
+		""" Replaces every item with items. """
+
+		with self._lock:
+			for lane in self._lanes:
+				lane.clear()
+
+			for item in items:
+				self._lanes[self.lane_for(item)].append(item)
+
+	def clear(self):
+		self.replace([])
+
+	def items(self):
+		""" Returns a copy of the items, in the order they would be taken. """
+
+		with self._lock:
+			return [item for lane in self._lanes for item in lane]
@@ -0,0 +1,155 @@
+""" PURPOSE:
+
+	Structures for state that many threads change at once. On builds of
+	Python without the GIL, threads really do run in parallel, so a single
+	lock (or a single dict, which has its own internal lock on those
+	builds) shared by every client's thread is where they queue up.
+
+	Shards split the state into several parts, each with its own lock, so
+	threads only wait for each other when they use the same part. A thread
+	picks its part either by key (eg ShardedDict), or by its own thread id,
+	for state that is only ever added up (eg counters).
+"""
+
+import threading
+
+#: The number of shards used by default.
+SHARDS = 16
+
+class Shards:
+	""" CLASS DEFINITION
+
+		A fixed number of values, each with its own lock.
+
+	"""
+
+	def __init__(self, factory, count: int = SHARDS):
+		""" self.__init__(function, int)
+
+			Args:
+				factory(function): Called with no arguments to create each
+						   shard's value.
+				count(int): The number of shards.
+		"""
+
+		self.values = [factory() for _ in range(count)]
+		self.locks = [threading.Lock() for _ in range(count)]
+
+	def __len__(self):
+		return len(self.values)
+
+	def __iter__(self):
+		""" Yields each shard's (lock, value). """
+		return iter(list(zip(self.locks, self.values)))
+
+	def for_key(self, key):
+		""" Returns the (lock, value) of the shard that key belongs to. """
+
+		index = hash(key) % len(self.values)
+		return self.locks[index], self.values[index]
+
+	def for_thread(self):
+		""" Returns the (lock, value) of the shard the calling thread uses. """
+
+		#: Native ids are handed out in order, so they spread evenly across
+		#: the shards, unlike threading.get_ident, which is an address.
+		index = threading.get_native_id() % len(self.values)
+		return self.locks[index], self.values[index]
+
+class ShardedDict:
+	""" CLASS DEFINITION
+
+		A dictionary split into shards by key. It has the parts of the dict
+		interface that the server uses.
+
+		Getting, setting and removing a single key are each atomic. keys,
+		values and items return lists, so they can be iterated while other
+		threads change the dictionary. Each shard is copied at once, but
+		not every shard at the same moment.
+
+	"""
+
+	def __init__(self, items=None, shards: int = SHARDS):
+		""" self.__init__(dict, int)
+
+			Args:
+				items(dict): What to start the dictionary with.
+				shards(int): The number of shards.
+		"""
+
+		self.shards = Shards(dict, shards)
+
+		if items is not None:
+			for key, value in dict(items).items():
+				self[key] = value
+
+	#: Reading a single key needs no lock, as a dict's own reads are atomic
+	#: (on builds without the GIL, they don't even lock the dict).
+	def __getitem__(self, key):
+		return self.shards.for_key(key)[1][key]
+
+	def __setitem__(self, key, value):
+		lock, shard = self.shards.for_key(key)
+
+		with lock:
+			shard[key] = value
+
+	def __delitem__(self, key):
+		lock, shard = self.shards.for_key(key)
+
+		with lock:
+			del shard[key]
+
+	def __contains__(self, key):
+		return key in self.shards.for_key(key)[1]
+
+	def __len__(self):
+		return sum(len(shard) for shard in self.shards.values)
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __repr__(self):
+		return "ShardedDict({!r})".format(dict(self.items()))
+
+	def get(self, key, default=None):
+		return self.shards.for_key(key)[1].get(key, default)
+
+	def setdefault(self, key, default=None):
+		""" Returns key's value, first setting it to default if it has none. """
+
+		lock, shard = self.shards.for_key(key)
+
+		with lock:
+			return shard.setdefault(key, default)
+
+	def pop(self, key, *default):
+		""" Removes key, and returns its value (or default, if given). """
+
+		lock, shard = self.shards.for_key(key)
+
+		with lock:
+			return shard.pop(key, *default)
+
+	def clear(self):
+		for lock, shard in self.shards:
+			with lock:
+				shard.clear()
+
+	def keys(self):
+		return [key for shard in self._copies() for key in shard]
+
+	def values(self):
+		return [value for shard in self._copies() for value in shard.values()]
+
+	def items(self):
+		return [item for shard in self._copies() for item in shard.items()]
+
+	def _copies(self):
+		""" Yields a copy of each shard, taken while holding its lock. """
+
+		for lock, shard in self.shards:
+			with lock:
+				copy = shard.copy()
+
+			yield copy
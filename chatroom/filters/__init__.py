@@ -0,0 +1,6 @@
+from .keyword_automaton import KeywordAutomaton
+from .pipeline import FilterPipeline
+from .pipeline import KeywordFilter
+from .pipeline import RegexFilter
+from .pipeline import LinkFilter
+from .pipeline import load_rules
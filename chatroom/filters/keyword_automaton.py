@@ -0,0 +1,126 @@
+""" PURPOSE:
+
+	An Aho-Corasick automaton, which finds any of a list of keywords in a
+	message with a single pass over the message, no matter how many
+	keywords there are.
+
+	Keywords are matched regardless of case. By default, a keyword only
+	matches a whole word, so that eg "ass" does not match "class".
+"""
+
+import collections
+
+class KeywordAutomaton:
+	""" CLASS DEFINITION
+
+		A compiled list of keywords.
+
+	"""
+
+	def __init__(self, keywords: list, whole_words: bool = True):
+		""" self.__init__(list, bool)
+
+			Compiles the keywords.
+
+			Args:
+				keywords(list): The keywords to find.
+				whole_words(bool): If True then keywords are only found when
+						   they are not part of a longer word.
+		"""
+
+		self.whole_words = whole_words
+
+		#: The trie, as a list of states. Each state has its transitions,
+		#: the state to fall back to when no transition matches, and the
+		#: keywords that end at it.
+		self._goto = [{}]
+		self._fail = [0]
+		self._output = [[]]
+
+		for keyword in keywords:
+			keyword = keyword.strip().lower()
+
+			if len(keyword) != 0:
+				self._add(keyword)
+
+		self._link()
+
+	def _add(self, keyword: str):
+		""" Adds a keyword to the trie. """
+
+		state = 0
+
+		for char in keyword:
+			if char not in self._goto[state]:
+				self._goto.append({})
+				self._fail.append(0)
+				self._output.append([])
+				self._goto[state][char] = len(self._goto) - 1
+
+			state = self._goto[state][char]
+
+		self._output[state].append(keyword)
+
+	def _link(self):
+		""" Works out each state's fall back state, breadth first. """
+
+		queue = collections.deque(self._goto[0].values())
+
+		while len(queue) != 0:
+			state = queue.popleft()
+
+			for char, child in self._goto[state].items():
+				queue.append(child)
+
+				#: Fall back to the longest suffix that is also in the trie.
+				fallback = self._fail[state]
+				while fallback != 0 and char not in self._goto[fallback]:
+					fallback = self._fail[fallback]
+
+				self._fail[child] = self._goto[fallback].get(char, 0)
+				self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+	def search(self, text: str):
+		""" self.search(str)
+
+			Finds the first keyword in text.
+
+			Returns:
+				The keyword, or None if there are none.
+		"""
+
+		for keyword, _ in self.finditer(text):
+			return keyword
+
+		return None
+
+	def finditer(self, text: str):
+		""" self.finditer(str)
+
+			Finds every keyword in text.
+
+			Yields:
+				(keyword, index) for each keyword found, where index is the
+				index in the lowercased text that the keyword starts at.
+		"""
+
+		lowered = text.lower()
+		state = 0
+
+		for end, char in enumerate(lowered):
+			while state != 0 and char not in self._goto[state]:
+				state = self._fail[state]
+
+			state = self._goto[state].get(char, 0)
+
+			for keyword in self._output[state]:
+				start = end - len(keyword) + 1
+
+				if not self.whole_words or (self._boundary(lowered, start - 1) and self._boundary(lowered, end + 1)):
+					yield keyword, start
+
+	@staticmethod
+	def _boundary(text: str, index: int):
+		""" Returns True if index is outside text, or is not part of a word. """
+
+		return index < 0 or index >= len(text) or not text[index].isalnum()
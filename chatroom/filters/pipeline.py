@@ -0,0 +1,312 @@
+""" PURPOSE:
+
+	Checks each chat message against the server's moderation rules, before
+	it is broadcast. Rules are compiled when they are loaded, so that
+	checking a message costs one pass for every keyword, and one regex
+	search for every pattern:
+
+		KeywordFilter	Banned words, compiled into a KeywordAutomaton.
+		RegexFilter	Patterns, compiled into a single regex.
+		LinkFilter	Blocks links.
+
+	Other filters can be added to a pipeline, as any object with a name,
+	and a check method that returns why a message is blocked, or None.
+
+   RULES:
+
+	Rules are loaded from a file, with one rule on each line:
+
+		# Comments start with a hash.
+		word [keyword]
+		regex [pattern]
+		links
+"""
+
+import re
+import time
+
+from .keyword_automaton import KeywordAutomaton
+
+#: Allow this to be run as a module, or py file.
+try:
+	from concurrency import Shards
+except ImportError:
+	from chatroom.concurrency import Shards
+
+class KeywordFilter:
+	""" CLASS DEFINITION
+
+		Blocks messages containing banned words.
+
+	"""
+
+	name = "keywords"
+
+	def __init__(self, keywords: list, whole_words: bool = True):
+		""" self.__init__(list, bool)
+
+			Args:
+				keywords(list): The banned words.
+				whole_words(bool): See KeywordAutomaton.
+		"""
+
+		self.automaton = KeywordAutomaton(keywords, whole_words)
+
+	def check(self, text: str):
+		""" Returns why text is blocked, or None. """
+
+		if self.automaton.search(text) is not None:
+			return "it contains a banned word"
+
+		return None
+
+class RegexFilter:
+	""" CLASS DEFINITION
+
+		Blocks messages matching any of a list of patterns.
+
+	"""
+
+	name = "regex"
+
+	def __init__(self, patterns: list):
+		""" self.__init__(list)
+
+			Args:
+				patterns(list): The patterns, which are matched regardless
+						of case.
+
+			Raises:
+				re.error: If a pattern is invalid.
+		"""
+
+		#: The patterns are searched for at once, as a single pattern, where
+		#: that can't change what they match. Joining them renumbers their
+		#: groups, which breaks backreferences, and global flags (eg (?s))
+		#: would apply to every pattern, so patterns with either are kept
+		#: apart.
+		plain = re.compile("").flags
+		combined = []
+		self.separate = []
+
+		for pattern in patterns:
+			compiled = re.compile(pattern, re.IGNORECASE)
+
+			#: Global flags are found by compiling without IGNORECASE, as
+			#: (?i) would not change the flags otherwise.
+			if compiled.groups == 0 and re.compile(pattern).flags == plain:
+				combined.append(pattern)
+			else:
+				self.separate.append(compiled)
+
+		#: Group each pattern, so that an | in one does not change the others.
+		self.pattern = re.compile("|".join("(?:{})".format(pattern) for pattern in combined), re.IGNORECASE) \
+			       if len(combined) != 0 else None
+
+	def check(self, text: str):
+		""" Returns why text is blocked, or None. """
+
+		if self.pattern is not None and self.pattern.search(text) is not None:
+			return "it matches a blocked pattern"
+
+		for pattern in self.separate:
+			if pattern.search(text) is not None:
+				return "it matches a blocked pattern"
+
+		return None
+
+class LinkFilter:
+	""" CLASS DEFINITION
+
+		Blocks messages containing links.
+
+	"""
+
+	name = "links"
+
+	#: Anything starting with a scheme or www., or a bare domain such as example.com/page.
+	PATTERN = re.compile(r"\b(?:[a-z][a-z0-9+.-]*://|www\.)\S+|\b[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}/\S*",
+			     re.IGNORECASE)
+
+	def check(self, text: str):
+		""" Returns why text is blocked, or None. """
+
+		if self.PATTERN.search(text) is not None:
+			return "links are not allowed"
+
+		return None
+
+def load_rules(path: str):
+	""" load_rules(str)
+
+		Reads and compiles a rules file.
+
+		Args:
+			path(str): The path to the rules file.
+
+		Returns:
+			A list of filters.
+
+		Raises:
+			OSError: If the file can not be read.
+			ValueError: If a rule is invalid.
+	"""
+
+	keywords = []
+	patterns = []
+	first_pattern = None
+	links = False
+
+	with open(path, "r") as f:
+		for number, line in enumerate(f, 1):
+			line = line.strip()
+
+			if len(line) == 0 or line.startswith("#"):
+				continue
+
+			kind, _, value = line.partition(" ")
+			value = value.strip()
+
+			if kind == "word" and len(value) != 0:
+				keywords.append(value)
+			elif kind == "regex" and len(value) != 0:
+				try:
+					RegexFilter([value])
+				except re.error as e:
+					raise ValueError("Line {}: invalid pattern ({}).".format(number, e))
+
+				patterns.append(value)
+
+				if first_pattern is None:
+					first_pattern = number
+			elif kind == "links":
+				links = True
+			else:
+				raise ValueError("Line {}: \"{}\" is not a valid rule.".format(number, line))
+
+	filters = []
+
+	if len(keywords) != 0:
+		filters.append(KeywordFilter(keywords))
+	if len(patterns) != 0:
+		try:
+			filters.append(RegexFilter(patterns))
+		except re.error as e:
+			raise ValueError("Line {}: the patterns can not be used together ({}).".format(first_pattern, e))
+	if links:
+		filters.append(LinkFilter())
+
+	return filters
+
+class FilterPipeline:
+	""" CLASS DEFINITION
+
+		The filters that every chat message is checked against, and how
+		long each filter takes.
+
+	"""
+
+	def __init__(self, filters: list = None):
+		""" self.__init__(list)
+
+			Args:
+				filters(list): The filters, in the order they are checked.
+		"""
+
+		#: A tuple, so that it can be replaced while messages are checked.
+		self.filters = tuple(filters or [])
+
+		#: Relates filter names to [messages checked, total seconds,
+		#: longest seconds, messages blocked]. Every client's thread checks
+		#: its messages, so each thread records to one of several shards,
+		#: which are added up by self.summary.
+		self._metrics = Shards(dict)
+
+	def replace(self, filters: list):
+		""" self.replace(list)
+
+			Replaces every filter. Messages being checked carry on with the
+			old filters.
+		"""
+
+		self.filters = tuple(filters)
+
+	def load(self, path: str):
+		""" self.load(str)
+
+			Replaces every filter with the rules in a file. If the file is
+			invalid, then the current filters are kept.
+
+			Args:
+				path(str): The path to the rules file.
+
+			Returns:
+				The number of filters loaded.
+
+			Raises:
+				OSError: If the file can not be read.
+				ValueError: If a rule is invalid.
+		"""
+
+		filters = load_rules(path)
+		self.replace(filters)
+
+		return len(filters)
+
+	def check(self, text: str):
+		""" self.check(str)
+
+			Checks a message against each filter, stopping at the first
+			that blocks it.
+
+			Args:
+				text(str): The message.
+
+			Returns:
+				A tuple of the name of the filter that blocked the message,
+				and why, or None if it is allowed.
+		"""
+
+		for message_filter in self.filters:
+			start = time.perf_counter()
+			reason = message_filter.check(text)
+			self._record(message_filter.name, time.perf_counter() - start, reason is not None)
+
+			if reason is not None:
+				return message_filter.name, reason
+
+		return None
+
+	def _record(self, name: str, duration: float, blocked: bool):
+		""" Records a filter checking a message. """
+
+		lock, shard = self._metrics.for_thread()
+
+		with lock:
+			metrics = shard.setdefault(name, [0, 0.0, 0.0, 0])
+			metrics[0] += 1
+			metrics[1] += duration
+			metrics[2] = max(metrics[2], duration)
+			metrics[3] += blocked
+
+	def summary(self):
+		""" self.summary()
+
+			Returns a dictionary relating each filter's name to a tuple of
+			the number of messages it checked, the average and longest
+			seconds it took, and the number of messages it blocked.
+		"""
+
+		totals = {}
+
+		for lock, shard in self._metrics:
+			with lock:
+				for name, metrics in shard.items():
+					total = totals.setdefault(name, [0, 0.0, 0.0, 0])
+					total[0] += metrics[0]
+					total[1] += metrics[1]
+					total[2] = max(total[2], metrics[2])
+					total[3] += metrics[3]
+
+		return {name: (count, total / count if count else 0.0, longest, blocked)
+			for name, (count, total, longest, blocked) in totals.items()}
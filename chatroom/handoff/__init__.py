@@ -0,0 +1,2 @@
+from .unix_handoff import HandoffSender
+from .unix_handoff import HandoffReceiver
@@ -0,0 +1,353 @@
+""" PURPOSE:
+
+	Passes a running server's sockets to a newly started server, so that
+	the server can be restarted without dropping its clients.
+
+	The new server listens on a Unix socket, and the old server connects
+	to it and sends its listening socket, and optionally each connected
+	client, using SCM_RIGHTS. Both processes then share the same sockets.
+
+	While the old server drains, anything its threads still recieve (a
+	message from a client, or a newly accepted connection) is forwarded
+	to the new server over the same Unix socket, so nothing is lost.
+
+   USAGE:
+
+	Each record sent over the Unix socket is a JSON object with a "type",
+	and any sockets attached to it. The records are sent in the order:
+
+		listener, session*, message*, ready, (data | client)*, done
+
+	The new server answers each session with an "ack" record, and the old
+	server only goes on once it has, so that it can take the clients back
+	if the handoff fails part way.
+
+	SOCK_SEQPACKET is used so that each packet arrives whole. A record may
+	be larger than a packet (eg a session with a lot queued), so records
+	are split into packets of up to CHUNK_SIZE bytes. Each packet starts
+	with MORE if more of the record follows, or LAST if it is the end.
+	Sockets are attached to a record's first packet.
+"""
+
+import base64
+import json
+import os
+import socket
+import threading
+
+#: The most bytes of a record sent in each packet.
+CHUNK_SIZE = 32768
+
+MORE = b"+"
+LAST = b"."
+
+#: The seconds the old server waits for a session to be acknowledged.
+ACK_TIMEOUT = 10
+
+def _send_record(channel, record: dict, sockets: list = None):
+	""" Sends a record, and any sockets attached to it. """
+
+	data = json.dumps(record).encode()
+
+	for start in range(0, max(len(data), 1), CHUNK_SIZE):
+		packet = (MORE if start + CHUNK_SIZE < len(data) else LAST) + data[start:start + CHUNK_SIZE]
+
+		if sockets and start == 0:
+			socket.send_fds(channel, [packet], [s.fileno() for s in sockets])
+		else:
+			channel.send(packet)
+
+def _recv_record(channel):
+	""" Returns the next record and its sockets, or (None, []) once the channel closes. """
+
+	parts = []
+	sockets = []
+
+	while True:
+		packet, fds, _, _ = socket.recv_fds(channel, CHUNK_SIZE + 1, 1)
+
+		sockets += [socket.socket(fileno=fd) for fd in fds]
+
+		if not packet:
+			for s in sockets:
+				s.close()
+
+			return None, []
+
+		parts.append(packet[1:])
+
+		if packet[:1] == LAST:
+			break
+
+	#: The old server may have left the sockets non-blocking, so
+	#: put them back in blocking mode.
+	for s in sockets:
+		s.setblocking(True)
+
+	return json.loads(b"".join(parts).decode()), sockets
+
+class HandoffSender:
+	""" CLASS DEFINITION
+
+		The old server's end of a handoff.
+
+	"""
+
+	def __init__(self, path: str):
+		""" self.__init__(str)
+
+			Connects to the new server waiting at path.
+
+			Args:
+				path(str): The path of the new server's Unix socket.
+		"""
+
+		self.channel = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		self.channel.connect(path)
+
+		#: Set once done is sent, after which nothing more can be forwarded.
+		self.closed = False
+
+		#: Held while sending a record, as clients' threads forward data at
+		#: the same time, and a record may take several packets.
+		self._lock = threading.Lock()
+
+	def _send(self, record: dict, sockets: list = None):
+		""" Sends a record, and any sockets attached to it. """
+
+		with self._lock:
+			_send_record(self.channel, record, sockets)
+
+	def send_listener(self, listener):
+		""" self.send_listener(socket)
+
+			Sends the server's listening socket.
+
+			Args:
+				listener(socket): The listening socket.
+		"""
+
+		self._send({"type": "listener"}, [listener])
+
+	def send_session(self, session, username: str, outbox: list = None):
+		""" self.send_session(Session, str, list)
+
+			Sends a connected client, and its session state, and waits for
+			the new server to acknowledge it.
+
+			Args:
+				session(Session): The client's session. Its id is used to
+						  identify the session in later records.
+				username(str): The client's username, or None if it has not
+					       chosen one yet.
+				outbox(list): The messages that were queued for the client
+					      but not sent, as (seconds waited, (frame type,
+					      text, sender, ref)). See Session.detach.
+
+			Raises:
+				OSError: If the session could not be sent, or was not
+					 acknowledged.
+		"""
+
+		outbox = [(waited, (frame_type, text.decode() if isinstance(text, bytes) else text, sender, ref))
+			  for waited, (frame_type, text, sender, ref) in outbox or []]
+
+		record = {
+			"type": "session",
+			"id": session.id,
+			"address": session.address,
+			"username": username,
+			"version": session.version,
+			"negotiated": session.negotiated,
+			"options": session.options,
+			"subscribed": session.subscribed,
+			"seq_out": session.seq_out,
+			"seq_in": session.seq_in,
+			"buffer": base64.b64encode(bytes(session.reader.buffer)).decode(),
+			"pending": session.pending,
+			"outbox": outbox,
+			"lag_state": session.lag_state,
+			"missed": session.missed
+		}
+
+		with self._lock:
+			_send_record(self.channel, record, [session.client])
+
+			self.channel.settimeout(ACK_TIMEOUT)
+			try:
+				reply, _ = _recv_record(self.channel)
+			finally:
+				self.channel.settimeout(None)
+
+		if reply is None or reply.get("type") != "ack" or reply.get("id") != session.id:
+			raise ConnectionError("The new server did not take session {}.".format(session.id))
+
+	def send_message(self, message: str, address: str, frame_type: int, sender: int):
+		""" self.send_message(str, str, int, int)
+
+			Sends a message that is waiting to be broadcast.
+
+			Args:
+				message(str): The message.
+				address(str): The IP address of the client that sent it.
+				frame_type(int): The type of message.
+				sender(int): The session id of the client that sent it.
+		"""
+
+		self._send({
+			"type": "message",
+			"message": message,
+			"address": address,
+			"frame_type": frame_type,
+			"sender": sender
+		})
+
+	def ready(self):
+		""" Tells the new server that all of the state has been sent. """
+		self._send({"type": "ready"})
+
+	def forward_data(self, session_id: int, data: bytes):
+		""" self.forward_data(int, bytes)
+
+			Forwards data recieved from a handed off client.
+
+			Args:
+				session_id(int): The session that the data came from.
+				data(bytes): The data, exactly as it was recieved.
+		"""
+
+		self._send({"type": "data", "id": session_id, "data": base64.b64encode(data).decode()})
+
+	def forward_client(self, client, address: str):
+		""" self.forward_client(socket, str)
+
+			Forwards a client that connected after the handoff started.
+
+			Args:
+				client(socket): The client.
+				address(str): The client's IP address.
+		"""
+
+		self._send({"type": "client", "address": address}, [client])
+
+	def done(self):
+		""" Tells the new server that the old server is exiting, and closes the channel. """
+
+		self.closed = True
+
+		try:
+			self._send({"type": "done"})
+		finally:
+			self.channel.close()
+
+	def abort(self):
+		""" Closes the channel without finishing, eg once the handoff has failed. """
+
+		self.closed = True
+		self.channel.close()
+
+class HandoffReceiver:
+	""" CLASS DEFINITION
+
+		The new server's end of a handoff.
+
+	"""
+
+	def __init__(self, path: str):
+		""" self.__init__(str)
+
+			Waits at path for the old server to connect.
+
+			Args:
+				path(str): The path to create the Unix socket at.
+		"""
+
+		self.path = path
+
+		#: Remove a socket left behind by an earlier handoff.
+		if os.path.exists(path):
+			os.unlink(path)
+
+		self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		self.listener.bind(path)
+		self.listener.listen(1)
+
+		print("Waiting for the running server at {}".format(path))
+
+		self.channel, _ = self.listener.accept()
+
+	def _recv(self):
+		""" Returns the next record and its sockets, or (None, []) once the channel closes. """
+		return _recv_record(self.channel)
+
+	def receive(self):
+		""" self.receive()
+
+			Recieves the old server's state.
+
+			Returns:
+				A tuple of the listening socket, a list of sessions, and a
+				list of (message, address, frame type, sender) waiting to be
+				broadcast. Each session is a dictionary of the fields sent by
+				HandoffSender.send_session, along with its "client".
+		"""
+
+		listener = None
+		sessions = []
+		messages = []
+
+		while True:
+			record, sockets = self._recv()
+
+			if record is None:
+				raise ConnectionError("The running server closed the handoff early.")
+
+			if record["type"] == "listener":
+				listener = sockets[0]
+
+			elif record["type"] == "session":
+				record["client"] = sockets[0]
+				record["buffer"] = base64.b64decode(record["buffer"])
+				record["pending"] = [tuple(message) for message in record["pending"]]
+				record["outbox"] = [(waited, tuple(message)) for waited, message in record["outbox"]]
+				sessions.append(record)
+
+				_send_record(self.channel, {"type": "ack", "id": record["id"]})
+
+			elif record["type"] == "message":
+				messages.append((record["message"], record["address"],
+						 record["frame_type"], record["sender"]))
+
+			elif record["type"] == "ready":
+				return listener, sessions, messages
+
+	def forwarded(self):
+		""" self.forwarded()
+
+			Yields the records forwarded by the old server while it drains,
+			until it exits. A "data" record has an "id" and "data" (bytes),
+			and a "client" record has a "client" and "address".
+		"""
+
+		while True:
+			record, sockets = self._recv()
+
+			if record is None or record["type"] == "done":
+				return
+
+			if record["type"] == "client":
+				record["client"] = sockets[0]
+
+			elif record["type"] == "data":
+				record["data"] = base64.b64decode(record["data"])
+
+			yield record
+
+	def close(self):
+		""" Closes the Unix socket. """
+
+		self.channel.close()
+		self.listener.close()
+
+		if os.path.exists(self.path):
+			os.unlink(self.path)
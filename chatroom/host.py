@@ -4,6 +4,31 @@ import traceback
 import time
 import argparse
 import os
+import collections
+import itertools
+import secrets
+import contextvars
+import ssl
+
+#: Allow this to be run as a module, or py file.
+try:
+	import protocol
+	from protocol import frames
+except ImportError:
+	from chatroom import protocol as protocol
+	from chatroom.protocol import frames
+
+#: The seq of the request being handled, so that replies and errors can
+#: reference it. Each client's thread has its own value.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+#: What refused clients are told, by the reason they were refused.
+REFUSALS = {
+	"rate": "The server is accepting too many connections, try again later.",
+	"sessions": "The server is full, try again later.",
+	"address": "Too many connections from your address.",
+	"memory": "The server is too busy, try again later."
+}
 
 """
 TODO:
@@ -25,45 +50,175 @@ class chatroomServer:
 
 	"""
 
-	def __init__(self, host: str, port: int):
-		""" self.__init__(str, int):
+	def __init__(self, host: str, port: int, inherit: str = None, transport=None,
+		     snapshot_path: str = None, mailboxes_path: str = None, permissions_dir: str = None):
+		""" self.__init__(str, int, str, Transport, str, str, str):
 
 			Intialized the server on host, with port port.
 
 			Args:
 				host(str): The ip address to host the server on.
 				port(int): The TCP port to host on.
+				inherit(str): If passed, then rather than binding a new socket,
+					      wait at this Unix socket path for a running
+					      server to hand over its sockets (see self.upgrade).
+				transport(Transport): What clients connect over. Defaults to
+						      TCP. See the transport package, eg
+						      MemoryTransport for tests.
+				snapshot_path(str): The file that the server's state is
+						    saved to, and loaded from when it starts.
+						    If None, then no snapshot is kept.
+				mailboxes_path(str): The database that mail for users who
+						     are not connected is kept in. If None,
+						     then mail is only kept in memory.
+				permissions_dir(str): Where the permission files are kept.
+						      Defaults to the permissions package.
 		"""
 
 		#: Allow this to be run as a module, or py file.
 		try:
 			import commands
 			import permissions
+			import limits
+			import timers
+			import handoff
+			import snapshot
+			import workers
+			import mailboxes
+			import presence
+			import filters
+			import transfers
+			import transport as transports
+			import concurrency
 		except ImportError:
 			from chatroom import commands as commands
 			from chatroom import permissions as permissions
+			from chatroom import limits as limits
+			from chatroom import timers as timers
+			from chatroom import handoff as handoff
+			from chatroom import snapshot as snapshot
+			from chatroom import workers as workers
+			from chatroom import mailboxes as mailboxes
+			from chatroom import presence as presence
+			from chatroom import filters as filters
+			from chatroom import transfers as transfers
+			from chatroom import transport as transports
+			from chatroom import concurrency as concurrency
 
 		#: Store the server information.
 		self.host = host
 		self.port = port
 
-		#: Create a socket.
-		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		#: Used to hold all the messages that come in on one update, as
+		#: tuples of (message, address, frame type, sender's session id).
+		#: They are split into the outbox lanes, so that notices are sent
+		#: ahead of a backlog of chat. See self.messages.
+		self.message_queue = concurrency.LaneQueue(lambda message: protocol.outbox.lane_for(message[2]),
+							   len(protocol.outbox.LANE_NAMES))
 
-		#: Bind the socket to the host and port to act as the host.
-		self.server.bind((host, port))
+		#: Set when a message is broadcast, to wake handle_messaging.
+		self.messages_ready = threading.Event()
 
-		#: Used to hold all the messages that come in on one update.
-		self.messages = []
+		#: A dictionary relating client sockets to their sessions. This, and
+		#: the other dictionaries changed by every client's thread, are
+		#: sharded so that threads running in parallel (on builds of Python
+		#: without the GIL) don't all wait on the same lock.
+		self.sessions = concurrency.ShardedDict()
+
+		#: Used to give each session its id.
+		self.session_ids = itertools.count(1)
+
+		#: The running server that this server is taking over from, and the
+		#: sessions that it handed over. See self.handle_handoff.
+		self.predecessor = None
+		self.inherited_sessions = []
+
+		self.transport = transport if transport is not None else transports.TCPTransport()
+
+		if inherit is None:
+
+			#: Create a socket bound to the host and port to act as the host.
+			self.server = self.transport.listen((host, port))
+
+		else:
+
+			#: Take over the running server's listening socket, its clients,
+			#: and any messages it had not yet sent.
+			self.predecessor = handoff.HandoffReceiver(inherit)
+			self.server, self.inherited_sessions, self.messages = self.predecessor.receive()
+
+		#: The server that this server is handing over to, and the sessions
+		#: that were handed over, relating (client, address) to their
+		#: session ids. See self.upgrade.
+		self.successor = None
+		self.handed_off = {}
+
+		#: Set once this server has started handing over to a successor.
+		self.draining = False
+
+		#: Set once the handoff has finished, or failed. Until then, what the
+		#: handed over clients send is held back, as the successor may not
+		#: have all of them yet, and they may be taken back.
+		self.handoff_done = threading.Event()
+
+		#: An optional Unix domain socket for local clients, and the path it
+		#: is bound to. See self.listen_unix.
+		self.unix_server = None
+		self.unix_path = None
+
+		#: Clients connected over the Unix socket have no IP address, so each
+		#: is given a local address of "unix:", the process id, and a number
+		#: from this. The process id keeps addresses unique across a handoff.
+		self.local_ids = itertools.count(1)
+
+		#: The permission level given to local clients. This is not saved to
+		#: the permission files, as local addresses are not reused.
+		self.local_permission = "user"
+
+		#: The protocol options (see protocol.frames) that clients may
+		#: negotiate, eg compression.
+		self.protocol_options = frames.OPTIONS
+
+		#: The TLS context that TCP clients are wrapped in, or None for
+		#: cleartext. See self.enable_tls.
+		self.tls_context = None
+		self.tls_handshake_timeout = 10
+
+		#: How long messages wait in each session's outbox lanes, across
+		#: every session. See the lanes server command.
+		self.lane_metrics = protocol.LaneMetrics()
+
+		#: What to do about clients that fall behind the messages sent to
+		#: them. See self.check_lag, and the lag server command.
+		self.lag_policy = limits.LagPolicy()
+
+		#: Keeps the memory held for messages and sessions within a budget,
+		#: by shedding load. See self.check_memory.
+		self.memory_budget = limits.MemoryBudget()
+
+		#: Limits how many sessions there are, and how quickly they are
+		#: accepted. Checked by get_clients before a session is created.
+		self.admission = limits.AdmissionControl()
 
 		#: Used to hold the usernames assosiated to addresses.
-		self.usrs = {'': "Server"}
+		self.usrs = concurrency.ShardedDict({'': "Server"})
+
+		#: Used to find a user's client from their username, without searching
+		#: self.usrs, and to list users in order. Changed with self.set_username.
+		self.usernames = presence.UserIndex()
+		self.usernames.claim("Server", None, '')
 
-		#: A list of connected clients.
+		#: A list of connected clients. Adding a client, and checking for
+		#: and removing one, must hold self.clients_lock, so that a client
+		#: closed by two threads at once is only closed once.
 		self.clientlist = []
+		self.clients_lock = threading.Lock()
+
+		#: The clients that are being closed by self.close_client.
+		self.closing = set()
 
 		#: A dictionary relating clients to their controlling threads.
-		self.client_threads = {}
+		self.client_threads = concurrency.ShardedDict()
 
 		#: Create an internal list of all the client commands.
 		self.client_command_list = commands.client_command_list
@@ -71,29 +226,130 @@ class chatroomServer:
 		#: Create an internal list of all the server commands.
 		self.server_command_list = commands.server_command_list
 
+		#: Runs blocking commands, so that they don't stop their client's
+		#: messages from being read. See self.handle_commands.
+		self.command_pool = workers.WorkerPool(workers=4, max_queue=32)
+
 		#: Get a dictionary of the types of permissions availiable.
 		self.permission_types = permissions.permission_types
 
-		#: Read from the relevant permissions files to create a dictionary
-		#: of addresses relating to their respective permission levels.
+		if permissions_dir is not None:
+			self.permission_types = {name: permissions.Permissions(name, p_type.level, permissions_dir)
+						 for name, p_type in permissions.permission_types.items()}
+
+		#: The most recent messages sent to the room.
+		self.history = collections.deque(maxlen=100)
+
+		#: Collects users connecting and disconnecting, so that bursts of
+		#: them are announced as a single summary. See handle_messaging.
+		self.presence = presence.PresenceCoalescer(window=1, threshold=5)
+
+		#: A dictionary relating resume tokens to the usernames they reclaim.
+		self.resume_tokens = {}
+
+		#: The file that the server's state is saved to, and how often.
+		self.snapshot_path = snapshot_path
+		self.snapshot_interval = 300
+
+		#: Direct messages sent to users who are not connected, delivered
+		#: when they next connect.
+		self.mailboxes = mailboxes.MailboxStore(":memory:" if mailboxes_path is None else mailboxes_path)
+
+		#: The moderation rules that chat is checked against before it is
+		#: broadcast, and the file they are loaded from. See self.load_filters.
+		self.filters = filters.FilterPipeline()
+		self.filters_path = os.path.join(os.path.dirname(permissions.__file__), "filters.rules")
+
+		if os.path.exists(self.filters_path):
+			self.load_filters()
+
+		#: The files that users have shared, and the server that moves them
+		#: over their own connections, so that they don't hold up chat.
+		#: The transfer port is picked when the server starts, unless set.
+		self.spool = transfers.FileSpool()
+		self.transfers = transfers.TransferServer(self.spool, host)
+		self.transfers.on_upload = self.announce_upload
+
+		#: Records every message that clients send, when capturing, so that
+		#: the traffic can be replayed later. See self.start_capture.
+		self.capture = None
+
+		#: Load the server's state from its snapshot. If there is no snapshot,
+		#: or one of the permission files was changed after it was saved, then
+		#: this returns None.
+		state = None
+		if self.snapshot_path is not None:
+			state = snapshot.load_snapshot(self.snapshot_path,
+						       [p.permission_file for p in self.permission_types.values()])
+
 		self.permissions = {}
-		for permission_type in self.permission_types.keys():
 
-			p_type = self.permission_types[permission_type]
+		#: Held while changing a client's permission level, and its file.
+		self.permissions_lock = threading.RLock()
+
+		if state is not None:
+
+			#: Relate the names of each permission level to the permission.
+			names = {p_type.permission: p_type for p_type in self.permission_types.values()}
+
+			for client_addr, permission in state["permissions"]:
+				if permission in names.keys():
+					self.permissions[client_addr] = names[permission]
 
-			#: For each IP assosiated with this permission
-			#: level, create a dictionary entry with the
-			#: IP as the key, and the permission level as
-			#: the value.
-			for client_addr in p_type.get_clients():
-				self.permissions[client_addr] = p_type
+			self.history.extend(state["history"])
+			self.resume_tokens.update(state["tokens"])
+
+		else:
+
+			#: Otherwise read from the relevant permissions files to create a dictionary
+			#: of addresses relating to their respective permission levels.
+			for permission_type in self.permission_types.keys():
+
+				p_type = self.permission_types[permission_type]
+
+				#: For each IP assosiated with this permission
+				#: level, create a dictionary entry with the
+				#: IP as the key, and the permission level as
+				#: the value.
+				for client_addr in p_type.get_clients():
+					self.permissions[client_addr] = p_type
+
+		#: Token buckets limiting how quickly each session may send messages
+		#: and commands. These are keyed by the client's socket.
+		self.session_limits = {
+			"message": limits.RateLimiter(2, 5),
+			"command": limits.RateLimiter(1, 5)
+		}
+
+		#: Token buckets limiting how quickly each IP address may send messages
+		#: and commands, across all of its sessions.
+		self.ip_limits = {
+			"message": limits.RateLimiter(8, 20),
+			"command": limits.RateLimiter(4, 10)
+		}
+
+		#: How often IP addresses' buckets are checked, and removed once
+		#: they have refilled or have not been used for limits_max_idle
+		#: seconds. See self.handle_heartbeats.
+		self.limits_interval = 60
+		self.limits_max_idle = 3600
+
+		#: A timer wheel holding each client's inactivity deadline. These
+		#: are keyed by (client, address), the same as self.clientlist.
+		self.timers = timers.TimerWheel()
+
+		#: The clients that have been sent a ping, and have not yet responded,
+		#: as keys. The heartbeat thread, the clients' threads and
+		#: close_client all change it.
+		self.pinged = concurrency.ShardedDict()
 
 		#: Allow threads to start when created.
 		self.running = True
 
 		print("Server object initialized.")
 
-	def start(self, max_connections: int = 5, inactivity_timeout: int = 60, no_console: bool= False):
+	def start(self, max_connections: int = 5, inactivity_timeout: int = 60, no_console: bool= False,
+		  pong_timeout: int = 10):
 		""" self.listen(int, int):
 
 			The main control method of the server. When this method is run,
@@ -102,18 +358,34 @@ class chatroomServer:
 
 			Args:
 				max_connections(int): The maximum number of allowed clients.
-				inactivity_timeout(int): The number of seconds to wait for a
-							 client to be considered timed-out.
+				inactivity_timeout(int): The number of seconds a client may be
+							 quiet for before it is sent a ping.
 				no_console(bool): If True, then there is no console for the
 						  server to enter commands in.
+				pong_timeout(int): The number of seconds a client has to respond
+						   to a ping before it is considered timed-out.
 		"""
 
 		#: Create [max_connections] slots for clients to connect to.
 		self.server.listen(max_connections)
 
+		if self.unix_server is not None:
+			self.unix_server.listen(max_connections)
+
 		#: Set the private attribute, so that it can be accessed from
 		#: another thread.
 		self._inactivity_timeout = inactivity_timeout
+		self._pong_timeout = pong_timeout
+
+		self.command_pool.start()
+
+		#: File transfers are optional, so the chat server still starts if
+		#: the transfer port can't be used. They always use TCP.
+		if self.transport.name == "tcp":
+			try:
+				print("Accepting file transfers on port {}.".format(self.transfers.start()))
+			except OSError as e:
+				print("File transfers are disabled: {}".format(e))
 
 		#: Allow client connections to be handled by a seperate thread.
 		#: Once a client is connected, they are given their own thread
@@ -123,18 +395,42 @@ class chatroomServer:
 		#: of self.messages to know if a message has been recieved.
 		self.get_clients_thread = threading.Thread(target=self.get_clients).start()
 
+		#: Local clients are accepted by a seperate thread in the same way.
+		if self.unix_server is not None:
+			self.get_unix_clients_thread = threading.Thread(target=self.get_clients,
+									args=(self.unix_server,)).start()
+
 		#: Create a thread that checks if any messages have been sent.
 		#: If a message has been sent, then this thread will handle sending
 		#: the message to all other users.
 		self.handle_messaging_thread = threading.Thread(target=self.handle_messaging).start()
 
+		#: Create a thread that watches the inactivity timers, pinging quiet
+		#: clients and removing clients that don't respond.
+		self.heartbeat_thread = threading.Thread(target=self.handle_heartbeats).start()
+
+		#: Save the server's state every snapshot_interval seconds.
+		if self.snapshot_path is not None:
+			self.timers.schedule("snapshot", self.snapshot_interval)
+
+		#: Remove IP addresses' buckets once they are no longer needed.
+		self.timers.schedule("limits", self.limits_interval)
+
+		#: Free the space held by uploads that were never sent, and old files.
+		self.timers.schedule("transfers", self.transfers.ticket_timeout)
+
+		#: If this server is taking over from a running server, then create a
+		#: thread to adopt its clients once it has finished draining.
+		if self.predecessor is not None:
+			self.handoff_thread = threading.Thread(target=self.handle_handoff).start()
+
 		while self.running and not no_console:
 			cmd = str(input())
 
 			cmd_args = cmd.split(" ")
 
 			try:
-				self.server_command_list[cmd_args[0].replace('!', '')](self, cmd_args)
+				self.server_command_list[cmd_args[0].replace('!', '')].func(self, cmd_args)
 			except:
 
 				#: For debugging use, if a ! is in a command,
@@ -152,13 +448,279 @@ class chatroomServer:
 		self.running = False
 
 		#: Close the connection to each client.
-		for client, addr in self.clientlist:
+		#: Iterate over a copy, as close_client removes from self.clientlist.
+		for client, addr in list(self.clientlist):
 			self.close_client(client, addr, "Server Shutdown")
 
+		#: Shutdown the listening socket before closing it, so that
+		#: the accept() in get_clients is woken up. If the socket was
+		#: handed over to a successor, then it is still in use there.
+		if not self.draining:
+			try:
+				self.server.shutdown(socket.SHUT_RDWR)
+			except OSError:
+				#: The socket was never listening.
+				pass
+
 		self.server.close()
 
+		if self.unix_server is not None:
+			try:
+				self.unix_server.shutdown(socket.SHUT_RDWR)
+			except OSError:
+				pass
+
+			self.unix_server.close()
+
+			if os.path.exists(self.unix_path):
+				os.unlink(self.unix_path)
+
+		self.command_pool.stop()
+
+		self.transfers.stop()
+		self.spool.close()
+
+		self.stop_capture()
+
+		self.save_snapshot()
+		self.mailboxes.close()
+
 		print("Shutdown successful")
 
+	def start_capture(self, path: str):
+		""" self.start_capture(str)
+
+			Starts recording every message that clients send to path, with
+			when it arrived and which session sent it. The capture can be
+			replayed against another server with capture.replay.
+
+			Args:
+				path(str): The file to record to. It is replaced if it exists.
+		"""
+
+		#: Allow this to be run as a module, or py file.
+		try:
+			import capture
+		except ImportError:
+			from chatroom import capture as capture
+
+		self.stop_capture()
+		self.capture = capture.CaptureWriter(path)
+
+	def stop_capture(self):
+		""" self.stop_capture()
+
+			Stops recording, if the server is capturing.
+
+			Returns:
+				The number of messages recorded, or None if the server was
+				not capturing.
+		"""
+
+		writer = self.capture
+
+		if writer is None:
+			return None
+
+		self.capture = None
+		writer.close()
+
+		return writer.count
+
+	def save_snapshot(self):
+		""" self.save_snapshot()
+
+			Saves the permission levels, recent history and resume tokens
+			to self.snapshot_path, so that they can be loaded quickly
+			next time the server starts. Does nothing if there is no
+			snapshot_path.
+		"""
+
+		if self.snapshot_path is None:
+			return
+
+		#: Allow this to be run as a module, or py file.
+		try:
+			import snapshot
+		except ImportError:
+			from chatroom import snapshot as snapshot
+
+		try:
+			snapshot.save_snapshot(
+				self.snapshot_path,
+				[(addr, p_type.permission) for addr, p_type in list(self.permissions.items())
+				 if not self.is_local(addr)],
+				list(self.history),
+				list(self.resume_tokens.items())
+			)
+		except OSError:
+			#: Failing to save is not fatal, as the permission files
+			#: are always kept up to date.
+			traceback.print_exc()
+
+
+	def upgrade(self, path: str, include_clients: bool = True, drain_timeout: float = 1):
+		""" self.upgrade(str, bool, float)
+
+			Hands this server's listening socket, and optionally its clients,
+			over to a new server waiting at path (see the inherit argument of
+			__init__). Once this returns, the process should exit.
+
+			Args:
+				path(str): The Unix socket path that the new server is waiting at.
+				include_clients(bool): If True, then the connected clients and
+						       their usernames are handed over too. Otherwise
+						       they stay with this server until they leave.
+				drain_timeout(float): The number of seconds to keep forwarding
+						      anything recieved after the handoff.
+
+			Returns:
+				True once handed over, or False if the handoff failed, in
+				which case this server carries on with its clients.
+		"""
+
+		#: Allow this to be run as a module, or py file.
+		try:
+			import handoff
+		except ImportError:
+			from chatroom import handoff as handoff
+
+		print("Started handoff to {}.".format(path))
+
+		self.successor = None
+
+		#: From here on, newly accepted clients are forwarded to the successor.
+		self.handoff_done.clear()
+		self.draining = True
+
+		#: The sessions sent so far, as (client, address, session, what
+		#: session.detach returned), and the messages sent.
+		handed = []
+		messages = []
+
+		try:
+			self.successor = handoff.HandoffSender(path)
+			self.successor.send_listener(self.server)
+
+			if include_clients:
+
+				#: A TLS connection's state can't be passed to another process,
+				#: so those clients are asked to reconnect. They do a full
+				#: handshake with the successor, as it can't read the tickets
+				#: that this server issued.
+				for client, address in list(self.clientlist):
+					if isinstance(client, ssl.SSLSocket):
+						self.close_client(client, address, "a server restart, please reconnect")
+
+				#: Hand over every client, without closing their connections.
+				for client, address in list(self.clientlist):
+					session = self.sessions[client]
+
+					self.handed_off[(client, address)] = session.id
+
+					#: Stop writing to the client, and hand over what is queued.
+					handed.append((client, address, session, session.detach()))
+					self.successor.send_session(session, self.usrs.get(address),
+								    self.handoff_outbox(session, handed[-1][3]))
+
+				#: Hand over the messages that have not been sent yet, including
+				#: connections that have not been announced.
+				for message, address in self.presence.flush(force=True):
+					self.broadcast(message, address)
+
+				messages = self.messages.drain()
+
+				for message, address, frame_type, sender in messages:
+					self.successor.send_message(message, address, frame_type, sender)
+
+			#: The successor loads the snapshot once it is ready, so save
+			#: this server's state for it first.
+			self.save_snapshot()
+
+			self.successor.ready()
+
+		except OSError:
+			traceback.print_exc()
+			print("Handoff failed, keeping {} clients.".format(len(handed)))
+
+			#: The successor won't start without everything, so take back
+			#: the clients and messages that were sent to it.
+			for client, address, session, outbox in handed:
+				self.handed_off.pop((client, address), None)
+				session.resume(outbox)
+
+			self.messages.requeue(messages)
+
+			self.draining = False
+			if self.successor is not None:
+				self.successor.abort()
+			self.handoff_done.set()
+
+			return False
+
+		#: Forget about the handed over clients here.
+		for client, address, _, _ in handed:
+			self.timers.cancel((client, address))
+			self.pinged.pop((client, address), None)
+
+		if include_clients:
+			with self.clients_lock:
+				self.clientlist = []
+
+			self.admission.clear()
+			self.client_threads.clear()
+			self.usrs.clear()
+			self.usrs[''] = "Server"
+			self.usernames = type(self.usernames)()
+			self.usernames.claim("Server", None, '')
+
+		self.handoff_done.set()
+
+		#: Wait for anything that is still being recieved to be forwarded. If
+		#: the clients were kept, then wait for them to leave.
+		time.sleep(drain_timeout)
+		while len(self.clientlist) != 0:
+			time.sleep(drain_timeout)
+
+		self.successor.done()
+		self.running = False
+
+		#: Close this server's copies of the handed over sockets. The successor's
+		#: copies keep the connections open.
+		for client, address in self.handed_off.keys():
+			client.close()
+
+		self.server.close()
+
+		print("Handoff successful")
+
+		return True
+
+	def handoff_outbox(self, session, outbox: list):
+		""" self.handoff_outbox(Session, list)
+
+			Picks which of a session's unwritten messages to hand over. A
+			client that has fallen too far behind to be sent chat is not
+			handed its chat either, which is counted as missed, so that a
+			lagging client can't make the handoff large.
+
+			Args:
+				session(Session): The session.
+				outbox(list): What session.detach returned.
+
+			Returns:
+				A list of (seconds waited, message) to send.
+		"""
+
+		size = sum(len(message[1]) for _, _, message in outbox)
+		limit = self.lag_policy.limits[self.lag_policy.DEGRADE][1]
+
+		if session.lag_state >= self.lag_policy.DEGRADE or (limit is not None and size > limit):
+			kept = [item for item in outbox if item[0] != protocol.outbox.CHAT]
+			session.missed += len(outbox) - len(kept)
+			outbox = kept
+
+		return [(waited, message) for _, waited, message in outbox]
 
 	def handle_messaging(self):
 		""" self.handle_messaging()
@@ -170,14 +732,34 @@ class chatroomServer:
 		#: message to every user, and clear self.messages.
 		while self.running:
 
+			#: Announce the users that have connected and disconnected.
+			events = self.presence.drain()
+
+			for message, address in self.presence.announce(events):
+				self.broadcast(message, address)
+
+			self.send_presence(events)
+
+			#: Deal with the clients that are falling behind, and with
+			#: using too much memory.
+			self.check_lag()
+			self.check_memory()
+
 			#: Check if there are any unprocessed messages.
 			if len(self.messages) != 0:
 
 				#: If there are, go through each message, and
 				#: each connected client, and send that message
 				#: to each client in self.clientlist.
-				for message in self.messages:
-					for client, address in self.clientlist:
+				while len(self.messages) != 0:
+					message = self.next_message() #: Remove proccessed message.
+
+					#: The messages may have been dropped since they were counted.
+					if message is None:
+						break
+
+					#: Iterate over a copy, as close_client removes from self.clientlist.
+					for client, address in list(self.clientlist):
 						#: If an exception is thrown, then
 						#: this client no longer exists, and
 						#: should be removed.
@@ -186,76 +768,680 @@ class chatroomServer:
 							#: Unless this is the address is the host (for testing
 							#: purposes.)
 							if message[1] != address or address == "127.0.0.1":
-								client.send(message[0].encode())
+
+								#: Clients that are too far behind are not
+								#: sent chat, only told how much they missed.
+								session = self.sessions.get(client)
+								if message[2] == frames.CHAT and session is not None \
+								   and session.lag_state >= self.lag_policy.DEGRADE:
+									session.missed += 1
+									continue
+
+								self.send(client, message[0], message[2], message[3])
 						except Exception as e:
 
-							#: Print the exeption's stacktrace.
-							traceback.print_exc()
+							#: Print the exeption's stacktrace.
+							traceback.print_exc()
+
+							#: This client is missing, and should be removed.
+							self.close_client(client, address, "missing connection", wait=False)
+
+					#: Log that the message has been sent to each
+					#: client to the main server.
+					print("Sending message from {} to all".format(message[1]))
+
+					#: Remember the message, so that it can be replayed.
+					self.history.append(message[:2])
+
+			else:
+
+				#: If no messages were recieved, wait up to one second
+				#: for one to be broadcast. If messages were recieved,
+				#: then dont wait, as sending a message to each client
+				#: may have taken time.
+				self.messages_ready.wait(1)
+				self.messages_ready.clear()
+
+
+	def is_blocked(self, msg: str, client, address):
+		""" self.is_blocked(str, socket, str)
+
+			Checks a chat message against the moderation rules, and tells
+			the client if it was blocked.
+
+			Returns:
+				True if the message should not be sent.
+		"""
+
+		blocked = self.filters.check(msg)
+
+		if blocked is None:
+			return False
+
+		self.send(client, "Your message was not sent, as {}.".format(blocked[1]), frames.ERROR)
+		print("Blocked message from {} with the {} filter".format(address, blocked[0]))
+
+		return True
+
+	def announce_upload(self, spooled):
+		""" self.announce_upload(SpooledFile)
+
+			Tells the room that a file has been shared.
+		"""
+
+		self.broadcast("{} shared {} ({} bytes), use /download {} to get it.".format(
+			spooled.owner, spooled.name, spooled.size, spooled.id), "")
+
+	def load_filters(self, path: str = None):
+		""" self.load_filters(str)
+
+			Loads the moderation rules, replacing the current ones. If the
+			rules can not be loaded, then the current rules are kept.
+
+			Args:
+				path(str): The rules file. Defaults to self.filters_path.
+
+			Returns:
+				1 if the rules were loaded, otherwise -1.
+		"""
+
+		if path is not None:
+			self.filters_path = path
+
+		try:
+			count = self.filters.load(self.filters_path)
+		except (OSError, ValueError) as e:
+			print("Could not load the filters from {}: {}".format(self.filters_path, e))
+			return -1
+
+		print("Loaded {} filters from {}.".format(count, self.filters_path))
+		return 1
+
+	def check_lag(self):
+		""" self.check_lag()
+
+			Measures how far behind each client is, and applies
+			self.lag_policy to those that have fallen behind or caught up.
+		"""
+
+		for client, address in list(self.clientlist):
+			session = self.sessions.get(client)
+
+			if session is None:
+				continue
+
+			queued, age = session.lag()
+			state = self.lag_policy.assess(queued, age)
+			previous = session.lag_state
+
+			#: Dropping its chat lets a degraded client catch up quickly, so
+			#: it stays degraded until it is no longer far enough behind to warn.
+			if previous == self.lag_policy.DEGRADE and state == self.lag_policy.WARN:
+				state = previous
+
+			if state == previous:
+				continue
+
+			session.lag_state = state
+			name = self.usrs.get(address, address)
+
+			if state == self.lag_policy.DISCONNECT:
+				session.drop_chat()
+				self.close_client(client, address, "falling behind", wait=False)
+
+			elif state == self.lag_policy.DEGRADE:
+				session.missed += session.drop_chat()
+				print("{} is {:.1f}s behind ({} bytes), only sending it summaries.".format(name, age, queued))
+
+				try:
+					self.send(client, "You have fallen behind, so chat is paused until you catch up.")
+				except OSError:
+					pass
+
+			elif previous == self.lag_policy.DEGRADE:
+				print("{} has caught up, and missed {} messages.".format(name, session.missed))
+
+				try:
+					self.send(client, "You missed {} messages while you were behind.".format(session.missed))
+				except OSError:
+					pass
+
+				session.missed = 0
+
+			elif state == self.lag_policy.WARN:
+				print("{} is {:.1f}s behind ({} bytes).".format(name, age, queued))
+
+	def memory_usage(self):
+		""" self.memory_usage()
+
+			Estimates the memory held by the server's queues, history and
+			sessions.
+
+			Returns:
+				A dictionary relating what the memory is held by to the
+				estimated number of bytes.
+		"""
+
+		return {
+			"messages": sum(len(message[0]) for message in list(self.messages)),
+			"history": sum(len(message[0]) for message in list(self.history)),
+			"sessions": sum(self.memory_budget.SESSION_OVERHEAD + session.memory_usage()
+					for session in list(self.sessions.values()))
+		}
+
+	def check_memory(self):
+		""" self.check_memory()
+
+			Compares the memory used to self.memory_budget, and sheds load
+			if it is over. New connections are refused by get_clients, and
+			new chat by broadcast, while the budget's stage says so.
+		"""
+
+		budget = self.memory_budget
+		previous = budget.stage
+		stage = budget.update(self.memory_usage())
+
+		if stage != previous:
+			print("Memory use is at the {} stage ({} of {} bytes).".format(
+				budget.STAGES[stage], sum(budget.usage.values()), budget.limit))
+
+		#: Keep only the most recent history.
+		if stage >= budget.TRIM:
+			trimmed = 0
+
+			while len(self.history) > 10:
+				self.history.popleft()
+				trimmed += 1
+
+			budget.record("history", trimmed)
+
+		#: Throw away the chat that is waiting to be sent.
+		if stage >= budget.DROP:
+			dropped = 0
+
+			dropped += self.messages.drop(protocol.outbox.CHAT)
+
+			for session in list(self.sessions.values()):
+				dropped += session.drop_chat()
+
+			budget.record("chat", dropped)
+
+	@property
+	def messages(self):
+		""" The messages waiting to be broadcast, as a LaneQueue. Assigning a
+		    list replaces them, eg with the messages inherited in a handoff. """
+		return self.message_queue
+
+	@messages.setter
+	def messages(self, messages):
+		self.message_queue.replace(list(messages))
+
+	def next_message(self):
+		""" self.next_message()
+
+			Removes and returns the next message to broadcast. Notices are
+			taken before chat, so that they are not held up by a backlog of
+			chat. Otherwise, messages are taken in the order they were queued.
+
+			Returns:
+				The message, or None if there are none.
+		"""
+
+		return self.messages.pop()
+
+	def get_clients(self, listener=None):
+		""" self.get_clients(socket)
+
+			Watches for attempted connections, and gives them a
+			thread to talk over if one is found.
+
+			Args:
+				listener(socket): The socket to accept connections on.
+						  Defaults to the server's TCP socket.
+
+		"""
+
+		if listener is None:
+			listener = self.server
+
+		while self.running:
+			#: Wait for a connection to be started. When it is,
+			#: collect its information.
+			try:
+				client, addr = listener.accept()
+
+			#: OSError will be thrown when self.server.stop
+			#: is run. Catch this error and if the server is
+			#: shutting down (ie self.runnning is False) then
+			#: ignore it and exit, otherwise log the error..
+			except OSError:
+				if not self.running:
+					exit()
+				else:
+					traceback.print_exc()
+					continue
+
+			if listener.family == socket.AF_UNIX:
+
+				#: Give the local client its own address.
+				addr = "unix:{}:{}".format(os.getpid(), next(self.local_ids))
+			else:
+
+				#: Ignore the connecting port.
+				addr = addr[0]
+
+			#: If this server is handing over to a successor, then the
+			#: successor should take this client.
+			if self.draining and self.forward_client(client, addr):
+				continue
+
+			#: Turn the client away if it is denied, connections are arriving
+			#: too quickly, there are too many sessions, or the server is low
+			#: on memory. This is checked before any work is done for it.
+			refused = self.admission.admit(addr)
+
+			if refused is None and self.memory_budget.stage >= self.memory_budget.REFUSE:
+				self.memory_budget.record("connections")
+				refused = "memory"
+
+			if refused is not None:
+				self.refuse_client(client, addr, refused)
+				continue
+
+			self.accept_client(client, addr)
+
+	def refuse_client(self, client, addr, reason: str):
+		""" self.refuse_client(socket, str, str)
+
+			Closes a connection that was not admitted.
+
+			Args:
+				client(socket): The client.
+				addr(str): The client's address.
+				reason(str): Why it was refused, see AdmissionControl.admit.
+		"""
+
+		#: Denied clients are not told anything, and TLS clients would not
+		#: understand a message sent before the handshake.
+		if reason != "denied" and (self.tls_context is None or self.is_local(addr)):
+			try:
+				client.setblocking(False)
+				client.send(frames.to_text(frames.CLOSE, REFUSALS.get(reason, reason)).encode())
+			except OSError:
+				pass
+
+		client.close()
+
+	def enable_tls(self, certfile: str, keyfile: str = None):
+		""" self.enable_tls(str, str)
+
+			Encrypts the connections of clients that connect over TCP from
+			now on. See protocol.tls.
+
+			Args:
+				certfile(str): The path of the server's certificate.
+				keyfile(str): The path of its private key, if not in certfile.
+		"""
+
+		self.tls_context = protocol.tls.server_context(certfile, keyfile)
+
+	def accept_client(self, client, addr):
+		""" self.accept_client(socket, str)
+
+			Adds a client that was admitted. If TLS is enabled, then the
+			handshake is done on its own thread first, so that a slow client
+			can't hold up accepting the others.
+		"""
+
+		if self.tls_context is None or self.is_local(addr):
+			self.add_client(client, addr)
+			return
+
+		#: Count the connection as a session while it does the handshake,
+		#: so that slow handshakes can't get around the session limits,
+		#: which also limits the number of handshake threads.
+		self.admission.add(addr)
+
+		threading.Thread(target=self.secure_client, args=(client, addr), daemon=True).start()
+
+	def secure_client(self, client, addr):
+		""" self.secure_client(socket, str)
+
+			Does the TLS handshake with a client, and adds it if the
+			handshake succeeds. Clients that resume a session skip the
+			certificate exchange.
+		"""
+
+		try:
+			try:
+				client.settimeout(self.tls_handshake_timeout)
+				secured = self.tls_context.wrap_socket(client, server_side=True)
+				secured.settimeout(None)
+			except (OSError, ValueError) as e:
+				print("TLS handshake with {} failed: {}".format(addr, e))
+				client.close()
+				return
+
+			if not self.running:
+				secured.close()
+				return
+
+			self.add_client(secured, addr)
+
+		#: Stop counting the handshake, which add_client counted as a session.
+		finally:
+			self.admission.release(addr)
+
+	def add_client(self, client, addr, username: str = None):
+		""" self.add_client(socket, str, str)
+
+			Registers a newly connected client, and gives it a thread
+			to talk over.
+
+			Args:
+				client(socket): The client.
+				addr(str): The client's IP address.
+				username(str): The client's username, if it already has one
+					       (ie it was handed over by a previous server).
+		"""
+
+		#: Append this newly connected client to the client list. Clients
+		#: are added by several threads (eg one for each listener).
+		with self.clients_lock:
+			self.admission.add(addr)
+			self.clientlist.append((client, addr))
+			self.sessions[client] = protocol.Session(client, addr, next(self.session_ids),
+								 supported=self.protocol_options,
+								 metrics=self.lane_metrics)
+
+		#: Start the client's inactivity timer.
+		self.touch(client, addr)
+
+		self.assign_permissions(addr)
+
+		#: Create a thread to handle messaging from this new client,
+		#: and pass the client and their address to the thread.
+		client_thread = threading.Thread(target=self.manage_client, args=(client, addr, username))
+		self.client_threads[addr] = client_thread
+
+		client_thread.start()
+
+	def assign_permissions(self, addr):
+		""" self.assign_permissions(str)
+
+			Gives a newly connected client a permission level, if it does
+			not already have one.
+
+			Args:
+				addr(str): The client's address.
+		"""
+
+		#: Local clients get the local permission level, without
+		#: it being saved to a permissions file.
+		with self.permissions_lock:
+			if self.is_local(addr):
+				self.permissions[addr] = self.permission_types[self.local_permission]
+
+			#: If this IP address has not connected before, then
+			#: it's address wont be in any of the permissions
+			#: files. This means that we have to create a user entry
+			#: for them.
+			elif addr not in self.permissions.keys():
+
+				#: Change this address's permission level to user
+				self.change_permissions(addr, "user")
+
+	def handle_heartbeats(self):
+		""" self.handle_heartbeats()
+
+			Advances the inactivity timers once every tick. A client whose
+			timer expires is sent a ping, and if its timer expires again
+			before it responds then it is removed.
+		"""
+
+		while self.running:
+			time.sleep(self.timers.tick)
+
+			for key in self.timers.advance():
+
+				#: Save the server's state, and schedule the next save.
+				if key == "snapshot":
+					self.save_snapshot()
+					self.timers.schedule("snapshot", self.snapshot_interval)
+					continue
+
+				#: Remove unneeded buckets, and schedule the next check.
+				if key == "limits":
+					for limiter in self.ip_limits.values():
+						limiter.expire(self.limits_max_idle)
+
+					self.timers.schedule("limits", self.limits_interval)
+					continue
+
+				#: Expire unused transfer tickets and old files, and
+				#: schedule the next check.
+				if key == "transfers":
+					self.transfers.expire()
+					self.timers.schedule("transfers", self.transfers.ticket_timeout)
+					continue
+
+				client, address = key
+
+				#: The client was already pinged, and has not responded.
+				if self.pinged.pop((client, address), None) is not None:
+					self.close_client(client, address, "inactivity", wait=False)
+					continue
+
+				#: Otherwise ping the client, and give it pong_timeout seconds
+				#: to respond. This is recorded before the ping is sent, as
+				#: the pong may be handled before the send returns.
+				self.pinged[(client, address)] = True
+				self.timers.schedule((client, address), self._pong_timeout)
+
+				try:
+					self.send(client, "", frames.PING)
+				except OSError:
+					self.close_client(client, address, "missing connection", wait=False)
+
+	def touch(self, client, address):
+		""" self.touch(socket, str)
+
+			Resets the client's inactivity timer. This is done whenever
+			anything is recieved from the client.
+
+			Args:
+				client(socket): The client.
+				address(str): The client's IP address.
+		"""
+
+		self.pinged.pop((client, address), None)
+		self.timers.schedule((client, address), self._inactivity_timeout)
+
+	def receive(self, client, address):
+		""" self.receive(socket, str)
+
+			Waits for the next message from the client.
+
+			Args:
+				client(socket): The client.
+				address(str): The client's IP address.
+
+			Returns:
+				A tuple of the message's frame type, text and seq. If the client
+				has disconnected, then the frame type is frames.CLOSE. If the client
+				was handed over to a successor while waiting, then whatever was
+				recieved is forwarded to the successor, and None is returned.
+		"""
+
+		session = self.sessions[client]
+		capture = self.capture
+
+		#: A single recv may hold part of a message, or several messages.
+		while len(session.pending) == 0:
+			data = client.recv(1024)
+
+			#: If this client was handed over to a successor while this
+			#: thread was waiting, then the successor should handle the data,
+			#: unless the handoff failed.
+			if (client, address) in self.handed_off and self.forward_input(client, address, data):
+				return None
+
+			#: An empty recv means that the client has disconnected, or
+			#: that its connection was closed by the server.
+			if len(data) == 0:
+				if capture is not None:
+					capture.record(session.id, frames.CLOSE, "")
+
+				return frames.CLOSE, "", None
+
+			session.feed(data)
+
+		message = session.pending.pop(0)
+
+		if capture is not None:
+			capture.record(session.id, message[0], message[1], message[2])
+
+		return message
+
+	def forward_input(self, client, address, data: bytes):
+		""" self.forward_input(socket, str, bytes)
+
+			Forwards data recieved from a handed over client to the successor.
+
+			Args:
+				client(socket): The client that sent the data.
+				address(str): The client's IP address.
+				data(bytes): The data.
+
+			Returns:
+				False if the handoff failed, and so this server should
+				handle the data after all.
+		"""
+
+		self.handoff_done.wait()
+
+		if (client, address) not in self.handed_off:
+			return False
+
+		#: No data means the successor has closed the connection, so there
+		#: is nothing to forward.
+		if len(data) != 0 and not self.successor.closed:
+			try:
+				self.successor.forward_data(self.handed_off[(client, address)], data)
+			except OSError:
+				traceback.print_exc()
+
+		return True
+
+	def forward_client(self, client, addr):
+		""" self.forward_client(socket, str)
+
+			Forwards a newly connected client to the successor.
+
+			Args:
+				client(socket): The client.
+				addr(str): The client's IP address.
 
-							#: This client is missing, and should be removed.
-							self.close_client(client, address, "missing connection")
+			Returns:
+				False if the handoff failed, and so this server should
+				accept the client after all.
+		"""
 
-					#: Log that the message has been sent to each
-					#: client to the main server.
-					print("Sending message from {} to all".format(message[1]))
-					self.messages.remove(message) #: Remove proccessed message.
+		self.handoff_done.wait()
 
-			else:
+		if not self.draining:
+			return False
 
-				#: If no messages were recieved, wait one second.
-				#: If messages were recieved, then dont wait the
-				#: second, as sending a message to each client may
-				#: have taken time.
-				time.sleep(1)
+		try:
+			if not self.successor.closed:
+				self.successor.forward_client(client, addr)
+		except OSError:
+			traceback.print_exc()
 
+		#: Close this server's copy of the socket. If it was forwarded, then
+		#: the successor's copy keeps the connection open.
+		client.close()
 
-	def get_clients(self):
-		""" self.get_clients
+		return True
 
-			Watches for attempted connections, and gives them a
-			thread to talk over if one is found.
+	def handle_handoff(self):
+		""" self.handle_handoff()
 
+			Adopts the clients handed over by the predecessor. Clients that
+			connect to the predecessor while it drains are adopted straight
+			away, but the handed over sessions are only read from once the
+			predecessor has exited, so that their messages stay in order.
 		"""
 
-		while self.running:
-			#: Wait for a connection to be started. When it is,
-			#: collect its information.
-			try:
-				client, addr = self.server.accept()
+		sessions = {}
+		usernames = {}
 
-			#: OSError will be thrown when self.server.stop
-			#: is run. Catch this error and if the server is
-			#: shutting down (ie self.runnning is False) then
-			#: ignore it and exit, otherwise log the error..
-			except OSError:
-				if not self.running:
-					exit()
-				else:
-					traceback.print_exc()
+		#: Register the handed over sessions, so that they recieve
+		#: messages while the predecessor drains.
+		for record in self.inherited_sessions:
+			client, address, username = record["client"], record["address"], record["username"]
 
-			#: Ignore the connecting port.
-			addr = addr[0]
+			#: Rebuild the session, so that the client carries on in the
+			#: protocol it negotiated with the predecessor.
+			session = protocol.Session(client, address, record["id"], record["version"],
+						   metrics=self.lane_metrics)
+			session.negotiated = record["negotiated"]
+			session.subscribed = record["subscribed"]
+			session.set_options(record["options"])
+			session.seq_out = record["seq_out"]
+			session.seq_in = record["seq_in"]
+			session.reader.buffer = bytearray(record["buffer"])
+			session.pending = record["pending"]
+			session.lag_state = record.get("lag_state", 0)
+			session.missed = record.get("missed", 0)
 
-			#: Set the client's timeout time to the server's set
-			#: timeout.
-			client.settimeout(self._inactivity_timeout)
+			#: Carry on sending what the predecessor had queued, counting
+			#: the time it already waited there.
+			if len(record["outbox"]) != 0:
+				session.queue([message for _, message in record["outbox"]],
+					      [waited for waited, _ in record["outbox"]])
 
-			#: Append this newly connected client to the client list.
-			self.clientlist.append((client, addr))
+			with self.clients_lock:
+				self.admission.add(address)
+				self.clientlist.append((client, address))
+				self.sessions[client] = session
+			self.touch(client, address)
+			self.assign_permissions(address)
 
-			#: If this IP address has not connected before, then
-			#: it's address wont be in any of the permissions
-			#: files. This means that we have to create a user entry
-			#: for them.
-			if addr not in self.permissions.keys():
+			if username is not None:
+				self.set_username(client, address, username)
 
-				#: Change this address's permission level to user
-				self.change_permissions(addr, "user")
+			sessions[session.id] = session
+			usernames[session.id] = username
+
+		#: Keep the handed over session ids unique.
+		if len(sessions) != 0:
+			with self.clients_lock:
+				self.session_ids = itertools.count(max(sessions.keys()) + 1)
+
+		for record in self.predecessor.forwarded():
+
+			if record["type"] == "data":
+				sessions[record["id"]].feed(record["data"])
+
+			elif record["type"] == "client":
+				self.accept_client(record["client"], record["address"])
+
+		self.predecessor.close()
 
-			#: Create a thread to handle messaging from this new client,
-			#: and pass the client and their address to the thread.
-			client_thread = threading.Thread(target=self.manage_client, args=(client, addr))
-			self.client_threads[addr] = client_thread
+		print("Predecessor has exited, adopting {} clients.".format(len(sessions)))
+
+		#: Start reading from the handed over sessions.
+		for session_id, session in sessions.items():
+			client, address = session.client, session.address
+
+			#: The session may have been closed while the predecessor drained.
+			if (client, address) not in self.clientlist:
+				continue
+
+			client_thread = threading.Thread(target=self.manage_client,
+							 args=(client, address, usernames[session_id]))
+			self.client_threads[address] = client_thread
 
 			client_thread.start()
 
@@ -276,84 +1462,151 @@ class chatroomServer:
 		#: Split the command into its arguments
 		command_args = command.split(" ")
 
+		#: Look up the command, which imports its plugin if needed.
+		registered = self.client_command_list.get(command_args[0])
+
 		#: if the command is a valid command
-		if command_args[0] in self.client_command_list.keys():
-			try:
+		if registered is not None:
+
+			#: Get the user's permission level, and the command's
+			#: permission level.
+			client_permissions = self.permissions[address].level
+			func, min_permission, blocking = registered.func, registered.permission, registered.blocking
+
+			#: If the user may not run the command (ie their permission_level is
+			#: less than that of the command) then inform them of that.
+			if client_permissions < min_permission:
+				self.reply(client, "You do not have permission to use that command.", frames.ERROR)
+
+			#: Cheap commands are run straight away.
+			elif not blocking:
+				self.run_command(func, command, client, address, command_args)
+
+			#: Blocking commands are run by the worker pool. The current
+			#: context is copied, so that the reply still references the request.
+			elif not self.command_pool.submit(contextvars.copy_context().run, self.run_command,
+							  func, command, client, address, command_args):
+				self.reply(client, "The server is busy, please try that command again later.", frames.ERROR)
+		else:
+			#: Command was invalid, tell the user.
+			self.reply(client, "{} is not a valid command.".format(command_args[0]), frames.ERROR)
 
-				#: Get the user's permission level, and the command's
-				#: permission level.
-				client_permissions = self.permissions[address].level
-				min_permission = self.client_command_list[command_args[0]][1]
+	def run_command(self, func, command: str, client, address, command_args: list):
+		""" self.run_command(function, str, socket, str, list)
 
-				#: If the user may run this command (ie their permission_level is
-				#: equal to or greater than that of the command) then run the command.
-				if client_permissions >= min_permission:
-					self.client_command_list[command_args[0]][0](self, client, address, command_args)
+			Runs a client command, and tells the client if it failed.
 
-				else:
-					#: If the user may not run the command, then inform them of that.
-					client.send("You do not have permission to use that command.".encode())
+			Args:
+				func(function): The command's function.
+				command(str): The command, as it was sent.
+				client(socket): The client running the command.
+				address(str): The ip of the client.
+				command_args(list): The command, split into its arguments.
+		"""
 
-			except:
-				traceback.print_exc()
-				client.send("{} is not a valid syntax for the command.".format(command).encode())
-		else:
-			#: Command was invalid, tell the user.
-			client.send("{} is not a valid command.".format(command_args[0]).encode())
+		try:
+			func(self, client, address, command_args)
+		except:
+			traceback.print_exc()
+
+			#: The client may have left while the command was waiting.
+			try:
+				self.reply(client, "{} is not a valid syntax for the command.".format(command), frames.ERROR)
+			except OSError:
+				pass
 
-	def manage_client(self, client, address):
-		""" self.manage_client(socket, str)
+	def manage_client(self, client, address, username: str = None):
+		""" self.manage_client(socket, str, str)
 
 			Watches for messages to be recieved from the client.
-			If the client does not send a message before timeout,
-			then close their connection, and remove them from
-			the list of connections.
+			If the client disconnects, then close their connection,
+			and remove them from the list of connections. Timeouts
+			are handled by handle_heartbeats.
 
 			Args:
 				client(socket): The socket to the client.
 				address(str): The client's IP address.
+				username(str): The client's username, if it already has one.
+					       Otherwise the client is asked for one.
 
 		"""
 
-		send_sleep_time = .25
-
 		#: Print to the main server that this user has connected.
 		print("Client connected from {}".format(address))
 
-		while self.running:
+		#: If the client already has a username (ie it was handed over
+		#: by a previous server), then there is no need to ask for one.
+		if username is not None:
+			self.set_username(client, address, username)
+
+		prompt = True
+
+		while self.running and username is None:
 
 			#: try-except in case user quits while prompted to enter a username.
 			try:
 				#: Request a username from the new user.
-				client.send("Enter a username.".encode())
-				usr = client.recv(1024).decode()
+				if prompt:
+					self.send(client, "Enter a username.")
 
-				#: Ensure that a username was given, and that it is not already in the room
-				if usr.lower() not in [s.lower() for s in self.usrs.values()]\
-			   	and len(usr) != 0\
-			   	and usr[0] != '/':
+				prompt = True
+				received = self.receive(client, address)
 
-					#: If the username is valid, assign it to the address
-					self.usrs[address] = usr
+				#: If this client was handed over to a successor while this
+				#: thread was waiting, then the successor handles the message.
+				if received is None:
+					return
+
+				frame_type, usr, _ = received
+
+				if frame_type == frames.CLOSE:
+					self.close_client(client, address, "disconnected")
+					return
+
+				self.touch(client, address)
+
+				#: A response to a ping is not a username, so wait for
+				#: the username without asking again.
+				if frame_type == frames.PONG:
+					prompt = False
+					continue
+
+				#: A client may reclaim its username with a resume token (see
+				#: /token). An unknown token, or any other command, is treated
+				#: as an invalid username.
+				if frame_type == frames.COMMAND:
+					if usr.startswith("resume "):
+						usr = self.resume_tokens.get(usr[len("resume "):].strip(), "")
+					else:
+						usr = ""
+
+				#: Ensure that a username was given, and that it is not already in the room.
+				#: If the username is valid, set_username assigns it to the address.
+				if len(usr) != 0\
+			   	and usr[0] != '/'\
+			   	and self.set_username(client, address, usr):
 
 					#: Inform the user that their name was set.
-					client.send("Username set to {}.".format(usr).encode())
+					self.send(client, "Username set to {}.".format(usr))
 
 					#: Inform all other users of their connections.
-					self.messages.append(("{} has connected.".format(usr), address))
+					self.presence.connected(usr, address)
+
+					#: Give the user any messages sent while they were away.
+					self.deliver_mail(client, usr)
 
 					#: Break from the get-username loop, as  a valid username was given.
 					break
 				else:
 
 					#: Otherwise the username was invalid. Inform the user, and get another username.
-					client.send("Invalid username. Please try again.".encode())
+					self.send(client, "Invalid username. Please try again.", frames.ERROR)
 			except:
-				self.close_client(client, address, "inactivity")
+				self.close_client(client, address, "missing connection")
 				return
 
 		#: Loop while the thread is being watched.
-		while address in self.client_threads.keys() and self.running:
+		while address in self.client_threads and self.running:
 
 			#: Use a try-catch block to tell when the client has
 			#: either timed out, or disconnected.
@@ -361,44 +1614,99 @@ class chatroomServer:
 
 				#: Wait for a message to be recieved from the
 				#: client.
-				msg = client.recv(1024).decode()
+				received = self.receive(client, address)
+
+				#: If this client was handed over to a successor while this
+				#: thread was waiting, then the successor handles the message.
+				if received is None:
+					return
 
-				#: If the message is not blank, and not a command, then append the message
+				frame_type, msg, seq = received
+
+				#: The client has disconnected, or its connection was
+				#: closed by the server.
+				if frame_type == frames.CLOSE:
+					self.close_client(client, address, "disconnected")
+					return
+
+				#: Anything recieved from the client shows that it is active.
+				self.touch(client, address)
+
+				#: If the message is not a command, then append the message
 				#: to the unprocessed messages list, and print to the main
 				#: server that this client has sent a message.
-				if msg == "":
+				if frame_type == frames.PONG or msg == "":
 
-					#: This message is blank, ignore it.
+					#: This is a response to a ping, or is blank, and has
+					#: nothing else to do.
 					continue
 
-				elif msg[0] == "/":
+				elif frame_type == frames.COMMAND:
+
+					#: Replies to the command reference its seq.
+					request = current_request.set(seq)
+
+					try:
+						#: If the client is sending commands too quickly, then
+						#: tell them so rather than running the command.
+						if self.is_throttled("command", client, address):
+							self.reply(client, "You are sending commands too quickly, please slow down.",
+								   frames.ERROR)
+							continue
+
+						#: This message is a command, pass it to handle_commands and continue.
+						self.handle_commands(msg, client, address)
+					finally:
+						current_request.reset(request)
+
+				elif frame_type != frames.CHAT:
+
+					#: Clients may only send chat messages, commands and pongs.
+					self.send(client, "{} messages can not be sent to the server.".format(
+						frames.TYPE_NAMES.get(frame_type, "Unknown")), frames.ERROR)
+
+				elif self.is_throttled("message", client, address):
+
+					#: The client is sending messages too quickly. Drop the message
+					#: and tell them so, in the same way as a throttled command.
+					request = current_request.set(seq)
+
+					try:
+						self.reply(client, "You are sending messages too quickly, please slow down.",
+							   frames.ERROR)
+					finally:
+						current_request.reset(request)
+
+				elif self.is_blocked(msg, client, address):
+
+					#: The message broke a moderation rule, and was not sent.
+					continue
 
-					#: This message is a command, pass it to handle_commands and continue.
-					self.handle_commands(msg[1:], client, address)
 				else:
 
 					#: Valid message, so append it to the unprocessed messages, and send it along.
-					self.messages.append(("({} - {}): {}".format(self.usrs[address], self.permissions[address].permission, msg), address))
+					self.broadcast("({} - {}): {}".format(self.usrs[address], self.permissions[address].permission, msg),
+						       address, frames.CHAT, self.sessions[client].id)
 					print("received message: \'{}\' from {}".format(msg, address))
 
+			#: The client sent something that is not a valid frame, so
+			#: the rest of its stream can not be trusted.
+			except frames.ProtocolError:
+				self.close_client(client, address, "a protocol error")
+				return False
+
 			#: All errors that can be produced will result in the
 			#: client either being forcefully disconnected.
 			except Exception as e:
 
 				traceback.print_exc()
-				self.close_client(client, address, "inactivity")
+				self.close_client(client, address, "missing connection")
 
 				#: End the thread.
 				return False
 
-			finally:
-
-				#: If a message was sent sucessfully, wait one second before
-				#: processing another.
-				time.sleep(send_sleep_time)
-
-	def close_client(self, client, address, reason: str):
-		""" self.close_client(socket, str, str)
+	def close_client(self, client, address, reason: str, wait: bool = True):
+		""" self.close_client(socket, str, str, bool)
 
 			Closes the connection to the passed client, and sends a message
 			to the server that they have.
@@ -407,26 +1715,52 @@ class chatroomServer:
 				client(socket): The client.
 				address(str): The client's IP address
 				reason(str): The reason for the client to be closed.
+				wait(bool): Whether to give the queued messages a moment to
+					    be written first. Clients that are behind, or not
+					    responding, can't be waited for without holding
+					    up the thread removing them (eg the broadcast).
 		"""
 
 		if reason is None or len(reason) == 0:
 			reason = "[NO REASON SPECIFIED]"
 
-		#: Send the shutdown code to the client.
+		#: If the client was already removed (eg its thread noticed the
+		#: disconnect after the server closed it), then there is nothing to do.
+		#: Otherwise mark it as closing, so that it is only closed once.
+		#: A client that was handed over to a successor is its to close.
+		with self.clients_lock:
+			if (client, address) not in self.clientlist or (client, address) in self.closing \
+			   or (client, address) in self.handed_off:
+				return
+
+			self.closing.add((client, address))
+
+		#: Stop the client's inactivity timer.
+		self.timers.cancel((client, address))
+		self.pinged.pop((client, address), None)
+
+		#: Send the shutdown code to the client, and give it a moment to
+		#: be written before the connection is closed.
 		try:
-			client.send("close {}".format(reason).encode())
+			self.send(client, reason, frames.CLOSE)
 		except:
 			#: User is already gone.
 			pass
 
+		session = self.sessions.get(client)
+		if session is not None:
+			session.close(timeout=1 if wait else 0)
+
 		#: Append a message to the unprocess messages that the client
 		#: has disconnected. Only do this if that user didn't
 		#: quit before selecting a username.
-		if address in self.usrs.keys():
-			self.messages.append(("{} Has disconnected.".format(self.usrs[address]), address))
+		username = self.usrs.pop(address, None)
+
+		if username is not None:
+			self.presence.disconnected(username, address)
 
 			#: Remove this user's address from the list of taken names.
-			del self.usrs[address]
+			self.usernames.release(username, client)
 
 		#: Reomve the client from the clients list, and close their
 		#: connection.
@@ -434,14 +1768,84 @@ class chatroomServer:
 
 		#: Stop the client's thread, and remove its entry.
 		#: if they have a thread.
-		if address in self.client_threads.keys():
-			del self.client_threads[address]
+		self.client_threads.pop(address, None)
 
 		#: Remove this client from the list of active clients, and
 		#: close the server's connection to the client.
-		if (client, address) in self.clientlist:
-			self.clientlist.remove((client, address))
+		with self.clients_lock:
+			self.closing.discard((client, address))
+
+			#: The client may have been handed over while it was closing.
+			if (client, address) in self.clientlist:
+				self.clientlist.remove((client, address))
+				self.admission.release(address)
+
+		#: Shutdown the connection before closing it, so that the client's
+		#: thread is woken from recv.
+		try:
+			client.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			#: User is already gone.
+			pass
+
 		client.close()
+		self.sessions.pop(client, None)
+
+		#: Local addresses are never reused, so forget their permissions.
+		if self.is_local(address):
+			with self.permissions_lock:
+				self.permissions.pop(address, None)
+
+		#: Forget this session's rate limits. The IP address's are kept
+		#: until they refill, so that reconnecting doesn't reset them.
+		for limiter in self.session_limits.values():
+			limiter.forget(client)
+
+	def is_throttled(self, kind: str, client, address):
+		""" self.is_throttled(str, socket, str)
+
+			Takes a token from both the client's and the address's bucket
+			for kind of traffic, if both have one to give.
+
+			Args:
+				kind(str): The kind of traffic, either "message" or "command".
+				client(socket): The client that sent the traffic.
+				address(str): The client's IP address.
+
+			Returns:
+				True if the client or its IP address is over its limit.
+		"""
+
+		#: Check both buckets before taking from either, so that a message
+		#: refused by one doesn't use up the other. The session's bucket is
+		#: always locked first.
+		return not self.session_limits[kind].bucket(client).consume(1, self.ip_limits[kind].bucket(address))
+
+	def set_rate_limit(self, kind: str, rate: float, burst: int, per_ip: bool = False):
+		""" self.set_rate_limit(str, float, int, bool)
+
+			Changes how quickly clients may send a kind of traffic.
+
+			Args:
+				kind(str): The kind of traffic, either "message" or "command".
+				rate(float): The number of messages allowed each second.
+				burst(int): The number of messages that can be sent at once.
+				per_ip(bool): If True, change the limit shared by each IP
+					      address rather than the limit for each session.
+
+			Returns:
+				1 if the limit was changed.
+				-1 if the passed kind of traffic is invalid.
+		"""
+
+		limits = self.ip_limits if per_ip else self.session_limits
+
+		if kind not in limits.keys():
+			return -1
+
+		limits[kind].configure(rate, burst)
+
+		return 1
 
 	def change_permissions(self, addr, new_permission):
 		""" change_permissions(str, str)
@@ -462,6 +1866,23 @@ class chatroomServer:
 		if new_permission not in self.permission_types.keys():
 			return -1
 
+		#: Promotions are run on the worker pool, so one client's permission
+		#: may be changed by several threads at once.
+		with self.permissions_lock:
+			return self._change_permissions(addr, new_permission)
+
+	def _change_permissions(self, addr, new_permission):
+		""" Changes the permission level of addr. permissions_lock must be held. """
+
+		#: Local addresses are not saved to the permission files, so only
+		#: update the internal permissions list.
+		if self.is_local(addr):
+			if self.permissions.get(addr) == self.permission_types[new_permission]:
+				return 0
+
+			self.permissions[addr] = self.permission_types[new_permission]
+			return 1
+
 		#: If the passed IP address already has a permission level assosiated with
 		#: them.
 		if addr in self.permissions.keys():
@@ -471,7 +1892,7 @@ class chatroomServer:
 
 			#: If their current permission level is the same as their old one,
 			#: return 0.
-			if cur_permission == new_permission:
+			if cur_permission == self.permission_types[new_permission]:
 				return 0
 
 			else:
@@ -489,6 +1910,69 @@ class chatroomServer:
 		#: Exit success.
 		return 1
 
+	def listen_unix(self, path: str, permission: str = "user"):
+		""" self.listen_unix(str, str)
+
+			Binds a Unix domain socket at path, so that clients on the same
+			machine (eg bots) can connect without going through TCP. This
+			must be called before self.start.
+
+			Args:
+				path(str): The path to bind the socket to.
+				permission(str): The permission level given to local clients.
+
+			Returns:
+				1 if the socket was bound.
+				-1 if the passed permission is invalid.
+		"""
+
+		if permission not in self.permission_types.keys():
+			return -1
+
+		#: Remove a socket left behind by a server that didn't shut down cleanly.
+		if os.path.exists(path):
+			os.unlink(path)
+
+		self.unix_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.unix_server.bind(path)
+
+		self.unix_path = path
+		self.local_permission = permission
+
+		return 1
+
+	def is_local(self, address: str):
+		""" self.is_local(str)
+
+			Returns whether the address belongs to a client connected over
+			the Unix socket, or in the same process over a local
+			MemoryTransport.
+
+			Args:
+				address(str): The client's address.
+		"""
+
+		return address.startswith(("unix:", "memory:"))
+
+	def get_resume_token(self, username: str):
+		""" self.get_resume_token(str):
+
+			Returns a token that can be used to reclaim the passed username
+			after reconnecting, creating one if it has none.
+
+			Args:
+				username(str): The username.
+		"""
+
+		for token, usr in list(self.resume_tokens.items()):
+			if usr == username:
+				return token
+
+		token = secrets.token_hex(8)
+		self.resume_tokens[token] = username
+
+		return token
+
 	def get_ip(self, username):
 		""" self.get_ip(str):
 
@@ -499,13 +1983,135 @@ class chatroomServer:
 
 		"""
 
-		#: Reverse the usrs dictionary so we can lookup usernames against IP addresses,
-		#: and return the IP address.
-		reverse_dict = {}
-		for key, value, in self.usrs.items():
-			reverse_dict[value] = key
+		#: Look the username up in the username index, and return the IP address.
+		return self.usernames[username][1]
+
+	def set_username(self, client, address, username: str):
+		""" self.set_username(socket, str, str)
+
+			Gives a client a username, if no one else has it.
+
+			Args:
+				client(socket): The client.
+				address(str): The client's IP address.
+				username(str): The username.
+
+			Returns:
+				True if the username was set, and False if it is taken.
+		"""
+
+		#: Usernames are unique regardless of case.
+		if not self.usernames.claim(username, client, address):
+			return False
+
+		self.usrs[address] = username
+
+		return True
+
+	def send_presence(self, events: list):
+		""" self.send_presence(list)
+
+			Sends the changes to the user list to the clients that asked
+			for them, with /user_list subscribe. Each change is a line of
+			"+" or "-" followed by the username.
+
+			Args:
+				events(list): The (username, address, connected) events, as
+					      returned by PresenceCoalescer.drain.
+		"""
+
+		if len(events) == 0:
+			return
+
+		changes = "\n".join(("+" if connected else "-") + username for username, _, connected in events)
+
+		for session in list(self.sessions.values()):
+			if not session.subscribed:
+				continue
+
+			try:
+				session.send(frames.PRESENCE, changes)
+			except OSError:
+				#: The client is missing, and will be removed by its thread.
+				pass
+
+	def deliver_mail(self, client, username: str):
+		""" self.deliver_mail(socket, str)
+
+			Sends a user the direct messages that were sent to them while
+			they were not connected, all in a single write.
+
+			Args:
+				client(socket): The user's client.
+				username(str): The user's username.
+		"""
+
+		mail = self.mailboxes.collect(username)
+
+		if len(mail) == 0:
+			return
+
+		messages = [(frames.NOTICE, "You have {} new messages:".format(len(mail)), 0)]
+		messages += [(frames.DIRECT, "(private, {}) {}: {}".format(
+				time.strftime("%Y-%m-%d %H:%M", time.localtime(sent)), sender, message), 0)
+			     for _, sender, message, sent in mail]
+
+		ids = [mail_id for mail_id, _, _, _ in mail]
+
+		def delivered():
+			try:
+				self.mailboxes.discard(ids)
+			except Exception:
+				#: Eg the server stopped, and closed the mailboxes.
+				traceback.print_exc()
+
+		#: Only remove the mail once the writer has written it to the
+		#: client. If it never is, then it is delivered next time.
+		self.sessions[client].send_many(messages, on_written=delivered)
+
+	def direct_message(self, client, address, username: str, msg: str):
+		""" self.direct_message(socket, str, str, str)
+
+			Sends a message from a client straight to one user, without
+			going through the broadcast queue.
+
+			Args:
+				client(socket): The client sending the message.
+				address(str): The sender's IP address.
+				username(str): The username to send the message to.
+				msg(str): The message.
+
+			Returns:
+				1 if the message was delivered.
+				0 if that user is not connected, so the message was put in
+				  their mailbox.
+				-1 if that user is not connected, and the message can't be
+				   kept (eg their mailbox is full, see MailboxStore.add).
+				-2 if the username is reserved (eg "Server"), so can't be
+				   sent messages.
+		"""
+
+		recipient, _ = self.usernames.get(username)
+
+		#: Reserved usernames are held without a client. No one can
+		#: connect with them, so there is no mailbox to keep mail in.
+		if recipient is None and username in self.usernames:
+			return -2
+
+		if recipient is not None:
+			try:
+				self.send(recipient, "(private) {}: {}".format(self.usrs[address], msg),
+					  frames.DIRECT, self.sessions[client].id)
+				return 1
+			except (OSError, KeyError):
+				#: The user left while the message was being sent.
+				pass
+
+		#: Keep the message until the user next connects.
+		if self.mailboxes.add(username, self.usrs[address], msg):
+			return 0
 
-		return reverse_dict[username]
+		return -1
 
 	def send_all(self, msg: str):
 		"""
@@ -517,7 +2123,70 @@ class chatroomServer:
 
 		#: Append the message to the messages list to be later
 		#: processed.
-		self.messages.append(("(server): {}".format(msg), ""))
+		self.broadcast("(server): {}".format(msg), "")
+
+	def broadcast(self, msg: str, address: str, frame_type: int = frames.NOTICE, sender: int = 0):
+		"""
+			Queues a message to be sent to every client by handle_messaging.
+
+			Args:
+				msg(str): The message.
+				address(str): The address of the client the message is from,
+					      or "" for the server.
+				frame_type(int): The type of message, eg frames.CHAT.
+				sender(int): The session id of the client the message is from,
+					     or 0 for the server.
+		"""
+
+		#: Chat is the first thing dropped when the server is low on memory.
+		if frame_type == frames.CHAT and self.memory_budget.stage >= self.memory_budget.DROP:
+			self.memory_budget.record("chat")
+			return
+
+		self.messages.append((msg, address, frame_type, sender))
+		self.messages_ready.set()
+
+	def send(self, client, msg: str, frame_type: int = frames.NOTICE, sender: int = 0, ref: int = None):
+		"""
+			Sends a message to a single client, in whichever protocol the
+			client negotiated.
+
+			Args:
+				client(socket): The client.
+				msg(str): The message.
+				frame_type(int): The type of message, eg frames.ERROR.
+				sender(int): The session id of the client the message is from,
+					     or 0 for the server.
+				ref(int): The seq of the request that the message answers, if any.
+		"""
+
+		session = self.sessions.get(client)
+
+		#: Clients without a session (eg one being forwarded to a
+		#: successor) are spoken to in plain text.
+		if session is None:
+			if isinstance(msg, bytes):
+				msg = msg.decode()
+
+			client.sendall(frames.to_text(frame_type, msg).encode())
+			return
+
+		session.send(frame_type, msg, sender, ref)
+
+	def reply(self, client, msg: str, frame_type: int = frames.REPLY):
+		"""
+			Sends the response to a command to the client that ran it. The
+			response references the command, so that the client can match
+			them up.
+
+			Args:
+				client(socket): The client.
+				msg(str): The response.
+				frame_type(int): frames.REPLY, or frames.ERROR if the command
+						 failed.
+		"""
+
+		self.send(client, msg, frame_type, ref=current_request.get())
 
 if __name__ == "__main__":
 
@@ -540,7 +2209,107 @@ if __name__ == "__main__":
 		             help='The number of seconds for an unresponsive client to be removed')
 
 	parser.add_argument('-c', '--connections', type=int,
-			     help='The maximum number of simultanious connected clients.')
+			     help='The number of connections that may wait to be accepted. '
+				  'See --max-sessions to limit connected clients.')
+
+	#: Add arguments to also listen on a Unix domain socket for local clients.
+	parser.add_argument('--unix', type=str, metavar='PATH',
+			     help='Also listen for local clients on a Unix domain socket at this path.')
+
+	parser.add_argument('--local-permission', type=str, default='user',
+			     help='The permission level given to clients connected with --unix (Default: user).')
+
+	#: Add an argument to take over from a running server, rather than
+	#: starting a new one.
+	parser.add_argument('--inherit', type=str, metavar='PATH',
+			     help='Wait at this Unix socket path for a running server to hand over to '
+				  'this one (run "upgrade PATH" on the running server\'s console).')
+
+	#: Add arguments to set how quickly each client may send messages and commands.
+	parser.add_argument('--message-rate', type=float, nargs=2, metavar=('RATE', 'BURST'),
+			     help='The number of messages each client may send per second, and at once.')
+
+	parser.add_argument('--command-rate', type=float, nargs=2, metavar=('RATE', 'BURST'),
+			     help='The number of commands each client may send per second, and at once.')
+
+	parser.add_argument('--ip-message-rate', type=float, nargs=2, metavar=('RATE', 'BURST'),
+			     help='The number of messages all clients from one IP address may send '
+				  'per second, and at once.')
+
+	parser.add_argument('--ip-command-rate', type=float, nargs=2, metavar=('RATE', 'BURST'),
+			     help='The number of commands all clients from one IP address may send '
+				  'per second, and at once.')
+
+	#: Add an argument to set when connections are announced as a summary.
+	parser.add_argument('--presence-threshold', type=int, metavar='USERS',
+			     help='Announce more than this many users connecting or disconnecting '
+				  'within a second as a single summary (Default: 5).')
+
+	#: Add arguments to set when clients that fall behind are warned about,
+	#: only sent summaries, and disconnected.
+	parser.add_argument('--lag-seconds', type=float, nargs=3, metavar=('WARN', 'DEGRADE', 'DISCONNECT'),
+			     help='How long the oldest message queued for a client may wait before '
+				  'the client is warned about, only sent summaries, or disconnected '
+				  '(Default: 5 15 60).')
+
+	parser.add_argument('--lag-bytes', type=int, nargs=3, metavar=('WARN', 'DEGRADE', 'DISCONNECT'),
+			     help='How many bytes may be queued for a client before it is warned about, '
+				  'only sent summaries, or disconnected (Default: 262144 1048576 4194304).')
+
+	#: Add arguments to encrypt TCP connections.
+	parser.add_argument('--tls-cert', type=str, metavar='PATH',
+			     help='Encrypt TCP connections with TLS, using this certificate (PEM).')
+
+	parser.add_argument('--tls-key', type=str, metavar='PATH',
+			     help='The private key for --tls-cert, if it is not in the same file.')
+
+	#: Add an argument to load the moderation rules from another file.
+	parser.add_argument('--filters', type=str, metavar='PATH',
+			     help='The file of moderation rules that chat is checked against '
+				  '(Default: permissions/filters.rules).')
+
+	#: Add arguments to set where files are shared from, and how large they may be.
+	parser.add_argument('--transfer-port', type=int, metavar='PORT',
+			     help='The port that files are uploaded and downloaded on '
+				  '(Default: any free port, which clients are told about).')
+
+	parser.add_argument('--max-file-size', type=int, metavar='MB',
+			     help='The largest file that may be shared, in megabytes (Default: 64).')
+
+	#: Add arguments to limit the number of sessions, and how quickly
+	#: they are accepted.
+	parser.add_argument('--max-sessions', type=int, metavar='SESSIONS',
+			     help='The most clients that may be connected at once (Default: 1000).')
+
+	parser.add_argument('--max-per-address', type=int, metavar='SESSIONS',
+			     help='The most clients that may connect from one IP address (Default: 16).')
+
+	parser.add_argument('--accept-rate', type=float, nargs=2, metavar=('RATE', 'BURST'),
+			     help='The number of connections accepted per second, and at once '
+				  '(Default: 50 100).')
+
+	#: Add an argument to set how much memory the server may hold messages in.
+	parser.add_argument('--memory-budget', type=int, metavar='MB',
+			     help='The megabytes of messages and sessions the server may hold before it '
+				  'refuses connections, trims history and drops chat (Default: 256).')
+
+	#: Add arguments to set where the server's state, and mail, are saved.
+	parser.add_argument('--snapshot', type=str, metavar='PATH',
+			     help='The file that the server\'s state is saved to, and loaded from when '
+				  'it starts (Default: permissions/server.snapshot).')
+
+	parser.add_argument('--mailboxes', type=str, metavar='PATH',
+			     help='The database that direct messages for users who are not connected '
+				  'are kept in (Default: permissions/mailboxes.db).')
+
+	#: Add an argument to record the traffic, to be replayed later.
+	parser.add_argument('--capture', type=str, metavar='PATH',
+			     help='Record every message that clients send to this file, which can be '
+				  'replayed with "python -m chatroom.capture.replay PATH".')
+
+	#: Add an argument to stop clients from negotiating compression.
+	parser.add_argument('--no-compression', action='store_true',
+			     help='Do not compress messages, even for clients that ask for it.')
 
 	#: Parse the arguments
 	args = parser.parse_args()
@@ -566,6 +2335,81 @@ if __name__ == "__main__":
 	else:
 		connections = args.connections
 
-	#: Create the chatroom server, and listen for connections.
-	chatroomServer(host, port).start(inactivity_timeout=timeout, max_connections=connections)
+	if args.snapshot is None:
+		snapshot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "permissions", "server.snapshot")
+	else:
+		snapshot_path = args.snapshot
+
+	if args.mailboxes is None:
+		mailboxes_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "permissions", "mailboxes.db")
+	else:
+		mailboxes_path = args.mailboxes
+
+	#: Create the chatroom server.
+	server = chatroomServer(host, port, inherit=args.inherit, snapshot_path=snapshot_path,
+				mailboxes_path=mailboxes_path)
+
+	if args.unix is not None:
+		if server.listen_unix(args.unix, args.local_permission) == -1:
+			parser.error("{} is not a valid permission type.".format(args.local_permission))
+
+	if args.presence_threshold is not None:
+		server.presence.threshold = args.presence_threshold
+
+	if args.no_compression:
+		server.protocol_options &= ~frames.OPTION_COMPRESSION
+
+	for state in (server.lag_policy.WARN, server.lag_policy.DEGRADE, server.lag_policy.DISCONNECT):
+		age, size = server.lag_policy.limits[state]
+
+		if args.lag_seconds is not None:
+			age = args.lag_seconds[state - 1]
+		if args.lag_bytes is not None:
+			size = args.lag_bytes[state - 1]
+
+		server.lag_policy.set_limits(state, age, size)
+
+	if args.tls_cert is not None:
+		server.enable_tls(args.tls_cert, args.tls_key)
+	elif args.tls_key is not None:
+		parser.error("--tls-key needs --tls-cert.")
+
+	if args.filters is not None:
+		server.load_filters(args.filters)
+
+	if args.transfer_port is not None:
+		server.transfers.port = args.transfer_port
+
+	if args.max_file_size is not None:
+		server.spool.max_file_size = args.max_file_size * 1024 * 1024
+
+	if args.max_sessions is not None:
+		server.admission.max_sessions = args.max_sessions
+
+	if args.max_per_address is not None:
+		server.admission.max_per_address = args.max_per_address
+
+	if args.accept_rate is not None:
+		server.admission.set_accept_rate(args.accept_rate[0], int(args.accept_rate[1]))
+
+	if args.memory_budget is not None:
+		server.memory_budget.limit = args.memory_budget * 1024 * 1024
+
+	if args.message_rate is not None:
+		server.set_rate_limit("message", args.message_rate[0], int(args.message_rate[1]))
+
+	if args.command_rate is not None:
+		server.set_rate_limit("command", args.command_rate[0], int(args.command_rate[1]))
+
+	if args.ip_message_rate is not None:
+		server.set_rate_limit("message", args.ip_message_rate[0], int(args.ip_message_rate[1]), per_ip=True)
+
+	if args.ip_command_rate is not None:
+		server.set_rate_limit("command", args.ip_command_rate[0], int(args.ip_command_rate[1]), per_ip=True)
+
+	if args.capture is not None:
+		server.start_capture(args.capture)
+
+	#: Listen for connections.
+	server.start(inactivity_timeout=timeout, max_connections=connections)
 
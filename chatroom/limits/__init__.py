@@ -0,0 +1,6 @@
+from .rate_limit import TokenBucket
+from .rate_limit import RateLimiter
+from .rate_limit import consume_all
+from .lag_policy import LagPolicy
+from .memory_budget import MemoryBudget
+from .admission import AdmissionControl
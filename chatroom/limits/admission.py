@@ -0,0 +1,162 @@
+""" PURPOSE:
+
+	Decides whether the server should take on a new connection, before
+	any work (eg reading permission files, or starting a thread) is done
+	for it, so that a flood of connections can't take the server down.
+
+	A connection is refused if its address is denied, if connections are
+	being accepted too quickly, if the server already has max_sessions
+	sessions, or if its address already has max_per_address sessions.
+	These are checked cheapest first.
+"""
+
+import threading
+
+from .rate_limit import TokenBucket
+
+class AdmissionControl:
+	""" CLASS DEFINITION
+
+		The limits on new connections, and a count of sessions for each
+		address.
+
+	"""
+
+	def __init__(self, max_sessions: int = 1000, max_per_address: int = 16,
+		     accept_rate: float = 50, accept_burst: int = 100):
+		""" self.__init__(int, int, float, int)
+
+			Args:
+				max_sessions(int): The most sessions the server may have, or
+						   None for no limit.
+				max_per_address(int): The most sessions each address may
+						      have, or None for no limit.
+				accept_rate(float): The number of connections accepted each
+						    second.
+				accept_burst(int): The number of connections accepted at once.
+		"""
+
+		self.max_sessions = max_sessions
+		self.max_per_address = max_per_address
+		self.accepts = TokenBucket(accept_rate, accept_burst)
+
+		#: Addresses whose connections are always refused.
+		self.denied = set()
+
+		#: Relates addresses to their number of sessions, and the total.
+		self.sessions = {}
+		self.total = 0
+
+		#: The number of connections refused, by reason.
+		self.refused = {"denied": 0, "rate": 0, "sessions": 0, "address": 0}
+
+		self._lock = threading.Lock()
+
+	def set_accept_rate(self, rate: float, burst: int):
+		""" self.set_accept_rate(float, int)
+
+			Changes how quickly connections are accepted.
+
+			Args:
+				rate(float): The number of connections accepted each second.
+				burst(int): The number of connections accepted at once.
+		"""
+
+		self.accepts = TokenBucket(rate, burst)
+
+	def admit(self, address: str):
+		""" self.admit(str)
+
+			Decides whether to accept a connection. Accepted connections are
+			counted once they have a session, with self.add.
+
+			Args:
+				address(str): The connection's address.
+
+			Returns:
+				None if the connection is accepted, otherwise the reason it
+				was refused: "denied", "rate", "sessions" or "address".
+		"""
+
+		if address in self.denied:
+			reason = "denied"
+		elif not self.accepts.consume():
+			reason = "rate"
+		else:
+			reason = self._check(address)
+
+		if reason is not None:
+			with self._lock:
+				self.refused[reason] += 1
+
+		return reason
+
+	def _check(self, address: str):
+		""" Returns the session limit that address would pass, if any. """
+
+		if self.max_sessions is not None and self.total >= self.max_sessions:
+			return "sessions"
+
+		if self.max_per_address is not None and self.sessions.get(address, 0) >= self.max_per_address:
+			return "address"
+
+		return None
+
+	def add(self, address: str):
+		""" self.add(str)
+
+			Counts a new session for address. See self.release.
+		"""
+
+		with self._lock:
+			self.sessions[address] = self.sessions.get(address, 0) + 1
+			self.total += 1
+
+	def release(self, address: str):
+		""" self.release(str)
+
+			Stops counting one of address's sessions, once it has closed.
+		"""
+
+		with self._lock:
+			if address not in self.sessions:
+				return
+
+			self.total -= 1
+			self.sessions[address] -= 1
+
+			if self.sessions[address] == 0:
+				del self.sessions[address]
+
+	def clear(self):
+		""" self.clear()
+
+			Stops counting every session, eg once they are handed over.
+		"""
+
+		with self._lock:
+			self.sessions = {}
+			self.total = 0
+
+	def deny(self, address: str):
+		""" self.deny(str)
+
+			Refuses every future connection from address.
+		"""
+
+		self.denied.add(address)
+
+	def allow(self, address: str):
+		""" self.allow(str)
+
+			Stops refusing connections from address.
+
+			Returns:
+				True if the address was denied.
+		"""
+
+		if address not in self.denied:
+			return False
+
+		self.denied.discard(address)
+		return True
@@ -0,0 +1,90 @@
+""" PURPOSE:
+
+	Decides what to do about clients that can't keep up with the messages
+	sent to them (eg a dead peer, or a client on a slow connection).
+
+	A client's lag is measured by the number of bytes queued for it, and
+	by how long the oldest of them has been waiting. As a client falls
+	further behind, the server:
+
+		WARN		Logs that the client is behind.
+		DEGRADE		Stops sending it chat, and sends a summary of what
+				it missed once it catches up. Notices, command
+				replies and direct messages are still sent.
+		DISCONNECT	Closes its connection.
+
+	Each state is entered when either of its limits is passed. A limit of
+	None is never passed, so a policy can be turned off.
+"""
+
+class LagPolicy:
+	""" CLASS DEFINITION
+
+		The limits for each lag state.
+
+	"""
+
+	#: Lag states, in order of how far behind a client is.
+	OK = 0
+	WARN = 1
+	DEGRADE = 2
+	DISCONNECT = 3
+
+	STATES = ["ok", "warn", "degrade", "disconnect"]
+
+	def __init__(self, warn_age: float = 5, degrade_age: float = 15, disconnect_age: float = 60,
+		     warn_bytes: int = 256 * 1024, degrade_bytes: int = 1024 * 1024,
+		     disconnect_bytes: int = 4 * 1024 * 1024):
+		""" self.__init__(float, float, float, int, int, int)
+
+			Args:
+				warn_age(float): The seconds the oldest queued message may
+						 wait before warning.
+				degrade_age(float): The seconds before chat stops being sent.
+				disconnect_age(float): The seconds before disconnecting.
+				warn_bytes(int): The bytes that may be queued before warning.
+				degrade_bytes(int): The bytes before chat stops being sent.
+				disconnect_bytes(int): The bytes before disconnecting.
+		"""
+
+		#: The (age, bytes) limits of WARN, DEGRADE and DISCONNECT.
+		self.limits = {
+			self.WARN: (warn_age, warn_bytes),
+			self.DEGRADE: (degrade_age, degrade_bytes),
+			self.DISCONNECT: (disconnect_age, disconnect_bytes)
+		}
+
+	def set_limits(self, state: int, age: float = None, size: int = None):
+		""" self.set_limits(int, float, int)
+
+			Changes the limits for a state.
+
+			Args:
+				state(int): WARN, DEGRADE or DISCONNECT.
+				age(float): The seconds limit, or None for no limit.
+				size(int): The bytes limit, or None for no limit.
+		"""
+
+		self.limits[state] = (age, size)
+
+	def assess(self, queued: int, age: float):
+		""" self.assess(int, float)
+
+			Works out how far behind a client is.
+
+			Args:
+				queued(int): The number of bytes queued for the client.
+				age(float): The seconds that the oldest of them has waited.
+
+			Returns:
+				The furthest state whose limits were passed, or OK.
+		"""
+
+		for state in (self.DISCONNECT, self.DEGRADE, self.WARN):
+			age_limit, size_limit = self.limits[state]
+
+			if (age_limit is not None and age > age_limit) or \
+			   (size_limit is not None and queued > size_limit):
+				return state
+
+		return self.OK
@@ -0,0 +1,125 @@
+""" PURPOSE:
+
+	Keeps the memory used by the server's buffers, queues, history and
+	sessions within a budget, so that a burst of traffic can't run the
+	server out of memory.
+
+	The memory used is an estimate, added up from the sizes of the
+	messages being held, along with a fixed overhead for each session
+	(eg its thread's stack). As the estimate nears the budget, the server
+	sheds load in stages:
+
+		REFUSE	New connections are refused.
+		TRIM	The room's history is trimmed, as well as REFUSE.
+		DROP	Chat is dropped rather than queued, as well as TRIM.
+
+	Each stage starts once the estimate passes its fraction of the budget.
+"""
+
+import threading
+
+class MemoryBudget:
+	""" CLASS DEFINITION
+
+		A memory budget, and a record of the load shed to stay within it.
+
+	"""
+
+	#: Load shedding stages, in order.
+	NORMAL = 0
+	REFUSE = 1
+	TRIM = 2
+	DROP = 3
+
+	STAGES = ["normal", "refuse", "trim", "drop"]
+
+	#: The estimated memory used by each session, besides its messages.
+	SESSION_OVERHEAD = 64 * 1024
+
+	def __init__(self, limit: int = 256 * 1024 * 1024, refuse: float = 0.8, trim: float = 0.9,
+		     drop: float = 1.0):
+		""" self.__init__(int, float, float, float)
+
+			Args:
+				limit(int): The budget, in bytes.
+				refuse(float): The fraction of the budget at which new
+					       connections are refused.
+				trim(float): The fraction at which history is trimmed.
+				drop(float): The fraction at which chat is dropped.
+		"""
+
+		self.limit = limit
+		self.thresholds = [(self.DROP, drop), (self.TRIM, trim), (self.REFUSE, refuse)]
+
+		#: The stage that the server is in, and the last estimate.
+		self.stage = self.NORMAL
+		self.usage = {}
+
+		#: The number of times each stage was entered.
+		self.entered = [0] * len(self.STAGES)
+
+		#: The load shed, by kind (eg "connections", "history", "chat").
+		self.shed = {"connections": 0, "history": 0, "chat": 0}
+
+		self._lock = threading.Lock()
+
+	def update(self, usage: dict):
+		""" self.update(dict)
+
+			Works out the stage from a new estimate.
+
+			Args:
+				usage(dict): Relates what memory is used by (eg "history")
+					     to the estimated number of bytes.
+
+			Returns:
+				The new stage.
+		"""
+
+		total = sum(usage.values())
+		stage = self.NORMAL
+
+		for candidate, fraction in self.thresholds:
+			if total >= self.limit * fraction:
+				stage = candidate
+				break
+
+		with self._lock:
+			if stage > self.stage:
+				for passed in range(self.stage + 1, stage + 1):
+					self.entered[passed] += 1
+
+			self.stage = stage
+			self.usage = usage
+
+		return stage
+
+	def record(self, kind: str, amount: int = 1):
+		""" self.record(str, int)
+
+			Records load being shed.
+
+			Args:
+				kind(str): What was shed, eg "connections".
+				amount(int): How much of it.
+		"""
+
+		with self._lock:
+			self.shed[kind] = self.shed.get(kind, 0) + amount
+
+	def summary(self):
+		""" self.summary()
+
+			Returns a dictionary of the budget, the estimated usage, the
+			current stage's name, how many times each stage was entered,
+			and the load shed.
+		"""
+
+		with self._lock:
+			return {
+				"limit": self.limit,
+				"usage": dict(self.usage),
+				"stage": self.STAGES[self.stage],
+				"entered": dict(zip(self.STAGES, self.entered)),
+				"shed": dict(self.shed)
+			}
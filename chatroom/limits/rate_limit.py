@@ -0,0 +1,230 @@
+""" PURPOSE:
+
+	Token buckets used by the server to limit how quickly clients may
+	send messages and commands.
+
+	Each bucket holds up to [burst] tokens, and is refilled at [rate]
+	tokens per second. Every message consumes one token, so a client may
+	send [burst] messages at once, and [rate] messages per second after
+	that. A message that arrives to an empty bucket is refused rather than
+	delayed, so well behaved clients never wait.
+"""
+
+import contextlib
+import threading
+import time
+
+class TokenBucket:
+	""" CLASS DEFINITION
+
+		A single token bucket.
+
+	"""
+
+	def __init__(self, rate: float, burst: int):
+		""" self.__init__(float, int)
+
+			Creates a full bucket.
+
+			Args:
+				rate(float): The number of tokens regained each second.
+				burst(int): The maximum number of tokens the bucket can hold.
+		"""
+
+		self.rate = rate
+		self.burst = burst
+
+		#: Start with a full bucket so that a newly connected client
+		#: is not throttled.
+		self.tokens = float(burst)
+		self.last_refill = time.monotonic()
+
+		#: Buckets are shared between every session from one IP address,
+		#: so they may be used from multiple threads at once.
+		self._lock = threading.Lock()
+
+	def consume(self, amount: int = 1, *others):
+		""" self.consume(int, *TokenBucket):
+
+			Attempts to take amount tokens from the bucket, and from each
+			of others (see consume_all).
+
+			Args:
+				amount(int): The number of tokens to take.
+				others(TokenBucket): Buckets that must also have amount
+						     tokens to give.
+
+			Returns:
+				True if there were enough tokens, otherwise False.
+		"""
+
+		return consume_all([self, *others], amount)
+
+	def _refill(self):
+		""" Refills the bucket for the time that has passed since it was
+		    last used, up to its burst size. The caller holds self._lock.
+		"""
+
+		now = time.monotonic()
+		self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+		self.last_refill = now
+
+	def is_full(self):
+		""" Returns whether the bucket has refilled to its burst size. """
+
+		with self._lock:
+			return self.tokens + (time.monotonic() - self.last_refill) * self.rate >= self.burst
+
+def consume_all(buckets: list, amount: int = 1):
+	""" consume_all(list, int)
+
+		Takes amount tokens from every bucket, but only if each of them
+		has enough. A refusal from one bucket then doesn't use up the
+		tokens of the others (eg a session's when its IP address is over
+		its limit).
+
+		Args:
+			buckets(list): The buckets. Callers must pass shared buckets
+				       in the same order, so that their locks are
+				       always taken in that order.
+			amount(int): The number of tokens to take from each.
+
+		Returns:
+			True if every bucket had enough tokens, otherwise False.
+	"""
+
+	with contextlib.ExitStack() as stack:
+		for bucket in buckets:
+			stack.enter_context(bucket._lock)
+			bucket._refill()
+
+		if any(bucket.tokens < amount for bucket in buckets):
+			return False
+
+		for bucket in buckets:
+			bucket.tokens -= amount
+
+		return True
+
+class RateLimiter:
+	""" CLASS DEFINITION
+
+		A collection of token buckets, one for each key (eg a session
+		or an IP address), that all share the same rate and burst.
+
+	"""
+
+	def __init__(self, rate: float, burst: int):
+		""" self.__init__(float, int)
+
+			Args:
+				rate(float): The number of tokens regained each second.
+				burst(int): The maximum number of tokens each bucket can hold.
+		"""
+
+		self.rate = rate
+		self.burst = burst
+
+		#: A dictionary relating keys to their buckets.
+		self.buckets = {}
+
+		self._lock = threading.Lock()
+
+	def allow(self, key, amount: int = 1):
+		""" self.allow(object, int):
+
+			Takes amount tokens from key's bucket, creating the bucket
+			if key has not been seen before.
+
+			Args:
+				key(object): What is being limited.
+				amount(int): The number of tokens to take.
+
+			Returns:
+				True if key is within its limit, otherwise False.
+		"""
+
+		return self.bucket(key).consume(amount)
+
+	def bucket(self, key):
+		""" self.bucket(object):
+
+			Gets key's bucket, creating it if key has not been seen before.
+
+			Args:
+				key(object): What is being limited.
+
+			Returns:
+				The TokenBucket for key.
+		"""
+
+		#: Every message a client sends is checked here, so only take the
+		#: limiter's lock to create a bucket. Looking up an existing bucket
+		#: is a single dict read, which is atomic without the lock.
+		bucket = self.buckets.get(key)
+
+		if bucket is None:
+			with self._lock:
+				bucket = self.buckets.setdefault(key, TokenBucket(self.rate, self.burst))
+
+		return bucket
+
+	def configure(self, rate: float, burst: int):
+		""" self.configure(float, int):
+
+			Changes the rate and burst of every current and future bucket.
+
+			Args:
+				rate(float): The number of tokens regained each second.
+				burst(int): The maximum number of tokens each bucket can hold.
+		"""
+
+		with self._lock:
+			self.rate = rate
+			self.burst = burst
+
+			for bucket in self.buckets.values():
+				with bucket._lock:
+					bucket.rate = rate
+					bucket.burst = burst
+					bucket.tokens = min(bucket.tokens, burst)
+
+	def forget(self, key):
+		""" self.forget(object):
+
+			Removes key's bucket, if it has one.
+
+			Args:
+				key(object): The key to forget.
+		"""
+
+		with self._lock:
+			self.buckets.pop(key, None)
+
+	def expire(self, max_idle: float = None):
+		""" self.expire(float):
+
+			Removes the buckets that have refilled, as a new bucket would
+			be the same. Buckets are kept until then even if their key goes
+			away (eg every session from an IP address closes), so that
+			reconnecting does not give a fresh burst.
+
+			Args:
+				max_idle(float): Also remove buckets that have not been used
+						 for this many seconds, eg for a rate of 0,
+						 where buckets never refill.
+
+			Returns:
+				The number of buckets removed.
+		"""
+
+		now = time.monotonic()
+
+		with self._lock:
+			expired = [key for key, bucket in self.buckets.items()
+				   if bucket.is_full() or (max_idle is not None and now - bucket.last_refill >= max_idle)]
+
+			for key in expired:
+				del self.buckets[key]
+
+		return len(expired)
@@ -0,0 +1 @@
+from .mailbox_store import MailboxStore
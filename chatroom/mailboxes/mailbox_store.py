@@ -0,0 +1,140 @@
+""" PURPOSE:
+
+	Keeps direct messages sent to users who are not connected, so that
+	they can be delivered when the user next connects.
+
+	Messages are kept in a SQLite database, so that they survive the
+	server restarting, and can be shared with a successor during a hot
+	upgrade. Each user's mailbox holds at most max_messages messages, and
+	messages older than max_age seconds are thrown away, so that mail for
+	users who never come back doesn't build up forever. As anyone can be
+	sent mail, whether or not they exist, each user may also only have
+	max_sent messages waiting, and every mailbox together max_total.
+"""
+
+import sqlite3
+import threading
+import time
+
+class MailboxStore:
+	""" CLASS DEFINITION
+
+		The mailboxes of every user.
+
+	"""
+
+	def __init__(self, path: str, max_messages: int = 50, max_age: float = 7 * 24 * 60 * 60,
+		     max_sent: int = 100, max_total: int = 100000):
+		""" self.__init__(str, int, float, int, int)
+
+			Opens the mailboxes stored at path, creating them if needed.
+
+			Args:
+				path(str): The database file, or ":memory:".
+				max_messages(int): The most messages a single mailbox can hold.
+				max_age(float): The number of seconds a message is kept for.
+				max_sent(int): The most messages from one sender that can be
+					       waiting, across every mailbox.
+				max_total(int): The most messages every mailbox can hold.
+		"""
+
+		self.path = path
+		self.max_messages = max_messages
+		self.max_age = max_age
+		self.max_sent = max_sent
+		self.max_total = max_total
+
+		#: The connection is shared by every client thread, so it is locked.
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(path, check_same_thread=False)
+
+		with self._lock, self._db:
+			self._db.execute("""CREATE TABLE IF NOT EXISTS mail (
+						id INTEGER PRIMARY KEY,
+						recipient TEXT NOT NULL,
+						sender TEXT NOT NULL,
+						message TEXT NOT NULL,
+						sent REAL NOT NULL
+					    )""")
+			self._db.execute("CREATE INDEX IF NOT EXISTS mail_recipient ON mail (recipient, id)")
+			self._db.execute("CREATE INDEX IF NOT EXISTS mail_sender ON mail (sender)")
+
+	def add(self, recipient: str, sender: str, message: str):
+		""" self.add(str, str, str)
+
+			Puts a message in a user's mailbox.
+
+			Args:
+				recipient(str): The username the message is for.
+				sender(str): The username of the sender.
+				message(str): The message.
+
+			Returns:
+				True if the message was stored, and False if the mailbox is
+				full, the sender has too many messages waiting, or every
+				mailbox together is full.
+		"""
+
+		now = time.time()
+
+		with self._lock, self._db:
+
+			#: Throw away expired mail first, so that it doesn't count
+			#: towards the mailbox being full.
+			self._db.execute("DELETE FROM mail WHERE sent < ?", (now - self.max_age,))
+
+			count = self._db.execute("SELECT COUNT(*) FROM mail WHERE recipient = ?",
+						 (recipient.lower(),)).fetchone()[0]
+
+			if count >= self.max_messages:
+				return False
+
+			sent = self._db.execute("SELECT COUNT(*) FROM mail WHERE sender = ?", (sender,)).fetchone()[0]
+
+			if sent >= self.max_sent:
+				return False
+
+			if self._db.execute("SELECT COUNT(*) FROM mail").fetchone()[0] >= self.max_total:
+				return False
+
+			self._db.execute("INSERT INTO mail (recipient, sender, message, sent) VALUES (?, ?, ?, ?)",
+					 (recipient.lower(), sender, message, now))
+
+		return True
+
+	def collect(self, recipient: str):
+		""" self.collect(str)
+
+			Gets the messages waiting in a user's mailbox, oldest first. They
+			stay in the mailbox until passed to self.discard, so that they
+			are not lost if they can't be delivered.
+
+			Args:
+				recipient(str): The username.
+
+			Returns:
+				A list of (id, sender, message, time sent) tuples.
+		"""
+
+		with self._lock:
+			return self._db.execute("SELECT id, sender, message, sent FROM mail "
+						"WHERE recipient = ? AND sent >= ? ORDER BY id",
+						(recipient.lower(), time.time() - self.max_age)).fetchall()
+
+	def discard(self, ids: list):
+		""" self.discard(list)
+
+			Removes delivered messages from their mailboxes.
+
+			Args:
+				ids(list): The ids of the messages, as returned by self.collect.
+		"""
+
+		with self._lock, self._db:
+			self._db.executemany("DELETE FROM mail WHERE id = ?", [(i,) for i in ids])
+
+	def close(self):
+		""" Closes the database. """
+
+		with self._lock:
+			self._db.close()
@@ -1 +1,2 @@
+from .permissions import Permissions
 from .server_permissions import permission_types
@@ -1,12 +1,21 @@
 import os
+import tempfile
+import threading
 
 class Permissions:
 	""" A class to contain basic information and functions
 	    surrounding every permission type.
 	"""
 
-	def __init__(self, name: str, permission_level: int):
-		""" Initializes the permission """
+	def __init__(self, name: str, permission_level: int, directory: str = None):
+		""" Initializes the permission
+
+			Args:
+				name(str): The permission's name.
+				permission_level(int): The permission's level.
+				directory(str): Where the permission file is kept. Defaults
+						to this package's directory.
+		"""
 
 		#: Sets the permission's name
 		self.permission = name.lower()
@@ -14,9 +23,15 @@ class Permissions:
 		#: Set the permission's permission level.
 		self.level = permission_level
 
-		#: Get the current working directory.
-		self.permission_file = os.path.join(os.path.dirname(__file__),
-							name.lower() + "s.perm")
+		#: Held while changing the permission file, as clients may be
+		#: promoted from several threads at once.
+		self._lock = threading.Lock()
+
+		#: Get the directory of the permission file.
+		if directory is None:
+			directory = os.path.dirname(__file__)
+
+		self.permission_file = os.path.join(directory, name.lower() + "s.perm")
 
 		#: Set the filename for the permissions file.
 #		if "permissions" not in cur_path:
@@ -59,8 +74,9 @@ class Permissions:
 				address(str): The IP address of the client.
 		"""
 
-		with open(self.permission_file, 'a+') as p_file:
-			p_file.write(str(address) + '\n')
+		with self._lock:
+			with open(self.permission_file, 'a+') as p_file:
+				p_file.write(str(address) + '\n')
 
 
 	def remove_client(self, address):
@@ -73,23 +89,30 @@ class Permissions:
 
 		"""
 
-		import os
-
-		#: Unassosiate this IP address with its old permission level
-		#: by removing it from its old permission level's file.
-		with open(self.permission_file, 'r') as p_file:
-
-			#: Create a temp file to reconstruct the file without the
-			#: IP address in it.
-			with open("__temp_permission_file__.perm", 'w+') as n_file:
-				for line in p_file:
-
-					#: If this is not the IP address whose permission is
-					#: changing, then write this IP address to the temp file.
-					if line.strip() != address.strip():
-						n_file.write(line)
-
-		#: Replace the old permission file with the temp file, as the temp file
-		#: is exactly the same, but missing the IP address whose permission level
-		#: is chaning.
-		os.rename("__temp_permission_file__.perm", self.permission_file)
+		with self._lock:
+
+			#: Unassosiate this IP address with its old permission level
+			#: by removing it from its old permission level's file.
+			with open(self.permission_file, 'r') as p_file:
+
+				#: Create a temp file, next to the permission file, to reconstruct
+				#: the file without the IP address in it.
+				with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.permission_file),
+								 prefix=self.permission + ".", suffix=".tmp",
+								 delete=False) as n_file:
+					try:
+						for line in p_file:
+
+							#: If this is not the IP address whose permission is
+							#: changing, then write this IP address to the temp file.
+							if line.strip() != address.strip():
+								n_file.write(line)
+					except:
+						n_file.close()
+						os.unlink(n_file.name)
+						raise
+
+			#: Replace the old permission file with the temp file, as the temp file
+			#: is exactly the same, but missing the IP address whose permission level
+			#: is chaning.
+			os.replace(n_file.name, self.permission_file)
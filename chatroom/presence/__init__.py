@@ -0,0 +1,2 @@
+from .coalescer import PresenceCoalescer
+from .user_index import UserIndex
@@ -0,0 +1,151 @@
+""" PURPOSE:
+
+	Collects users connecting and disconnecting, so that a burst of them
+	(eg everyone reconnecting after the server restarts) is announced to
+	the room as a single summary, rather than as one message per user.
+
+	Events are held for window seconds. If more than threshold users
+	connected or disconnected in that time, then one summary is sent,
+	otherwise each user gets their own message as before. A user who
+	disconnects and reconnects within the window (eg a network blip) is
+	not announced at all.
+"""
+
+import threading
+import time
+
+class PresenceCoalescer:
+	""" CLASS DEFINITION
+
+		Collects presence events, and turns them into announcements.
+
+	"""
+
+	def __init__(self, window: float = 1, threshold: int = 5):
+		""" self.__init__(float, int)
+
+			Args:
+				window(float): The number of seconds that events are held for.
+				threshold(int): The most users that are announced one by one.
+		"""
+
+		self.window = window
+		self.threshold = threshold
+
+		#: The net change for each user since the last flush, keyed by the
+		#: lowercase username. Holds (username, address, connected).
+		self._events = {}
+
+		#: When the oldest event being held happened.
+		self._first = None
+
+		self._lock = threading.Lock()
+
+	def connected(self, username: str, address: str):
+		""" self.connected(str, str)
+
+			Records a user connecting.
+
+			Args:
+				username(str): The user's username.
+				address(str): The user's address.
+		"""
+
+		self._record(username, address, True)
+
+	def disconnected(self, username: str, address: str):
+		""" self.disconnected(str, str)
+
+			Records a user disconnecting.
+
+			Args:
+				username(str): The user's username.
+				address(str): The user's address.
+		"""
+
+		self._record(username, address, False)
+
+	def _record(self, username: str, address: str, connected: bool):
+		""" Records a presence event, cancelling out the opposite event. """
+
+		with self._lock:
+			if self._first is None:
+				self._first = time.monotonic()
+
+			previous = self._events.pop(username.lower(), None)
+
+			#: Connecting after disconnecting (or the other way around) in
+			#: the same window leaves the user where they started.
+			if previous is None or previous[2] == connected:
+				self._events[username.lower()] = (username, address, connected)
+
+	def flush(self, force: bool = False):
+		""" self.flush(bool)
+
+			Turns the events held for at least window seconds into
+			announcements. See self.drain and self.announce.
+
+			Returns:
+				A list of (message, address) to broadcast.
+		"""
+
+		return self.announce(self.drain(force))
+
+	def drain(self, force: bool = False):
+		""" self.drain(bool)
+
+			Takes the events that have been held for at least window seconds.
+
+			Args:
+				force(bool): If True then every event is taken, no matter
+					     how long it has been held.
+
+			Returns:
+				A list of (username, address, connected), with one event for
+				each user whose presence changed.
+		"""
+
+		with self._lock:
+			if self._first is None:
+				return []
+
+			if not force and time.monotonic() - self._first < self.window:
+				return []
+
+			events = list(self._events.values())
+			self._events = {}
+			self._first = None
+
+		return events
+
+	def announce(self, events: list):
+		""" self.announce(list)
+
+			Turns events into announcements.
+
+			Args:
+				events(list): The events, as returned by self.drain.
+
+			Returns:
+				A list of (message, address) to broadcast. The address is
+				that of the user the message is about, or "" for a summary.
+		"""
+
+		if len(events) == 0:
+			return []
+
+		if len(events) <= self.threshold:
+			return [("{} has connected.".format(username) if connected
+				 else "{} Has disconnected.".format(username), address)
+				for username, address, connected in events]
+
+		joined = sum(1 for _, _, connected in events if connected)
+		left = len(events) - joined
+
+		parts = []
+		if joined != 0:
+			parts.append("{} users have connected".format(joined))
+		if left != 0:
+			parts.append("{} users have disconnected".format(left))
+
+		return [(" and ".join(parts) + ".", "")]
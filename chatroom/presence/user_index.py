@@ -0,0 +1,156 @@
+""" PURPOSE:
+
+	An index of connected users, kept sorted by username, so that a user
+	can be found from their username without searching every client, and
+	so that the user list can be sent a page at a time.
+
+	Usernames are unique regardless of case, so the index is keyed by the
+	lowercase username.
+"""
+
+import bisect
+import threading
+
+class UserIndex:
+	""" CLASS DEFINITION
+
+		A sorted index of usernames.
+
+	"""
+
+	def __init__(self):
+		""" Creates an empty index. """
+
+		#: Relates lowercase usernames to (username, client, address).
+		self._users = {}
+
+		#: The lowercase usernames, in order.
+		self._sorted = []
+
+		self._lock = threading.Lock()
+
+	def claim(self, username: str, client, address: str):
+		""" self.claim(str, socket, str)
+
+			Adds a user, if no one else has their username.
+
+			Args:
+				username(str): The username.
+				client(socket): The user's client.
+				address(str): The user's address.
+
+			Returns:
+				True if the username was added, and False if it is taken.
+		"""
+
+		key = username.lower()
+
+		with self._lock:
+			if key in self._users:
+				return False
+
+			self._users[key] = (username, client, address)
+			bisect.insort(self._sorted, key)
+
+		return True
+
+	def release(self, username: str, client):
+		""" self.release(str, socket)
+
+			Removes a user, if the username still belongs to their client.
+
+			Args:
+				username(str): The username.
+				client(socket): The user's client.
+		"""
+
+		key = username.lower()
+
+		with self._lock:
+			if self._users.get(key, (None, None))[1] is not client:
+				return
+
+			del self._users[key]
+			del self._sorted[bisect.bisect_left(self._sorted, key)]
+
+	def get(self, username: str, default=(None, None)):
+		""" self.get(str, tuple)
+
+			Finds a user.
+
+			Args:
+				username(str): The username, in any case.
+				default: Returned if there is no such user.
+
+			Returns:
+				The user's (client, address), or default.
+		"""
+
+		user = self._users.get(username.lower())
+		return user[1:] if user is not None else default
+
+	def page(self, number: int, size: int = 20, prefix: str = ""):
+		""" self.page(int, int, str)
+
+			Gets a page of usernames, in order.
+
+			Args:
+				number(int): The page number, starting at 1.
+				size(int): The number of usernames on each page.
+				prefix(str): Only usernames starting with this, in any case,
+					     are listed.
+
+			Returns:
+				A tuple of the usernames on the page, and the number of
+				usernames across every page.
+		"""
+
+		prefix = prefix.lower()
+
+		with self._lock:
+
+			#: The usernames starting with prefix are next to each other.
+			first = bisect.bisect_left(self._sorted, prefix)
+			last = bisect.bisect_left(self._sorted, prefix + "\U0010ffff") if prefix else len(self._sorted)
+
+			start = first + (number - 1) * size
+			keys = self._sorted[start:min(start + size, last)] if number > 0 else []
+
+			return [self._users[key][0] for key in keys], last - first
+
+	def after(self, username: str, size: int = 20):
+		""" self.after(str, int)
+
+			Gets the usernames that come after username, in order. Unlike
+			pages, these don't shift when users before them leave, so every
+			user can be listed by starting each call after the last
+			username of the one before.
+
+			Args:
+				username(str): The username to start after, in any case, or
+					       "" to start at the beginning.
+				size(int): The most usernames to get.
+
+			Returns:
+				A tuple of the usernames, and the number of usernames after them.
+		"""
+
+		with self._lock:
+			start = bisect.bisect_right(self._sorted, username.lower())
+			keys = self._sorted[start:start + size]
+
+			return [self._users[key][0] for key in keys], len(self._sorted) - start - len(keys)
+
+	def __contains__(self, username: str):
+		return username.lower() in self._users
+
+	def __getitem__(self, username: str):
+		user = self._users.get(username.lower())
+
+		if user is None:
+			raise KeyError(username)
+
+		return user[1:]
+
+	def __len__(self):
+		return len(self._users)
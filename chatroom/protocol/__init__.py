@@ -0,0 +1,12 @@
+from . import frames
+from . import compression
+from . import outbox
+from . import tls
+from .frames import Frame
+from .frames import FrameReader
+from .frames import ProtocolError
+from .session import Session
+from .compression import StreamCompressor
+from .compression import StreamDecompressor
+from .outbox import Outbox
+from .outbox import LaneMetrics
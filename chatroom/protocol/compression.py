@@ -0,0 +1,110 @@
+""" PURPOSE:
+
+	Streaming compression of frame payloads.
+
+	A connection that negotiated compression keeps a single zlib stream
+	for the frames the server sends, flushed after every frame, so that
+	each frame can be decompressed as soon as it arrives while repeated
+	text (eg usernames and command output) is compressed against
+	everything sent before it.
+
+	Payloads shorter than THRESHOLD are sent raw, as compressing them
+	costs more time than it saves. The first compressed frame of a
+	stream is flagged with FLAG_RESET, so that the reader starts a new
+	stream too, eg after the client was handed over to a new server.
+"""
+
+import zlib
+
+from . import frames
+
+#: Payloads shorter than this, in bytes, are not compressed.
+THRESHOLD = 128
+
+class StreamCompressor:
+	""" CLASS DEFINITION
+
+		Compresses the payloads sent over a single connection.
+
+	"""
+
+	def __init__(self, threshold: int = THRESHOLD, level: int = 6):
+		""" self.__init__(int, int)
+
+			Args:
+				threshold(int): Payloads shorter than this are sent raw.
+				level(int): The zlib compression level, from 1 to 9.
+		"""
+
+		self.threshold = threshold
+		self._compressor = zlib.compressobj(level)
+
+		#: Set until the first payload is compressed.
+		self._reset = True
+
+	def compress(self, payload: bytes):
+		""" self.compress(bytes)
+
+			Compresses a payload, if it is long enough to be worth it.
+
+			Args:
+				payload(bytes): The payload.
+
+			Returns:
+				A tuple of the frame flags and the payload to send.
+		"""
+
+		if len(payload) < self.threshold:
+			return 0, payload
+
+		flags = frames.FLAG_COMPRESSED
+
+		if self._reset:
+			self._reset = False
+			flags |= frames.FLAG_RESET
+
+		#: A sync flush ends the frame on a byte boundary, without ending
+		#: the stream, so later frames can refer back to this one.
+		return flags, self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+class StreamDecompressor:
+	""" CLASS DEFINITION
+
+		Decompresses the payloads recieved over a single connection.
+
+	"""
+
+	def __init__(self):
+		""" Creates a decompressor, ready for a new stream. """
+		self._decompressor = zlib.decompressobj()
+
+	def decompress(self, flags: int, payload: bytes):
+		""" self.decompress(int, bytes)
+
+			Decompresses a payload, if its flags say that it is compressed.
+
+			Args:
+				flags(int): The frame's flags.
+				payload(bytes): The frame's payload.
+
+			Returns:
+				The original payload.
+		"""
+
+		if not flags & frames.FLAG_COMPRESSED:
+			return payload
+
+		if flags & frames.FLAG_RESET:
+			self._decompressor = zlib.decompressobj()
+
+		try:
+			#: Limit the output, so that a small frame can't expand
+			#: into more memory than a raw frame could use.
+			data = self._decompressor.decompress(payload, frames.MAX_PAYLOAD)
+		except zlib.error as e:
+			raise frames.ProtocolError("Invalid compressed payload: {}".format(e))
+
+		if len(self._decompressor.unconsumed_tail) != 0:
+			raise frames.ProtocolError("Compressed payload is too large.")
+
+		return data
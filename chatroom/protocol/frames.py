@@ -0,0 +1,238 @@
+""" PURPOSE:
+
+	The binary wire protocol used between the server and clients.
+
+	Every frame starts with a fixed size header, followed by its payload:
+
+		type(1 byte)      What the frame is, eg CHAT or CLOSE.
+		flags(1 byte)     Options that change the payload, eg FLAG_COMPRESSED.
+		seq(4 bytes)      The sender's sequence number for this frame.
+		sender(4 bytes)   The session id of the client that the frame is
+				  from, or 0 for the server.
+		length(4 bytes)   The length of the payload, in bytes.
+
+	All numbers are big endian, and payloads are UTF-8 text.
+
+	A frame with FLAG_REF set is the response to a request. Its payload
+	starts with the seq(4 bytes) of the COMMAND frame that it answers, so
+	that a client can send many commands without waiting, and still tell
+	which response is which.
+
+   NEGOTIATION:
+
+	A client that supports frames sends HELLO followed by the highest
+	version it supports, as soon as it connects. The server responds with
+	HELLO and the version that will be used, and every message after that
+	is a frame. A client that does not send HELLO is spoken to in plain
+	text, as before, so older clients keep working.
+
+	From version 2, the version byte is followed by a byte of OPTION_
+	bits that the client would like to use, and the server responds with
+	the options that it accepted.
+"""
+
+import collections
+import struct
+
+#: The highest version of the protocol supported.
+VERSION = 2
+
+#: Sent, followed by a version byte, to negotiate the protocol.
+HELLO = b"\x00CRP"
+
+#: Frame types.
+CHAT = 1	#: A chat message, sent to or from the room.
+NOTICE = 2	#: A message from the server, eg a user connecting.
+REPLY = 3	#: The response to a command.
+ERROR = 4	#: An error, eg an invalid command.
+CLOSE = 5	#: The connection is being closed. The payload is the reason.
+PING = 6	#: Sent by the server to check that a quiet client is still there.
+PONG = 7	#: The response to a PING.
+COMMAND = 8	#: A command, without its leading "/".
+DIRECT = 9	#: A message sent to a single user, eg with /msg.
+PRESENCE = 10	#: Changes to the user list. Each line is "+" or "-" and a username.
+
+#: Frame flags.
+FLAG_COMPRESSED = 0x01	#: The payload is part of the connection's zlib stream.
+FLAG_RESET = 0x02	#: The zlib stream starts again with this payload.
+FLAG_REF = 0x04		#: The payload starts with the seq of the request being answered.
+
+#: Options that can be negotiated, from version 2.
+OPTION_COMPRESSION = 0x01	#: The server compresses large payloads.
+
+#: The options supported.
+OPTIONS = OPTION_COMPRESSION
+
+#: The names of each frame type, for logging.
+TYPE_NAMES = {
+	CHAT: "chat", NOTICE: "notice", REPLY: "reply", ERROR: "error",
+	CLOSE: "close", PING: "ping", PONG: "pong", COMMAND: "command",
+	DIRECT: "direct", PRESENCE: "presence"
+}
+
+HEADER = struct.Struct("!BBIII")
+
+#: The seq of the request being answered, see FLAG_REF.
+REF = struct.Struct("!I")
+
+#: The largest payload that will be accepted, so that a bad length can't
+#: make the reader buffer forever.
+MAX_PAYLOAD = 1 << 20
+
+#: ref is the seq of the request that the frame answers, or None.
+Frame = collections.namedtuple("Frame", ["type", "flags", "seq", "sender", "payload", "ref"],
+			       defaults=[None])
+
+class ProtocolError(ValueError):
+	""" Raised when a peer sends something that is not a valid frame. """
+
+def encode_frame(frame_type: int, seq: int, sender: int, payload: bytes, flags: int = 0,
+		 ref: int = None):
+	""" encode_frame(int, int, int, bytes, int, int)
+
+		Encodes a single frame.
+
+		Args:
+			frame_type(int): The type of frame, eg CHAT.
+			seq(int): The sender's sequence number for this frame.
+			sender(int): The session id of the sender, or 0 for the server.
+			payload(bytes): The frame's payload.
+			flags(int): The frame's flags.
+			ref(int): The seq of the request that this frame answers, if any.
+
+		Returns:
+			The encoded frame.
+	"""
+
+	if ref is not None:
+		flags |= FLAG_REF
+		payload = REF.pack(ref & 0xFFFFFFFF) + payload
+
+	return HEADER.pack(frame_type, flags, seq & 0xFFFFFFFF, sender, len(payload)) + payload
+
+def encode_hello(version: int = VERSION, options: int = 0):
+	""" Returns the bytes used to negotiate version, and options from version 2. """
+
+	if version < 2:
+		return HELLO + bytes([version])
+
+	return HELLO + bytes([version, options])
+
+def to_text(frame_type: int, text: str):
+	""" to_text(int, str)
+
+		Converts a frame to the plain text used by clients that did not
+		negotiate the binary protocol.
+
+		Args:
+			frame_type(int): The type of frame.
+			text(str): The frame's payload.
+	"""
+
+	if frame_type == CLOSE:
+		return "close {}".format(text)
+	elif frame_type == PING:
+		return "ping"
+	elif frame_type == PONG:
+		return "/pong"
+	elif frame_type == COMMAND:
+		return "/" + text
+
+	return text
+
+def from_client_text(msg: str):
+	""" from_client_text(str)
+
+		Works out the type of a plain text message sent by a client.
+
+		Args:
+			msg(str): The message.
+
+		Returns:
+			A tuple of the frame type and the payload.
+	"""
+
+	if msg == "/pong":
+		return PONG, ""
+	elif msg.startswith("/"):
+		return COMMAND, msg[1:]
+
+	return CHAT, msg
+
+def from_server_text(msg: str):
+	""" from_server_text(str)
+
+		Works out the type of a plain text message sent by a server that
+		did not negotiate the binary protocol.
+
+		Args:
+			msg(str): The message.
+
+		Returns:
+			A tuple of the frame type and the payload.
+	"""
+
+	if msg == "ping":
+		return PING, ""
+
+	#: Users messages will always have an identifier and : before their
+	#: message, so only the server itself can send a message starting
+	#: with close.
+	elif msg[:5] == "close":
+		return CLOSE, msg[6:]
+
+	return NOTICE, msg
+
+class FrameReader:
+	""" CLASS DEFINITION
+
+		Reassembles frames from a stream of bytes, which may split a
+		frame across several recv calls, or hold several frames at once.
+
+	"""
+
+	def __init__(self):
+		""" Creates a reader with an empty buffer. """
+		self.buffer = bytearray()
+
+	def feed(self, data: bytes):
+		""" self.feed(bytes)
+
+			Adds data to the buffer, and returns the frames that are now
+			complete.
+
+			Args:
+				data(bytes): The data recieved.
+
+			Returns:
+				A list of Frames.
+		"""
+
+		self.buffer += data
+		frames = []
+
+		while len(self.buffer) >= HEADER.size:
+			frame_type, flags, seq, sender, length = HEADER.unpack_from(self.buffer, 0)
+
+			if length > MAX_PAYLOAD:
+				raise ProtocolError("Frame payload of {} bytes is too large.".format(length))
+
+			#: Wait for the rest of the frame.
+			end = HEADER.size + length
+			if len(self.buffer) < end:
+				break
+
+			payload = bytes(self.buffer[HEADER.size:end])
+			del self.buffer[:end]
+
+			ref = None
+			if flags & FLAG_REF:
+				if len(payload) < REF.size:
+					raise ProtocolError("Frame is too short to hold a request reference.")
+
+				ref = REF.unpack_from(payload)[0]
+				payload = payload[REF.size:]
+
+			frames.append(Frame(frame_type, flags, seq, sender, payload, ref))
+
+		return frames
@@ -0,0 +1,223 @@
+""" PURPOSE:
+
+	The messages waiting to be sent to a single client, split into lanes
+	by priority, so that control traffic (eg shutdown notices and command
+	replies) is not stuck behind a backlog of chat.
+
+	Lanes are sent in order: CONTROL, then DIRECT, then CHAT. So that a
+	busy lane can't hold back the others forever, a message that has
+	waited longer than max_wait is sent next, whatever its lane.
+"""
+
+import collections
+import time
+
+from . import frames
+
+#: Allow this to be run as a module, or py file.
+try:
+	from concurrency import Shards
+except ImportError:
+	from chatroom.concurrency import Shards
+
+#: Lanes, in the order that they are sent.
+CONTROL = 0	#: Notices, command replies, errors, pings and closes.
+DIRECT = 1	#: Messages sent to a single user.
+CHAT = 2	#: Messages sent to the whole room.
+
+LANE_NAMES = ["control", "direct", "chat"]
+
+def lane_for(frame_type: int):
+	""" lane_for(int)
+
+		Returns the lane that messages of frame_type are sent in.
+	"""
+
+	if frame_type == frames.CHAT:
+		return CHAT
+	elif frame_type == frames.DIRECT:
+		return DIRECT
+
+	return CONTROL
+
+class LaneMetrics:
+	""" CLASS DEFINITION
+
+		How long messages spent waiting in each lane. A single LaneMetrics
+		is shared by every session on a server, so each session's writer
+		thread records to one of several shards, which are added up by
+		self.summary.
+
+	"""
+
+	def __init__(self):
+		""" Creates empty metrics. """
+
+		#: Each shard is [counts, total waits, longest waits], by lane.
+		self._shards = Shards(lambda: [[0] * len(LANE_NAMES), [0.0] * len(LANE_NAMES),
+					       [0.0] * len(LANE_NAMES)])
+
+	def record(self, lane: int, wait: float):
+		""" self.record(int, float)
+
+			Records a message being sent.
+
+			Args:
+				lane(int): The lane the message was sent in.
+				wait(float): The number of seconds it spent queued.
+		"""
+
+		lock, (counts, totals, maximums) = self._shards.for_thread()
+
+		with lock:
+			counts[lane] += 1
+			totals[lane] += wait
+			maximums[lane] = max(maximums[lane], wait)
+
+	def summary(self):
+		""" self.summary()
+
+			Returns a dictionary relating each lane's name to a tuple of the
+			number of messages sent, and their average and longest wait in
+			seconds.
+		"""
+
+		counts = [0] * len(LANE_NAMES)
+		totals = [0.0] * len(LANE_NAMES)
+		maximums = [0.0] * len(LANE_NAMES)
+
+		for lock, shard in self._shards:
+			with lock:
+				for lane in range(len(LANE_NAMES)):
+					counts[lane] += shard[0][lane]
+					totals[lane] += shard[1][lane]
+					maximums[lane] = max(maximums[lane], shard[2][lane])
+
+		return {name: (counts[lane], totals[lane] / counts[lane] if counts[lane] else 0.0, maximums[lane])
+			for lane, name in enumerate(LANE_NAMES)}
+
+class Outbox:
+	""" CLASS DEFINITION
+
+		Queued messages, split into lanes. This is not locked, so the
+		owner must lock it.
+
+	"""
+
+	def __init__(self, max_wait: float = 0.5):
+		""" self.__init__(float)
+
+			Args:
+				max_wait(float): The number of seconds a message can wait
+						 before it is sent ahead of higher lanes.
+		"""
+
+		self.max_wait = max_wait
+
+		#: Each lane holds (time queued, size, item).
+		self._lanes = [collections.deque() for _ in LANE_NAMES]
+
+		#: The total size of the queued items.
+		self.size = 0
+
+	def put(self, lane: int, item, queued: float = None, size: int = 0):
+		""" self.put(int, object, float, int)
+
+			Queues an item.
+
+			Args:
+				lane(int): The item's lane.
+				item: The item.
+				queued(float): When the item was queued, from time.monotonic.
+					       Defaults to now.
+				size(int): The item's size in bytes, which is added to self.size.
+		"""
+
+		self._lanes[lane].append((time.monotonic() if queued is None else queued, size, item))
+		self.size += size
+
+	def take(self, limit: int = 64):
+		""" self.take(int)
+
+			Takes up to limit items, in the order they should be sent.
+
+			Returns:
+				A list of (lane, seconds waited, item).
+		"""
+
+		now = time.monotonic()
+		taken = []
+
+		while len(taken) < limit:
+			lane = self._next_lane(now)
+
+			if lane is None:
+				break
+
+			queued, size, item = self._lanes[lane].popleft()
+			self.size -= size
+			taken.append((lane, now - queued, item))
+
+		return taken
+
+	def _next_lane(self, now: float):
+		""" Returns the lane to send from next, or None if all are empty. """
+
+		heads = [(lane[0][0], number) for number, lane in enumerate(self._lanes) if len(lane) != 0]
+
+		if len(heads) == 0:
+			return None
+
+		#: A message that has waited too long goes first, so that lower
+		#: lanes are not starved. Otherwise, the highest lane goes first.
+		oldest, lane = min(heads)
+		if now - oldest > self.max_wait:
+			return lane
+
+		return heads[0][1]
+
+	def oldest(self):
+		""" Returns when the oldest item was queued, or None if empty. """
+
+		heads = [lane[0][0] for lane in self._lanes if len(lane) != 0]
+		return min(heads) if len(heads) != 0 else None
+
+	def drain(self):
+		""" self.drain()
+
+			Takes every item, eg to hand them to another server.
+
+			Returns:
+				A list of (lane, seconds waited, item), oldest first in
+				each lane.
+		"""
+
+		now = time.monotonic()
+		items = [(number, now - queued, item) for number, lane in enumerate(self._lanes)
+			 for queued, _, item in lane]
+
+		for lane in self._lanes:
+			lane.clear()
+
+		self.size = 0
+
+		return items
+
+	def drop(self, lane: int):
+		""" self.drop(int)
+
+			Throws away every item in a lane.
+
+			Returns:
+				The number of items thrown away.
+		"""
+
+		dropped = len(self._lanes[lane])
+
+		self.size -= sum(size for _, size, _ in self._lanes[lane])
+		self._lanes[lane].clear()
+
+		return dropped
+
+	def __len__(self):
+		return sum(len(lane) for lane in self._lanes)
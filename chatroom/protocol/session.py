@@ -0,0 +1,464 @@
+""" PURPOSE:
+
+	The server's side of a single client connection. A session keeps track
+	of which protocol the client is speaking, and converts between what
+	the server sends and recieves and what goes over the socket.
+
+	Messages sent to the client are queued in an Outbox, and written by
+	the session's own writer thread, so that sending never waits for a
+	slow client, and so that control traffic can be sent ahead of chat.
+	Messages are encoded as they are written, rather than as they are
+	queued, so that sequence numbers and the compressed stream follow the
+	order that they go over the socket.
+
+	Messages sent to a single user (the DIRECT lane) are never compressed.
+	The stream is shared with chat, which anyone can choose the text of,
+	so the size of compressed chat could give away what was in a private
+	message (as in the CRIME attack on TLS compression).
+"""
+
+import threading
+import time
+
+from . import frames
+from .compression import StreamCompressor
+from .outbox import Outbox, lane_for, DIRECT, CHAT
+
+class Session:
+	""" CLASS DEFINITION
+
+		A connected client, and the state of its connection.
+
+	"""
+
+	def __init__(self, client, address: str, session_id: int, version: int = 0,
+		     supported: int = frames.OPTIONS, metrics=None):
+		""" self.__init__(socket, str, int, int, int, LaneMetrics)
+
+			Args:
+				client(socket): The client's socket.
+				address(str): The client's address.
+				session_id(int): Used as the sender id of the client's messages.
+				version(int): The protocol version in use, or 0 for plain text.
+				supported(int): The frames.OPTION_ bits that the client may
+						negotiate.
+				metrics(LaneMetrics): Where to record how long messages
+						      were queued for, if anywhere.
+		"""
+
+		self.client = client
+		self.address = address
+		self.id = session_id
+
+		#: The negotiated protocol version. 0 means plain text.
+		self.version = version
+
+		#: Set once the first message is recieved, after which the
+		#: protocol can no longer be negotiated.
+		self.negotiated = version != 0
+
+		#: The negotiated frames.OPTION_ bits.
+		self.supported = supported
+		self.options = 0
+		self.compressor = None
+
+		#: The sequence numbers of the last frame sent and recieved.
+		self.seq_out = 0
+		self.seq_in = 0
+
+		self.reader = frames.FrameReader()
+
+		#: Messages that have been recieved, but not yet handled.
+		self.pending = []
+
+		#: Whether the client is sent changes to the user list, see
+		#: /user_list subscribe.
+		self.subscribed = False
+
+		#: Held while writing to the socket, so that the negotiation
+		#: response is not mixed up with frames.
+		self.send_lock = threading.Lock()
+
+		#: Messages waiting to be written, as (frame type, text, sender, ref).
+		#: Many threads queue messages (eg broadcasts, command replies and
+		#: pings), so the outbox is locked by outbox_ready.
+		self.outbox = Outbox()
+		self.outbox_ready = threading.Condition()
+		self.metrics = metrics
+
+		#: The writer thread, which is started by the first message.
+		self.writer = None
+		self.writing = False
+
+		#: Messages that someone is waiting to be written, as [messages
+		#: not written yet, function to call once they are]. See self.queue.
+		self._on_written = []
+
+		#: Set once the session stops sending, and if a write failed.
+		self.closed = False
+		self.failed = False
+
+		#: How far behind the client is (see limits.LagPolicy), and how
+		#: many chat messages it was not sent while too far behind.
+		self.lag_state = 0
+		self.missed = 0
+
+	def set_options(self, options: int):
+		""" self.set_options(int)
+
+			Starts using the negotiated options.
+
+			Args:
+				options(int): The frames.OPTION_ bits.
+		"""
+
+		self.options = options
+
+		#: A new compressor starts a new stream, which the client is told
+		#: about by the first compressed frame.
+		if options & frames.OPTION_COMPRESSION:
+			self.compressor = StreamCompressor()
+
+	@property
+	def binary(self):
+		""" Return whether the client is speaking the binary protocol. """
+		return self.version != 0
+
+	def send(self, frame_type: int, text, sender: int = 0, ref: int = None):
+		""" self.send(int, str, int, int)
+
+			Sends a message to the client, as a frame if the client
+			negotiated the binary protocol, and as plain text otherwise.
+
+			Args:
+				frame_type(int): The type of message, eg frames.NOTICE.
+				text(str): The message. May be UTF-8 encoded bytes, eg a
+					   cached reply.
+				sender(int): The session id of the client the message is
+					     from, or 0 for the server.
+				ref(int): The seq of the request that the message answers,
+					  if any. Plain text clients can't be told this.
+		"""
+
+		self.queue([(frame_type, text, sender, ref)])
+
+	def send_many(self, messages: list, on_written=None):
+		""" self.send_many(list, function)
+
+			Sends several messages to the client in a single write, eg a
+			backlog of mail. Plain text clients can't tell where one message
+			ends and the next begins, so they are sent one message with a
+			line for each.
+
+			Args:
+				messages(list): (frame type, text, sender) tuples.
+				on_written(function): See self.queue.
+		"""
+
+		if len(messages) == 0:
+			return
+
+		#: Queued together, the writer takes them as a single batch.
+		if self.binary:
+			self.queue([(frame_type, text, sender, None) for frame_type, text, sender in messages],
+				   on_written=on_written)
+		else:
+			self.queue([(messages[0][0], "\n".join(text for _, text, _ in messages), 0, None)],
+				   on_written=on_written)
+
+	def queue(self, messages: list, waited: list = None, on_written=None):
+		""" self.queue(list, list, function)
+
+			Queues messages to be written by the writer thread.
+
+			Args:
+				messages(list): (frame type, text, sender, ref) tuples.
+				waited(list): The number of seconds each message has already
+					      been queued for, eg by a previous server.
+				on_written(function): Called by the writer thread once every
+						      message has been written. It is never
+						      called if they are not, eg if the
+						      client goes away first.
+
+			Raises:
+				OSError: If the session has been closed, or a write failed.
+		"""
+
+		with self.outbox_ready:
+			if self.failed or self.closed:
+				raise OSError("The connection to {} is closed.".format(self.address))
+
+			#: The messages are kept, as well as their ids, so that the ids
+			#: can't be reused before they are written.
+			if on_written is not None:
+				self._on_written.append([{id(message): message for message in messages}, on_written])
+
+			now = time.monotonic()
+
+			for i, message in enumerate(messages):
+				self.outbox.put(lane_for(message[0]), message,
+						now - waited[i] if waited is not None else now,
+						len(message[1]))
+
+			if self.writer is None:
+				self.writer = threading.Thread(target=self._write_loop, daemon=True)
+				self.writer.start()
+
+			self.outbox_ready.notify_all()
+
+	def _encode(self, frame_type: int, text, sender: int, ref: int):
+		""" Encodes a message. This must be called with send_lock held. """
+
+		if self.binary:
+			self.seq_out += 1
+			flags, payload = 0, text if isinstance(text, bytes) else text.encode()
+
+			#: Compress under the lock, as the stream must be sent in
+			#: the order that it was compressed. Private messages are kept
+			#: out of the stream (see above).
+			if self.compressor is not None and lane_for(frame_type) != DIRECT:
+				flags, payload = self.compressor.compress(payload)
+
+			return frames.encode_frame(frame_type, self.seq_out, sender, payload, flags, ref)
+
+		if isinstance(text, bytes):
+			text = text.decode()
+
+		return frames.to_text(frame_type, text).encode()
+
+	def _write_loop(self):
+		""" Writes queued messages to the socket, until the session is closed. """
+
+		while True:
+			with self.outbox_ready:
+				self.outbox_ready.wait_for(lambda: len(self.outbox) != 0 or self.closed)
+
+				if len(self.outbox) == 0:
+					return
+
+				#: Plain text clients can't tell where one message ends and
+				#: the next begins, so they are written one at a time.
+				batch = self.outbox.take(64 if self.binary else 1)
+				self.writing = True
+
+			try:
+				with self.send_lock:
+					self.client.sendall(b"".join(self._encode(*message) for _, _, message in batch))
+			except (OSError, ValueError):
+
+				#: The client is gone. Later sends raise OSError, so that
+				#: whoever sends next removes the client.
+				with self.outbox_ready:
+					self.failed = True
+					self.writing = False
+					self.outbox.drain()
+					self.outbox_ready.notify_all()
+
+				return
+
+			if self.metrics is not None:
+				for lane, waited, _ in batch:
+					self.metrics.record(lane, waited)
+
+			with self.outbox_ready:
+				self.writing = False
+				self.outbox_ready.notify_all()
+
+				written = []
+
+				if len(self._on_written) != 0:
+					for waiting in self._on_written:
+						for _, _, message in batch:
+							waiting[0].pop(id(message), None)
+
+					written = [on_written for waiting, on_written in self._on_written if len(waiting) == 0]
+					self._on_written = [entry for entry in self._on_written if len(entry[0]) != 0]
+
+			for on_written in written:
+				on_written()
+
+	def lag(self):
+		""" self.lag()
+
+			Returns a tuple of the number of bytes queued for the client,
+			and the seconds that the oldest of them has waited.
+		"""
+
+		with self.outbox_ready:
+			oldest = self.outbox.oldest()
+
+			return self.outbox.size, time.monotonic() - oldest if oldest is not None else 0.0
+
+	def memory_usage(self):
+		""" self.memory_usage()
+
+			Returns the estimated number of bytes held by the session's
+			queues and buffers.
+		"""
+
+		return self.outbox.size + len(self.reader.buffer) + sum(len(text) for _, text, _ in list(self.pending))
+
+	def drop_chat(self):
+		""" self.drop_chat()
+
+			Throws away the chat waiting to be sent, eg so that a client
+			that has fallen behind can catch up.
+
+			Returns:
+				The number of messages thrown away.
+		"""
+
+		with self.outbox_ready:
+			return self.outbox.drop(CHAT)
+
+	def flush(self, timeout: float = None):
+		""" self.flush(float)
+
+			Waits for every queued message to be written.
+
+			Args:
+				timeout(float): The most seconds to wait, or None to wait
+						until they are written.
+
+			Returns:
+				True if every message was written.
+		"""
+
+		with self.outbox_ready:
+			return self.outbox_ready.wait_for(lambda: (len(self.outbox) == 0 and not self.writing)
+							  or self.failed or self.writer is None, timeout) \
+				and not self.failed
+
+	def close(self, timeout: float = 1):
+		""" self.close(float)
+
+			Writes the queued messages, for up to timeout seconds, and then
+			stops the writer. The socket is left open.
+		"""
+
+		self.flush(timeout)
+
+		with self.outbox_ready:
+			self.closed = True
+			self.outbox.drain()
+			self.outbox_ready.notify_all()
+
+	def detach(self):
+		""" self.detach()
+
+			Stops the writer without writing the queued messages, eg so that
+			they can be handed to another server.
+
+			Returns:
+				A list of (lane, seconds waited, message) for each message
+				that was not written.
+		"""
+
+		with self.outbox_ready:
+			self.closed = True
+			self.outbox_ready.notify_all()
+
+			#: Let the current write finish, so that no frame is cut short.
+			self.outbox_ready.wait_for(lambda: not self.writing)
+
+			return self.outbox.drain()
+
+	def resume(self, messages: list):
+		""" self.resume(list)
+
+			Starts writing again after self.detach, eg if the handoff failed.
+
+			Args:
+				messages(list): The (lane, seconds waited, message) returned
+						by self.detach, which are queued again.
+		"""
+
+		#: The old writer stops once it sees the session closed, so wait
+		#: for it, so that there is only ever one writer.
+		if self.writer is not None:
+			self.writer.join()
+
+		with self.outbox_ready:
+			self.closed = False
+			self.writer = None
+
+		if len(messages) != 0:
+			self.queue([message for _, _, message in messages], [waited for _, waited, _ in messages])
+
+	@staticmethod
+	def hello_complete(data: bytes):
+		""" Session.hello_complete(bytes)
+
+			Returns whether the start of what a client sent is enough to
+			negotiate with, ie it is a whole hello, or not a hello at all.
+		"""
+
+		size = len(frames.HELLO)
+
+		#: Anything else is plain text, which never starts with the
+		#: hello's null byte.
+		if not frames.HELLO.startswith(data[:size]):
+			return True
+
+		#: Wait for the version, and from version 2, the options byte.
+		if len(data) <= size:
+			return False
+
+		return data[size] < 2 or len(data) > size + 1
+
+	def feed(self, data: bytes):
+		""" self.feed(bytes)
+
+			Handles data recieved from the client, adding each complete
+			message to self.pending as a (frame type, text, seq) tuple. The
+			seq is used to answer requests, and is None for plain text.
+
+			Args:
+				data(bytes): The data recieved.
+		"""
+
+		#: The first thing a client sends may be a request to use frames.
+		if not self.negotiated:
+
+			#: The hello may arrive over several reads. Until it is whole,
+			#: or can't be a hello, keep what has arrived in the reader's
+			#: buffer (which a handoff passes on), and wait for the rest.
+			data = bytes(self.reader.buffer) + data
+			self.reader.buffer.clear()
+
+			if not self.hello_complete(data):
+				self.reader.buffer += data
+				return
+
+			self.negotiated = True
+
+			if data.startswith(frames.HELLO) and len(data) > len(frames.HELLO):
+				requested = data[len(frames.HELLO)]
+				data = data[len(frames.HELLO) + 1:]
+
+				#: Switch protocol under the lock, so that the writer does
+				#: not send a frame before the response, or text after it.
+				with self.send_lock:
+					self.version = min(requested, frames.VERSION)
+
+					#: From version 2, the client also asks for options.
+					if requested >= 2 and len(data) != 0:
+						self.set_options(data[0] & self.supported)
+						data = data[1:]
+
+					self.client.sendall(frames.encode_hello(self.version, self.options))
+
+		if not self.binary:
+
+			#: Plain text clients send one message at a time.
+			self.pending.append(frames.from_client_text(data.decode()) + (None,))
+			return
+
+		for frame in self.reader.feed(data):
+
+			#: Only the server compresses what it sends.
+			if frame.flags & frames.FLAG_COMPRESSED:
+				raise frames.ProtocolError("Clients may not send compressed frames.")
+
+			self.seq_in = frame.seq
+			self.pending.append((frame.type, frame.payload.decode(), frame.seq))
@@ -0,0 +1,64 @@
+""" PURPOSE:
+
+	Builds the TLS contexts used to encrypt TCP connections between the
+	server and its clients. Clients connected over the Unix socket are on
+	the same machine, and are not encrypted.
+
+   RESUMPTION:
+
+	The server sends session tickets after each handshake. A client that
+	keeps its ticket (chatroomClient.tls_session) and passes it to its next
+	connection resumes the session, skipping the certificate exchange.
+	Tickets are encrypted with keys held by the server's context, so they
+	only work with the server that issued them, until it restarts.
+"""
+
+import ssl
+
+def server_context(certfile: str, keyfile: str = None, tickets: int = 2):
+	""" server_context(str, str, int)
+
+		Creates the server's TLS context.
+
+		Args:
+			certfile(str): The path of the server's certificate (PEM), which
+				       may also hold its private key.
+			keyfile(str): The path of the server's private key, if it is
+				      not in certfile.
+			tickets(int): The number of session tickets sent after each
+				      TLS 1.3 handshake, so that clients can resume.
+
+		Returns:
+			An ssl.SSLContext.
+	"""
+
+	context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+	context.minimum_version = ssl.TLSVersion.TLSv1_2
+	context.load_cert_chain(certfile, keyfile)
+
+	#: Tickets are on by default, but make sure they are sent, as
+	#: resumption depends on them.
+	context.options &= ~ssl.OP_NO_TICKET
+	context.num_tickets = tickets
+
+	return context
+
+def client_context(cafile: str = None):
+	""" client_context(str)
+
+		Creates a client's TLS context, which checks the server's
+		certificate and hostname.
+
+		Args:
+			cafile(str): The path of the certificate(s) to trust (eg a
+				     self-signed server certificate), or None to trust
+				     the system's certificate authorities.
+
+		Returns:
+			An ssl.SSLContext.
+	"""
+
+	context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=cafile)
+	context.minimum_version = ssl.TLSVersion.TLSv1_2
+
+	return context
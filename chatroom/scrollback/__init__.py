@@ -0,0 +1,2 @@
+from .scrollback import Scrollback
+from .scrollback import ScrollbackLine
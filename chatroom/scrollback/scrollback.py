@@ -0,0 +1,302 @@
+""" PURPOSE:
+
+	Keeps every message a client has recieved, so that they can be paged
+	through and searched without asking the server, while holding only a
+	fixed amount of them in memory.
+
+	The newest messages are kept in memory. Once their text is longer than
+	max_memory characters, the oldest are compressed into a block and written
+	to the scrollback file, which only keeps each block's place in memory.
+	Reading or searching a block decompresses just that block.
+
+   FORMAT:
+
+	The file is a list of zlib compressed blocks, with no header. Each
+	block holds a run of lines, each packed as:
+
+		time(d)    When the line was recieved, in seconds since the epoch.
+		type(B)    The message's frame type.
+		length(I)  The length of the text, followed by its UTF-8 bytes.
+
+	All numbers are little endian. The file is only readable with the
+	block list held by the Scrollback that wrote it.
+"""
+
+import bisect
+import collections
+import itertools
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+_LINE = struct.Struct("<dBI")
+
+#: A line of scrollback. Lines are numbered from 0, oldest first.
+ScrollbackLine = collections.namedtuple("ScrollbackLine", ["number", "time", "type", "text"])
+
+class Scrollback:
+	""" CLASS DEFINITION
+
+		A client's scrollback. Lines may be added and read from any thread.
+
+	"""
+
+	def __init__(self, path: str = None, max_memory: int = 256 * 1024, block_size: int = 64 * 1024):
+		""" self.__init__(str, int, int)
+
+			Args:
+				path(str): The file that older lines are moved to. It is
+					   replaced if it exists. Defaults to a temporary file,
+					   which is removed when closed.
+				max_memory(int): The most characters of text kept in memory.
+				block_size(int): The characters of text moved to the file
+						 at a time.
+		"""
+
+		self.path = path
+		self.max_memory = max_memory
+		self.block_size = min(block_size, max_memory)
+
+		#: The newest lines, as ScrollbackLines, and the length of their text.
+		self.recent = collections.deque()
+		self.recent_size = 0
+
+		#: The number of every line added, including those in the file.
+		self.count = 0
+
+		#: For each block in the file, the number of its first line, and
+		#: (number of lines, offset, compressed size).
+		self.block_starts = []
+		self.blocks = []
+
+		#: The last block read, as (index, lines), so that paging through
+		#: a block only decompresses it once.
+		self._cached = (None, [])
+
+		self._file = None
+		self.closed = False
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return self.count
+
+	def add(self, frame_type: int, text: str, recieved: float = None):
+		""" self.add(int, str, float)
+
+			Adds a line, moving the oldest lines to the file if there are
+			too many in memory.
+
+			Args:
+				frame_type(int): The type of message, eg frames.CHAT.
+				text(str): The message.
+				recieved(float): When it was recieved. Defaults to now.
+		"""
+
+		line = ScrollbackLine(self.count, time.time() if recieved is None else recieved, frame_type, text)
+
+		with self._lock:
+			self.recent.append(line)
+			self.recent_size += len(text)
+			self.count += 1
+
+			#: The newest line always stays in memory, however long it is.
+			while self.recent_size > self.max_memory and len(self.recent) > 1:
+				self._spill()
+
+	def latest(self):
+		""" Returns the newest line, or None if there are none. """
+
+		with self._lock:
+			return self.recent[-1] if len(self.recent) != 0 else None
+
+	def lines(self, start: int, count: int):
+		""" self.lines(int, int)
+
+			Returns up to count lines, from line number start, oldest first.
+		"""
+
+		found = []
+
+		with self._lock:
+			first_recent = self.count - len(self.recent)
+
+			#: Lines before the first block were lost when the file closed.
+			first = self.block_starts[0] if len(self.blocks) != 0 else first_recent
+
+			end = min(self.count, max(0, start) + max(0, count))
+			start = max(first, start)
+
+			#: Read what was moved to the file, a block at a time.
+			number = start
+			while number < min(end, first_recent):
+				block = bisect.bisect_right(self.block_starts, number) - 1
+				lines = self._read_block(block)
+
+				offset = number - self.block_starts[block]
+				taken = lines[offset:offset + end - number]
+
+				found += taken
+				number += len(taken)
+
+			found += itertools.islice(self.recent, max(0, number - first_recent), max(0, end - first_recent))
+
+		return found
+
+	def page(self, number: int = 1, size: int = 20):
+		""" self.page(int, int)
+
+			Returns a page of lines, oldest first. Page 1 holds the newest
+			lines, page 2 the lines before them, and so on.
+		"""
+
+		end = self.count - (number - 1) * size
+		return self.lines(max(0, end - size), end - max(0, end - size))
+
+	def pages(self, size: int = 20):
+		""" Returns the number of pages of size lines. """
+		return (self.count + size - 1) // size
+
+	def find(self, text: str, limit: int = 20, before: int = None):
+		""" self.find(str, int, int)
+
+			Searches for lines containing text, ignoring case, newest first.
+
+			Args:
+				text(str): What to search for.
+				limit(int): The most lines to return.
+				before(int): Only search lines numbered before this, eg to
+					     carry on from the last line found.
+
+			Returns:
+				A list of ScrollbackLines, newest first.
+		"""
+
+		needle = text.casefold()
+		found = []
+
+		with self._lock:
+			if before is None:
+				before = self.count
+
+			for line in reversed(self.recent):
+				if len(found) == limit:
+					return found
+
+				if line.number < before and needle in line.text.casefold():
+					found.append(line)
+
+			#: A block can only hold the text if its raw bytes do, so blocks
+			#: are checked before their lines are unpacked. Case is only
+			#: ignored for ASCII at this stage, so the check is skipped for
+			#: other text.
+			raw = needle.encode() if needle.isascii() else None
+
+			for block in range(len(self.blocks) - 1, -1, -1):
+				if len(found) == limit:
+					return found
+
+				if self.block_starts[block] >= before:
+					continue
+
+				data = self._read_raw(block)
+				if raw is not None and raw not in data.lower():
+					continue
+
+				for line in reversed(self._unpack(block, data)):
+					if len(found) == limit:
+						return found
+
+					if line.number < before and needle in line.text.casefold():
+						found.append(line)
+
+		return found
+
+	def memory_usage(self):
+		""" Returns the length of the text held in memory. """
+		return self.recent_size
+
+	def close(self):
+		""" self.close()
+
+			Closes the file, which is removed if it was temporary. From
+			then on, lines that would be moved to the file are dropped.
+		"""
+
+		with self._lock:
+			self.closed = True
+
+			if self._file is not None:
+				self._file.close()
+
+			#: The lines in the file can no longer be read.
+			self.block_starts = []
+			self.blocks = []
+			self._cached = (None, [])
+
+	def _spill(self):
+		""" Moves the oldest lines into a block in the file. The lock must be held. """
+
+		if self._file is None and not self.closed:
+			self._file = open(self.path, 'w+b') if self.path is not None else tempfile.TemporaryFile()
+
+		parts = []
+		size = 0
+		first = self.recent[0].number
+
+		while size < self.block_size and len(self.recent) > 1:
+			line = self.recent.popleft()
+			data = line.text.encode()
+
+			parts.append(_LINE.pack(line.time, line.type, len(data)))
+			parts.append(data)
+
+			size += len(line.text)
+
+		self.recent_size -= size
+
+		if len(parts) == 0 or self.closed:
+			return
+
+		compressed = zlib.compress(b"".join(parts))
+
+		self._file.seek(0, 2)
+		offset = self._file.tell()
+		self._file.write(compressed)
+
+		self.block_starts.append(first)
+		self.blocks.append((len(parts) // 2, offset, len(compressed)))
+
+	def _read_raw(self, block: int):
+		""" Reads and decompresses a block. The lock must be held. """
+
+		_, offset, size = self.blocks[block]
+
+		self._file.seek(offset)
+		return zlib.decompress(self._file.read(size))
+
+	def _unpack(self, block: int, data: bytes):
+		""" Unpacks a decompressed block into ScrollbackLines. """
+
+		lines = []
+		number = self.block_starts[block]
+		offset = 0
+
+		while offset < len(data):
+			recieved, frame_type, length = _LINE.unpack_from(data, offset)
+			offset += _LINE.size
+
+			lines.append(ScrollbackLine(number, recieved, frame_type, data[offset:offset + length].decode()))
+			offset += length
+			number += 1
+
+		return lines
+
+	def _read_block(self, block: int):
+		""" Returns a block's lines, reading them if they are not cached. """
+
+		if self._cached[0] != block:
+			self._cached = (block, self._unpack(block, self._read_raw(block)))
+
+		return self._cached[1]
@@ -0,0 +1,2 @@
+from .server_snapshot import save_snapshot
+from .server_snapshot import load_snapshot
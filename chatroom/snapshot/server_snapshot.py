@@ -0,0 +1,140 @@
+""" PURPOSE:
+
+	Saves and loads a compact binary snapshot of the server's state, so
+	that the server can start up from a single read rather than reading
+	every permission file line by line.
+
+   FORMAT:
+
+	The file starts with the magic bytes b"CRSS" and a version byte,
+	followed by three sections: permissions, history and resume tokens.
+	Each section is a 32 bit count followed by that many pairs of strings,
+	and each string is a 16 bit length followed by its UTF-8 bytes. All
+	numbers are little endian.
+
+		permissions: (address, permission name)
+		history:     (message, address)
+		tokens:      (token, username)
+"""
+
+import os
+import struct
+
+MAGIC = b"CRSS"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sB")
+_COUNT = struct.Struct("<I")
+_LENGTH = struct.Struct("<H")
+
+def _pack_pairs(pairs):
+	""" Packs a list of string pairs into a section. """
+
+	parts = [_COUNT.pack(len(pairs))]
+
+	for first, second in pairs:
+		for string in (first, second):
+
+			#: Truncate anything too long for its length prefix, dropping
+			#: any character cut in half. Nothing the server stores
+			#: should be anywhere near this long.
+			data = string.encode()[:0xFFFF].decode(errors='ignore').encode()
+			parts.append(_LENGTH.pack(len(data)))
+			parts.append(data)
+
+	return b"".join(parts)
+
+def _unpack_pairs(data, offset: int):
+	""" Unpacks a section starting at offset, and returns (pairs, new offset). """
+
+	count, = _COUNT.unpack_from(data, offset)
+	offset += _COUNT.size
+
+	pairs = []
+	for _ in range(count):
+		pair = []
+
+		for _ in range(2):
+			length, = _LENGTH.unpack_from(data, offset)
+			offset += _LENGTH.size
+
+			if offset + length > len(data):
+				raise ValueError("Snapshot is truncated.")
+
+			pair.append(bytes(data[offset:offset + length]).decode())
+			offset += length
+
+		pairs.append(tuple(pair))
+
+	return pairs, offset
+
+def save_snapshot(path: str, permissions: list, history: list, tokens: list):
+	""" save_snapshot(str, list, list, list)
+
+		Writes a snapshot to path. The file is replaced atomically, so a
+		crash while saving never leaves a broken snapshot behind.
+
+		Args:
+			path(str): The file to write the snapshot to.
+			permissions(list): A list of (address, permission name).
+			history(list): A list of (message, address).
+			tokens(list): A list of (token, username).
+	"""
+
+	data = b"".join([
+		_HEADER.pack(MAGIC, VERSION),
+		_pack_pairs(permissions),
+		_pack_pairs(history),
+		_pack_pairs(tokens)
+	])
+
+	temp_path = path + ".tmp"
+	with open(temp_path, 'wb') as s_file:
+		s_file.write(data)
+
+	os.replace(temp_path, path)
+
+def load_snapshot(path: str, sources: list = []):
+	""" load_snapshot(str, list)
+
+		Reads a snapshot from path.
+
+		Args:
+			path(str): The file to read the snapshot from.
+			sources(list): Files that the snapshot was built from. If any of
+				       them were changed after the snapshot was saved,
+				       then the snapshot is out of date.
+
+		Returns:
+			A dictionary with "permissions", "history" and "tokens" lists,
+			or None if there is no usable snapshot, in which case the
+			caller should fall back to the source files.
+	"""
+
+	try:
+		snapshot_time = os.stat(path).st_mtime
+
+		#: Don't use the snapshot if a source file was edited after it.
+		for source in sources:
+			if os.path.exists(source) and os.stat(source).st_mtime > snapshot_time:
+				return None
+
+		#: Read the whole snapshot at once.
+		with open(path, 'rb') as s_file:
+			data = memoryview(s_file.read())
+
+		magic, version = _HEADER.unpack_from(data, 0)
+		if magic != MAGIC or version != VERSION:
+			return None
+
+		offset = _HEADER.size
+		permissions, offset = _unpack_pairs(data, offset)
+		history, offset = _unpack_pairs(data, offset)
+		tokens, offset = _unpack_pairs(data, offset)
+
+	#: A missing, or broken snapshot is not an error, as the
+	#: source files can still be read.
+	except (OSError, struct.error, ValueError):
+		return None
+
+	return {"permissions": permissions, "history": history, "tokens": tokens}
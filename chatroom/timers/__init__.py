@@ -0,0 +1 @@
+from .timer_wheel import TimerWheel
@@ -0,0 +1,172 @@
+""" PURPOSE:
+
+	A hierarchical timer wheel, used by the server to keep track of when
+	each client's inactivity deadline passes.
+
+	The wheel is made up of several levels, each with the same number of
+	slots. A slot on the first level covers one tick, a slot on the second
+	level covers a full turn of the first level, and so on. Timers are put
+	on the lowest level that can hold them, and are moved down a level each
+	time the level below completes a turn.
+
+	Scheduling and cancelling a timer are O(1), and advancing the wheel by
+	one tick only touches the timers that are due, so the cost of a tick
+	does not grow with the number of idle clients.
+"""
+
+import math
+import threading
+import time
+
+class TimerWheel:
+	""" CLASS DEFINITION
+
+		A hierarchical timer wheel.
+
+	"""
+
+	def __init__(self, tick: float = 0.5, slots: int = 64, levels: int = 4):
+		""" self.__init__(float, int, int)
+
+			Creates an empty wheel.
+
+			Args:
+				tick(float): The number of seconds in each tick.
+				slots(int): The number of slots on each level.
+				levels(int): The number of levels. Timers further away than
+					     slots ** levels ticks are clamped to that.
+		"""
+
+		self.tick = tick
+		self.slots = slots
+		self.levels = levels
+
+		#: Each level is a list of slots, and each slot is a set of keys.
+		self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+
+		#: A dictionary relating keys to their (expiry, level, slot).
+		self.timers = {}
+
+		#: The number of ticks that the wheel has advanced.
+		self.current_tick = 0
+		self.start_time = time.monotonic()
+
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		""" Return the number of scheduled timers. """
+		return len(self.timers)
+
+	def __contains__(self, key):
+		""" Return whether key has a scheduled timer. """
+		return key in self.timers
+
+	def schedule(self, key, delay: float):
+		""" self.schedule(object, float):
+
+			Schedules key to expire after delay seconds. If key is already
+			scheduled, then its old timer is replaced.
+
+			Args:
+				key(object): The key to schedule.
+				delay(float): The number of seconds until key expires.
+		"""
+
+		#: Always expire at least one tick in the future, so that a timer
+		#: is never put in the slot that is currently being processed.
+		ticks = max(1, math.ceil(delay / self.tick))
+
+		#: Clients reset their timers with every message, so if the timer
+		#: already expires on the same tick, leave it without locking.
+		timer = self.timers.get(key)
+		if timer is not None and timer[0] == self.current_tick + ticks:
+			return
+
+		with self._lock:
+			self._cancel(key)
+			self._place(key, self.current_tick + ticks)
+
+	def cancel(self, key):
+		""" self.cancel(object):
+
+			Cancels key's timer, if it has one.
+
+			Args:
+				key(object): The key to cancel.
+		"""
+
+		with self._lock:
+			self._cancel(key)
+
+	def advance(self, now: float = None):
+		""" self.advance(float):
+
+			Moves the wheel forward to the current time, and collects every
+			timer that expired along the way.
+
+			Args:
+				now(float): The time.monotonic() to advance to. Defaults to now.
+
+			Returns:
+				A list of the keys that expired.
+		"""
+
+		if now is None:
+			now = time.monotonic()
+
+		target_tick = int((now - self.start_time) / self.tick)
+		expired = []
+
+		with self._lock:
+			while self.current_tick < target_tick:
+				self.current_tick += 1
+
+				#: When a level completes a turn, move the timers in the next
+				#: slot of the level above down. Do the highest level first, so
+				#: that its timers can continue down through the lower levels.
+				for level in range(self.levels - 1, 0, -1):
+					if self.current_tick % (self.slots ** level) == 0:
+						self._cascade(level)
+
+				#: Every timer in the current slot of the first level is due.
+				slot = self.wheels[0][self.current_tick % self.slots]
+				for key in slot:
+					del self.timers[key]
+					expired.append(key)
+				slot.clear()
+
+		return expired
+
+	def _place(self, key, expiry: int):
+		""" Puts key into the lowest level that can hold expiry. """
+
+		#: Clamp timers that are too far away for the wheel to hold.
+		expiry = min(expiry, self.current_tick + self.slots ** self.levels - 1)
+		delta = expiry - self.current_tick
+
+		level = 0
+		while level < self.levels - 1 and delta >= self.slots ** (level + 1):
+			level += 1
+
+		slot = (expiry // (self.slots ** level)) % self.slots
+
+		self.wheels[level][slot].add(key)
+		self.timers[key] = (expiry, level, slot)
+
+	def _cancel(self, key):
+		""" Removes key from the wheel. The lock must be held. """
+
+		if key in self.timers:
+			_, level, slot = self.timers.pop(key)
+			self.wheels[level][slot].discard(key)
+
+	def _cascade(self, level: int):
+		""" Moves the timers in level's next slot down to the lower levels. """
+
+		slot = self.wheels[level][(self.current_tick // (self.slots ** level)) % self.slots]
+
+		for key in list(slot):
+			expiry = self.timers[key][0]
+			self._place(key, expiry)
+
+		slot.clear()
@@ -0,0 +1,3 @@
+from .file_spool import FileSpool
+from .file_spool import SpooledFile
+from .transfer_server import TransferServer
@@ -0,0 +1,214 @@
+""" PURPOSE:
+
+	Keeps the files that users have shared, in a spool directory on the
+	server, along with their names, sizes and who shared them.
+
+	Space is reserved when an upload is started, so that uploads running
+	at the same time can't go over the spool's limits between them. The
+	spool directory is temporary, and is removed when the spool is closed.
+
+	Files are removed once they are max_age seconds old, or sooner if the
+	spool is full, oldest first, to make room for new uploads. Each user
+	may only have max_reservations uploads waiting at once, so that no
+	one can hold the spool's space with uploads they never send.
+"""
+
+import collections
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+#: A file that has been shared, and when (from time.monotonic).
+SpooledFile = collections.namedtuple("SpooledFile", ["id", "name", "size", "owner", "path", "shared"])
+
+class FileSpool:
+	""" CLASS DEFINITION
+
+		The shared files, and the space they use.
+
+	"""
+
+	def __init__(self, directory: str = None, max_file_size: int = 64 * 1024 * 1024,
+		     max_total: int = 1024 * 1024 * 1024, max_age: float = 24 * 60 * 60,
+		     max_reservations: int = 2):
+		""" self.__init__(str, int, int, float, int)
+
+			Args:
+				directory(str): Where the files are kept. Defaults to a new
+						temporary directory, created when first needed.
+				max_file_size(int): The largest file, in bytes.
+				max_total(int): The most bytes that every file may use.
+				max_age(float): The seconds a file is kept for, or None to
+						keep files until the spool is full.
+				max_reservations(int): The most unfinished uploads each
+						       user may have.
+		"""
+
+		self.directory = directory
+		self.max_file_size = max_file_size
+		self.max_total = max_total
+		self.max_age = max_age
+		self.max_reservations = max_reservations
+
+		#: Whether the directory was created by the spool, and should be removed.
+		self._temporary = directory is None
+
+		#: Relates file ids to SpooledFiles, for the finished uploads,
+		#: oldest first.
+		self.files = {}
+
+		#: Relates file ids to the (size, owner) reserved for unfinished uploads.
+		self._reserved = {}
+
+		self._ids = itertools.count(1)
+		self._lock = threading.Lock()
+
+	@property
+	def used(self):
+		""" Returns the bytes used and reserved by every file. """
+		return sum(spooled.size for spooled in self.files.values()) + \
+		       sum(size for size, _ in self._reserved.values())
+
+	def reserve(self, name: str, size: int, owner: str = None):
+		""" self.reserve(str, int, str)
+
+			Reserves space for an upload, removing the oldest files if
+			there isn't enough.
+
+			Args:
+				name(str): The file's name.
+				size(int): The file's size in bytes.
+				owner(str): The username of who is uploading it.
+
+			Returns:
+				The id for the file.
+
+			Raises:
+				ValueError: If the file is too large, the owner has too many
+					    uploads waiting, or the spool is full of
+					    unfinished uploads.
+		"""
+
+		if size < 0 or size > self.max_file_size:
+			raise ValueError("Files must be at most {} bytes.".format(self.max_file_size))
+
+		removed = []
+
+		with self._lock:
+			if owner is not None and self.max_reservations is not None and \
+			   sum(1 for _, reserver in self._reserved.values() if reserver == owner) >= self.max_reservations:
+				raise ValueError("You already have {} uploads waiting.".format(self.max_reservations))
+
+			#: Unfinished uploads can't be removed, so check they leave room.
+			if sum(size for size, _ in self._reserved.values()) + size > self.max_total:
+				raise ValueError("There is no space left for shared files.")
+
+			while self.used + size > self.max_total:
+				removed.append(self.files.pop(next(iter(self.files))))
+
+			if self.directory is None:
+				self.directory = tempfile.mkdtemp(prefix="chatroom-spool-")
+
+			file_id = next(self._ids)
+			self._reserved[file_id] = (size, owner)
+
+		self._remove(removed)
+
+		return file_id
+
+	def reserved(self, file_id: int):
+		""" Returns the bytes reserved for an unfinished upload, or 0. """
+		return self._reserved.get(file_id, (0, None))[0]
+
+	def path(self, file_id: int):
+		""" Returns the path that a file is kept at. """
+		return os.path.join(self.directory, str(file_id))
+
+	def commit(self, file_id: int, name: str, owner: str):
+		""" self.commit(int, str, str)
+
+			Shares an upload, once all of it has been written to self.path.
+
+			Args:
+				file_id(int): The id from self.reserve.
+				name(str): The file's name. Only the last part of a path is kept.
+				owner(str): The username of who shared it.
+
+			Returns:
+				The SpooledFile.
+		"""
+
+		#: Never trust a path from a client.
+		name = os.path.basename(name.replace("\\", "/")) or "file"
+
+		with self._lock:
+			size, _ = self._reserved.pop(file_id)
+			spooled = SpooledFile(file_id, name, size, owner, self.path(file_id), time.monotonic())
+			self.files[file_id] = spooled
+
+		return spooled
+
+	def abort(self, file_id: int):
+		""" self.abort(int)
+
+			Throws away an unfinished upload, and frees its space.
+		"""
+
+		with self._lock:
+			self._reserved.pop(file_id, None)
+
+		try:
+			os.remove(self.path(file_id))
+		except OSError:
+			pass
+
+	def get(self, file_id: int):
+		""" Returns the SpooledFile with file_id, or None. """
+		return self.files.get(file_id)
+
+	def expire(self):
+		""" self.expire()
+
+			Removes the files that are older than max_age.
+
+			Returns:
+				The number of files removed.
+		"""
+
+		if self.max_age is None:
+			return 0
+
+		oldest = time.monotonic() - self.max_age
+
+		with self._lock:
+			removed = [spooled for spooled in self.files.values() if spooled.shared < oldest]
+
+			for spooled in removed:
+				del self.files[spooled.id]
+
+		self._remove(removed)
+
+		return len(removed)
+
+	def _remove(self, removed: list):
+		""" Deletes the removed SpooledFiles. Downloads already sending them carry on. """
+
+		for spooled in removed:
+			try:
+				os.remove(spooled.path)
+			except OSError:
+				pass
+
+	def close(self):
+		""" self.close()
+
+			Removes the spool directory, if the spool created it.
+		"""
+
+		if self._temporary and self.directory is not None:
+			shutil.rmtree(self.directory, ignore_errors=True)
+			self.directory = None
+			self.files = {}
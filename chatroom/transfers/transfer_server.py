@@ -0,0 +1,282 @@
+""" PURPOSE:
+
+	Moves files to and from the spool over their own connections, so that
+	a large transfer never holds up chat, which stays on the client's main
+	connection.
+
+	A client asks for a transfer with /upload or /download, and is given
+	a ticket and this server's port. It then opens a new connection to
+	the port, and sends the ticket followed by a newline.
+
+	UPLOAD:
+
+		The client sends exactly the file's size in bytes, and the server
+		replies with "OK [file id]\n" or "ERROR [reason]\n". The upload is
+		read one chunk at a time into a fixed buffer, and written to the
+		spool before the next chunk is read, so an upload uses at most one
+		chunk of memory, and a client can only send as fast as the spool
+		is written (TCP's window does the flow control).
+
+	DOWNLOAD:
+
+		The server replies with "OK [size]\n", followed by the file, sent
+		straight from the spool with socket.sendfile (zero-copy where the
+		platform supports it). Otherwise it replies "ERROR [reason]\n".
+"""
+
+import secrets
+import socket
+import threading
+import time
+import traceback
+
+class TransferServer:
+	""" CLASS DEFINITION
+
+		The listener for transfer connections, and the tickets it accepts.
+
+	"""
+
+	def __init__(self, spool, host: str = '', port: int = 0, max_transfers: int = 8,
+		     chunk_size: int = 64 * 1024, ticket_timeout: float = 60):
+		""" self.__init__(FileSpool, str, int, int, int, float)
+
+			Args:
+				spool(FileSpool): Where files are kept.
+				host(str): The address to listen on.
+				port(int): The port to listen on, or 0 to pick a free port.
+				max_transfers(int): The most transfers that may run at once.
+				chunk_size(int): The bytes of an upload read at a time.
+				ticket_timeout(float): The seconds a ticket may wait to be used.
+		"""
+
+		self.spool = spool
+		self.host = host
+		self.port = port
+		self.chunk_size = chunk_size
+		self.ticket_timeout = ticket_timeout
+
+		#: Called with each SpooledFile once its upload finishes.
+		self.on_upload = None
+
+		self.listener = None
+		self.running = False
+
+		#: Relates tickets to (kind, file id, name, owner, expiry).
+		self._tickets = {}
+		self._lock = threading.Lock()
+
+		self._slots = threading.BoundedSemaphore(max_transfers)
+
+	def start(self):
+		""" self.start()
+
+			Starts listening for transfers.
+
+			Returns:
+				The port being listened on.
+		"""
+
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.listener.bind((self.host, self.port))
+		self.listener.listen(8)
+
+		self.port = self.listener.getsockname()[1]
+		self.running = True
+
+		threading.Thread(target=self._accept, daemon=True).start()
+
+		return self.port
+
+	def stop(self):
+		""" self.stop()
+
+			Stops accepting transfers. Transfers already running carry on.
+		"""
+
+		self.running = False
+
+		if self.listener is not None:
+			try:
+				self.listener.shutdown(socket.SHUT_RDWR)
+			except OSError:
+				pass
+
+			self.listener.close()
+
+	def expect_upload(self, name: str, size: int, owner: str):
+		""" self.expect_upload(str, int, str)
+
+			Reserves space for an upload, and makes a ticket for it.
+
+			Returns:
+				The ticket.
+
+			Raises:
+				ValueError: If the spool can't take the file.
+		"""
+
+		self.expire()
+
+		file_id = self.spool.reserve(name, size, owner)
+		return self._ticket("upload", file_id, name, owner)
+
+	def expect_download(self, file_id: int):
+		""" self.expect_download(int)
+
+			Makes a ticket to download a file.
+
+			Returns:
+				The ticket.
+
+			Raises:
+				KeyError: If there is no such file.
+		"""
+
+		if self.spool.get(file_id) is None:
+			raise KeyError(file_id)
+
+		return self._ticket("download", file_id, None, None)
+
+	def expire(self):
+		""" self.expire()
+
+			Forgets the tickets that have not been used in time, freeing the
+			space reserved for their uploads, and removes old files from
+			the spool. This should be called regularly, eg on a timer.
+		"""
+
+		now = time.monotonic()
+
+		with self._lock:
+			expired = [self._tickets.pop(key)[:2] for key, value in list(self._tickets.items()) if value[4] < now]
+
+		for kind, file_id in expired:
+			if kind == "upload":
+				self.spool.abort(file_id)
+
+		self.spool.expire()
+
+	def _ticket(self, kind: str, file_id: int, name: str, owner: str):
+		""" Makes a ticket. """
+
+		ticket = secrets.token_hex(16)
+
+		with self._lock:
+			self._tickets[ticket] = (kind, file_id, name, owner, time.monotonic() + self.ticket_timeout)
+
+		return ticket
+
+	def _accept(self):
+		""" Accepts transfer connections until stopped. """
+
+		while self.running:
+			try:
+				conn, _ = self.listener.accept()
+			except OSError:
+				if not self.running:
+					return
+
+				traceback.print_exc()
+				continue
+
+			#: Refuse transfers beyond the limit, rather than queueing them.
+			if not self._slots.acquire(blocking=False):
+				self._reply(conn, "ERROR Too many transfers, try again later.")
+				conn.close()
+				continue
+
+			threading.Thread(target=self._transfer, args=(conn,), daemon=True).start()
+
+	def _transfer(self, conn):
+		""" Runs the transfer asked for by the ticket at the start of conn. """
+
+		try:
+			conn.settimeout(30)
+
+			with conn:
+				ticket = self._read_line(conn)
+
+				with self._lock:
+					found = self._tickets.pop(ticket, None)
+
+				if found is None or found[4] < time.monotonic():
+					self._reply(conn, "ERROR That transfer was not asked for, or has expired.")
+					return
+
+				kind, file_id, name, owner, _ = found
+
+				if kind == "upload":
+					self._receive(conn, file_id, name, owner)
+				else:
+					self._send(conn, self.spool.get(file_id))
+		except OSError:
+			#: The client went away part way through.
+			pass
+		finally:
+			self._slots.release()
+
+	def _receive(self, conn, file_id: int, name: str, owner: str):
+		""" Writes an upload to the spool, one chunk at a time. """
+
+		remaining = self.spool.reserved(file_id)
+		buffer = bytearray(self.chunk_size)
+		view = memoryview(buffer)
+
+		try:
+			with open(self.spool.path(file_id), "wb") as f:
+				while remaining > 0:
+					count = conn.recv_into(view, min(remaining, self.chunk_size))
+
+					if count == 0:
+						raise ConnectionError("The upload ended early.")
+
+					f.write(view[:count])
+					remaining -= count
+		except (OSError, ValueError):
+			self.spool.abort(file_id)
+			raise
+
+		spooled = self.spool.commit(file_id, name, owner)
+
+		if self.on_upload is not None:
+			self.on_upload(spooled)
+
+		self._reply(conn, "OK {}".format(spooled.id))
+
+	def _send(self, conn, spooled):
+		""" Sends a file from the spool. """
+
+		if spooled is None:
+			self._reply(conn, "ERROR That file is no longer shared.")
+			return
+
+		self._reply(conn, "OK {}".format(spooled.size))
+
+		with open(spooled.path, "rb") as f:
+			conn.sendfile(f)
+
+	def _read_line(self, conn, limit: int = 128):
+		""" Reads up to a newline, a byte at a time, so nothing after it is read. """
+
+		line = bytearray()
+
+		while len(line) < limit:
+			char = conn.recv(1)
+
+			if len(char) == 0 or char == b"\n":
+				break
+
+			line += char
+
+		return line.decode(errors="replace").strip()
+
+	@staticmethod
+	def _reply(conn, text: str):
+		""" Sends a line to a transfer connection. """
+
+		try:
+			conn.sendall((text + "\n").encode())
+		except OSError:
+			pass
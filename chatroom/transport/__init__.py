@@ -0,0 +1,4 @@
+from .tcp_transport import TCPTransport
+from .memory_transport import MemoryTransport
+from .memory_transport import MemorySocket
+from .memory_transport import MemoryListener
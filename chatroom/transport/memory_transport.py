@@ -0,0 +1,344 @@
+""" PURPOSE:
+
+	A transport that connects the server and its clients inside a single
+	process, without any kernel sockets, so that the server's logic can be
+	tested and benchmarked quickly, and without waiting on the network.
+
+	Data sent on one end of a connection is in the other end's buffer by
+	the time sendall returns, and recv wakes as soon as it arrives, so a
+	test can wait for exactly the data it expects rather than sleeping.
+
+	Each connection is given its own address, "memory-remote:[n]", which
+	the server treats like any other remote client. Tests that want local
+	clients (see chatroomServer.is_local) can create the transport with
+	local=True, which gives addresses of "memory:[n]" instead.
+
+	There is no file descriptor behind an in-memory socket, so fileno
+	raises io.UnsupportedOperation (an OSError) while it is open, and
+	anything that needs one (eg handing clients over to a new server)
+	fails as it would for a broken socket.
+"""
+
+import collections
+import errno
+import io
+import itertools
+import socket
+import threading
+
+class MemorySocket:
+	""" CLASS DEFINITION
+
+		One end of an in-memory connection. It has the parts of the socket
+		interface that the server and client use.
+
+	"""
+
+	family = socket.AF_INET
+	type = socket.SOCK_STREAM
+
+	def __init__(self, address: tuple, peer_address: tuple):
+		""" self.__init__(tuple, tuple)
+
+			Creates an unconnected end. See MemoryTransport.connect.
+		"""
+
+		self.address = address
+		self.peer_address = peer_address
+		self.peer = None
+
+		#: The data sent by the peer that has not been read yet.
+		self._buffer = bytearray()
+		self._ready = threading.Condition()
+
+		#: Whether the peer will send nothing more, whether this end will
+		#: send nothing more, and whether this end was closed.
+		self._eof = False
+		self._write_shut = False
+		self._closed = False
+
+		self._timeout = None
+
+	def _deliver(self, data: bytes):
+		""" Adds data sent by the peer to the buffer. """
+
+		with self._ready:
+			if self._closed:
+				raise BrokenPipeError(errno.EPIPE, "The connection was closed by the peer.")
+
+			self._buffer += data
+			self._ready.notify_all()
+
+	def _end(self):
+		""" Marks that the peer will send nothing more. """
+
+		with self._ready:
+			self._eof = True
+			self._ready.notify_all()
+
+	def sendall(self, data: bytes):
+		""" Sends all of data to the peer. """
+
+		if self._closed:
+			raise OSError(errno.EBADF, "Bad file descriptor")
+
+		if self._write_shut or self.peer is None:
+			raise BrokenPipeError(errno.EPIPE, "Broken pipe")
+
+		self.peer._deliver(bytes(data))
+
+	def send(self, data: bytes):
+		""" Sends data to the peer, returning the number of bytes sent. """
+
+		self.sendall(data)
+		return len(data)
+
+	def recv(self, size: int):
+		""" Reads up to size bytes, waiting for them if there are none. """
+
+		with self._ready:
+			if self._timeout != 0.0:
+				arrived = self._ready.wait_for(lambda: len(self._buffer) != 0 or self._eof or self._closed,
+							       self._timeout)
+
+				if not arrived:
+					raise socket.timeout("timed out")
+
+			#: Like a socket, a recv woken by a shutdown sees the end of
+			#: the stream, even if the socket is then closed.
+			if len(self._buffer) == 0 and self._eof:
+				return b""
+
+			if self._closed:
+				raise OSError(errno.EBADF, "Bad file descriptor")
+
+			if len(self._buffer) == 0:
+				raise BlockingIOError(errno.EAGAIN, "Resource temporarily unavailable")
+
+			data = bytes(self._buffer[:size])
+			del self._buffer[:size]
+
+			return data
+
+	def recv_into(self, buffer, size: int = 0):
+		""" Reads into buffer, returning the number of bytes read. """
+
+		data = self.recv(size or len(buffer))
+		buffer[:len(data)] = data
+
+		return len(data)
+
+	def shutdown(self, how: int):
+		""" Stops reading, writing, or both. """
+
+		if how in (socket.SHUT_RD, socket.SHUT_RDWR):
+			self._end()
+
+		if how in (socket.SHUT_WR, socket.SHUT_RDWR) and not self._write_shut:
+			self._write_shut = True
+
+			if self.peer is not None:
+				self.peer._end()
+
+	def close(self):
+		""" Closes this end, which the peer sees as the end of the stream. """
+
+		if self._closed:
+			return
+
+		self.shutdown(socket.SHUT_RDWR)
+
+		with self._ready:
+			self._closed = True
+			self._ready.notify_all()
+
+	def settimeout(self, timeout: float):
+		self._timeout = timeout
+
+	def gettimeout(self):
+		return self._timeout
+
+	def setblocking(self, flag: bool):
+		self._timeout = None if flag else 0.0
+
+	def setsockopt(self, *args):
+		pass
+
+	def getsockname(self):
+		return self.address
+
+	def getpeername(self):
+		return self.peer_address
+
+	def fileno(self):
+		""" Returns -1 once closed, like a socket. Otherwise, raises
+		    io.UnsupportedOperation, as there is no descriptor to return. """
+
+		if self._closed:
+			return -1
+
+		raise io.UnsupportedOperation("In-memory sockets have no file descriptor.")
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+class MemoryListener:
+	""" CLASS DEFINITION
+
+		An in-memory listening socket, which accepts connections made with
+		MemoryTransport.connect.
+
+	"""
+
+	family = socket.AF_INET
+	type = socket.SOCK_STREAM
+
+	def __init__(self, transport, address: tuple):
+		""" self.__init__(MemoryTransport, tuple) """
+
+		self.transport = transport
+		self.address = address
+
+		self._pending = collections.deque()
+		self._ready = threading.Condition()
+		self._closed = False
+
+	def listen(self, backlog: int = 0):
+		pass
+
+	def _queue(self, connection, address: tuple):
+		""" Queues a connection to be accepted. """
+
+		with self._ready:
+			if self._closed:
+				raise ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")
+
+			self._pending.append((connection, address))
+			self._ready.notify_all()
+
+	def accept(self):
+		""" Waits for a connection, and returns (connection, address). """
+
+		with self._ready:
+			self._ready.wait_for(lambda: len(self._pending) != 0 or self._closed)
+
+			if self._closed:
+				raise OSError(errno.EINVAL, "Invalid argument")
+
+			return self._pending.popleft()
+
+	def shutdown(self, how: int):
+		self.close()
+
+	def close(self):
+		""" Stops listening. Connections that were not accepted are closed. """
+
+		with self._ready:
+			if self._closed:
+				return
+
+			self._closed = True
+			self._ready.notify_all()
+
+			pending = list(self._pending)
+			self._pending.clear()
+
+		self.transport._forget(self)
+
+		for connection, _ in pending:
+			connection.close()
+
+	def setsockopt(self, *args):
+		pass
+
+	def getsockname(self):
+		return self.address
+
+	def fileno(self):
+		if self._closed:
+			return -1
+
+		raise io.UnsupportedOperation("In-memory sockets have no file descriptor.")
+
+class MemoryTransport:
+	""" CLASS DEFINITION
+
+		An in-memory network. The server and its clients must be given the
+		same MemoryTransport.
+
+	"""
+
+	name = "memory"
+
+	def __init__(self, local: bool = False):
+		""" self.__init__(bool)
+
+			Creates a network with no listeners.
+
+			Args:
+				local(bool): If True, then connections are given addresses
+					     that the server treats as local clients, eg
+					     to get the local permission level.
+		"""
+
+		self.local = local
+
+		self._listeners = {}
+		self._ids = itertools.count(1)
+		self._lock = threading.Lock()
+
+	def listen(self, address: tuple):
+		""" self.listen(tuple)
+
+			Creates a listener at address.
+
+			Raises:
+				OSError: If something is already listening there.
+		"""
+
+		with self._lock:
+			if address in self._listeners:
+				raise OSError(errno.EADDRINUSE, "Address already in use")
+
+			listener = MemoryListener(self, address)
+			self._listeners[address] = listener
+
+		return listener
+
+	def connect(self, address: tuple):
+		""" self.connect(tuple)
+
+			Connects to the listener at address.
+
+			Returns:
+				The client's end of the connection.
+
+			Raises:
+				ConnectionRefusedError: If nothing is listening there.
+		"""
+
+		listener = self._listeners.get(address)
+
+		if listener is None:
+			raise ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")
+
+		number = next(self._ids)
+		client_address = ("{}:{}".format("memory" if self.local else "memory-remote", number), number)
+
+		client_end = MemorySocket(client_address, address)
+		server_end = MemorySocket(address, client_address)
+		client_end.peer, server_end.peer = server_end, client_end
+
+		listener._queue(server_end, client_address)
+
+		return client_end
+
+	def _forget(self, listener):
+		""" Removes a closed listener. """
+
+		with self._lock:
+			if self._listeners.get(listener.address) is listener:
+				del self._listeners[listener.address]
@@ -0,0 +1,55 @@
+""" PURPOSE:
+
+	The transport used by default, which connects the server and its
+	clients with TCP sockets.
+"""
+
+import socket
+
+class TCPTransport:
+	""" CLASS DEFINITION
+
+		Creates TCP listeners and connections.
+
+	"""
+
+	name = "tcp"
+
+	def listen(self, address: tuple):
+		""" self.listen(tuple)
+
+			Creates a socket bound to address, ready to listen on.
+
+			Args:
+				address(tuple): The (host, port) to bind to.
+
+			Returns:
+				The socket.
+		"""
+
+		listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+		#: Allow the port to be reused straight after a restart, rather
+		#: than waiting for the old connections to leave TIME_WAIT.
+		listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+		listener.bind(address)
+
+		return listener
+
+	def connect(self, address: tuple):
+		""" self.connect(tuple)
+
+			Connects to a listener.
+
+			Args:
+				address(tuple): The (host, port) to connect to.
+
+			Returns:
+				The connected socket.
+		"""
+
+		connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		connection.connect(address)
+
+		return connection
@@ -0,0 +1,150 @@
+""" PURPOSE:
+
+	A fixed number of threads that run slow jobs (eg commands that
+	rewrite the permission files) away from the threads that read from
+	clients, so that a slow command doesn't stop its client's messages
+	from being read.
+
+	Jobs wait in a bounded queue. When the queue is full, new jobs are
+	refused rather than queued, so a burst of slow commands can't use up
+	memory, or make every other command wait behind it.
+"""
+
+import queue
+import threading
+import traceback
+
+class WorkerPool:
+	""" CLASS DEFINITION
+
+		A bounded pool of worker threads.
+
+	"""
+
+	def __init__(self, workers: int = 4, max_queue: int = 32):
+		""" self.__init__(int, int)
+
+			Args:
+				workers(int): The number of worker threads.
+				max_queue(int): The number of jobs that may wait for a worker.
+		"""
+
+		self.workers = workers
+		self.max_queue = max_queue
+
+		self._jobs = queue.Queue(max_queue)
+		self._threads = []
+
+		#: The number of jobs being run right now.
+		self.active = 0
+		self._active_lock = threading.Lock()
+
+		#: Whether jobs are being accepted. Held while submitting, so that
+		#: no job is queued after the pool has stopped.
+		self.running = False
+		self._submit_lock = threading.Lock()
+
+	@property
+	def depth(self):
+		""" Return the number of jobs waiting for a worker. """
+		return self._jobs.qsize()
+
+	def start(self):
+		""" self.start()
+
+			Starts the worker threads.
+		"""
+
+		with self._submit_lock:
+
+			#: Throw away the None left by the last stop, if any.
+			if not self.running:
+				self._drain()
+
+			self.running = True
+
+		for _ in range(self.workers - len(self._threads)):
+			thread = threading.Thread(target=self._work, daemon=True)
+			self._threads.append(thread)
+			thread.start()
+
+	def stop(self):
+		""" self.stop()
+
+			Stops the worker threads once they finish their current jobs.
+			Jobs still waiting are dropped.
+		"""
+
+		with self._submit_lock:
+			self.running = False
+
+			#: Drop the waiting jobs, so that the workers see None next.
+			#: Each worker puts it back for the next before stopping, so
+			#: one is enough, and always fits in the emptied queue.
+			self._drain()
+			self._jobs.put_nowait(None)
+
+		self._threads = []
+
+	def _drain(self):
+		""" Throws away every waiting job. """
+
+		while True:
+			try:
+				self._jobs.get_nowait()
+			except queue.Empty:
+				break
+
+	def submit(self, job, *args):
+		""" self.submit(callable, *args)
+
+			Queues job(*args) to be run by a worker.
+
+			Args:
+				job(callable): The job.
+				args: The arguments to pass to job.
+
+			Returns:
+				True if the job was queued, and False if the queue is full,
+				or the pool is not running.
+		"""
+
+		with self._submit_lock:
+			if not self.running:
+				return False
+
+			try:
+				self._jobs.put_nowait((job, args))
+			except queue.Full:
+				return False
+
+		return True
+
+	def _work(self):
+		""" Runs jobs until stopped. """
+
+		while True:
+			item = self._jobs.get()
+
+			#: None is used to stop the workers, so pass it on to the next.
+			if item is None:
+				try:
+					self._jobs.put_nowait(None)
+				except queue.Full:
+					pass
+
+				return
+
+			job, args = item
+
+			with self._active_lock:
+				self.active += 1
+
+			try:
+				job(*args)
+			except Exception:
+				#: A failed job should not stop the worker.
+				traceback.print_exc()
+			finally:
+				with self._active_lock:
+					self.active -= 1
@@ -0,0 +1,117 @@
+import unittest
+import os
+import tempfile
+
+from chatroom.capture import CaptureWriter, read_capture, replay_capture
+from chatroom.host import chatroomServer
+from chatroom.protocol import frames
+from chatroom.transport import MemoryTransport
+
+from tests.testTransport import MemoryUser
+
+class testCapture(unittest.TestCase):
+
+	def testCaptureFileFunctionality(self):
+		print("\n---------- testCaptureFileFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "test.capture")
+
+		writer = CaptureWriter(path)
+		writer.record(1, frames.CHAT, "t_user")
+		writer.record(1, frames.COMMAND, "user_list", 2)
+		writer.record(2, frames.CHAT, "héllo")
+		writer.record(1, frames.CLOSE, "")
+		writer.close()
+
+		started, messages = read_capture(path)
+
+		#: A truncated capture can't be read.
+		with open(path, 'rb') as c_file:
+			data = c_file.read()
+		with open(path, 'wb') as c_file:
+			c_file.write(data[:-3])
+
+		with self.assertRaises(ValueError):
+			read_capture(path)
+
+		self.assertEqual(started, writer.started)
+		self.assertEqual([(m.session, m.type, m.seq, m.text) for m in messages],
+				 [(1, frames.CHAT, 0, "t_user"), (1, frames.COMMAND, 2, "user_list"),
+				  (2, frames.CHAT, 0, "héllo"), (1, frames.CLOSE, 0, "")])
+		self.assertEqual(sorted(m.time for m in messages), [m.time for m in messages])
+
+	def testCaptureFunctionality(self):
+		print("\n---------- testCaptureFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "test.capture")
+		transport = MemoryTransport(local=True)
+
+		server = chatroomServer('localhost', 12345, transport=transport)
+		server.start_capture(path)
+		server.start(no_console=True)
+
+		try:
+			user = MemoryUser(transport, "t_user")
+			other = MemoryUser(transport, "t_other")
+			other.reply("/token")
+
+			user.send("hello")
+			other.expect(lambda frame: frame.type == frames.CHAT)
+
+			user.connection.close()
+			other.reply("/user_list")
+
+			count = server.stop_capture()
+		finally:
+			server.stop()
+
+		_, messages = read_capture(path)
+		sessions = {server_id: [(m.type, m.text) for m in messages if m.session == server_id]
+			    for server_id in {m.session for m in messages}}
+
+		self.assertEqual(count, len(messages))
+		self.assertIn([(frames.CHAT, "t_user"), (frames.CHAT, "hello"), (frames.CLOSE, "")],
+			      list(sessions.values()))
+		self.assertIn([(frames.CHAT, "t_other"), (frames.COMMAND, "token"), (frames.COMMAND, "user_list")],
+			      list(sessions.values()))
+
+	def testReplayFunctionality(self):
+		print("\n---------- testReplayFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "test.capture")
+
+		#: Three users join, then take turns sending ten messages each.
+		#: Before logging in, the second user tries a bad resume token and
+		#: a username that is taken, which are not usernames or chat.
+		writer = CaptureWriter(path)
+		writer.record(1, frames.CHAT, "t_user1", at=0)
+		writer.record(2, frames.COMMAND, "resume nothing", at=0)
+		writer.record(2, frames.CHAT, "t_user1", at=0)
+
+		for session in range(2, 4):
+			writer.record(session, frames.CHAT, "t_user{}".format(session), at=0)
+
+		#: The last user's final message repeats their one before it.
+		for i in range(30):
+			writer.record(i % 3 + 1, frames.CHAT, "message {}".format(26 if i == 29 else i),
+				      at=.05 + i * .001)
+
+		#: Give the last messages time to be delivered before leaving.
+		for session in range(1, 4):
+			writer.record(session, frames.CLOSE, "", at=.15)
+		writer.close()
+
+		report = replay_capture(path, speed=1.0, settle=0.2)
+
+		#: Each message is delivered to the other two users.
+		self.assertEqual(report.sessions, 3)
+		self.assertEqual(report.sent, 35)
+		self.assertEqual(report.chat, 30)
+		self.assertEqual(report.delivered, 60)
+		self.assertEqual(len(report.latencies), 60)
+		self.assertTrue(all(latency >= 0 for latency in report.latencies))
+		self.assertGreater(report.throughput, 0)
+		self.assertEqual(len(report.summary()), 3)
+
+	def setUp(self):
+		print("\n")
@@ -87,7 +87,9 @@ class testClient(unittest.TestCase):
 		time.sleep(.01)
 
 		#: Check results.
-		self.assertTrue(any("TEST" in msg[0] for msg in self.server.messages))
+		#: The first message is taken as the username. Connections are
+		#: announced later, so check the username rather than the queue.
+		self.assertIn("TEST", self.server.usrs.values())
 
 		#: Cleanup.
 		client.quit(False)
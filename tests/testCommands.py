@@ -0,0 +1,59 @@
+import unittest
+import os
+import sys
+import tempfile
+
+from chatroom.commands import CommandRegistry
+
+class testCommands(unittest.TestCase):
+
+	def testRegistryFunctionality(self):
+		print("\n---------- testRegistryFunctionality ----------")
+
+		registry = CommandRegistry()
+
+		@registry.command(permission=1, blocking=True)
+		def roll(server_object, client, address, command_args):
+			"""
+				Rolls a dice.
+			"""
+
+		self.assertEqual(registry["roll"][:3], (roll, 1, True))
+		self.assertNotIn("missing", registry)
+
+		#: The help is cached until another command is added.
+		payload = registry.help_payload()
+		self.assertEqual(payload, b"\n/roll - Rolls a dice.\n")
+		self.assertIs(registry.help_payload(), payload)
+
+		registry.register(roll, "dice")
+		self.assertIn(b"/dice", registry.help_payload())
+
+	def testLazyPluginFunctionality(self):
+		print("\n---------- testLazyPluginFunctionality ----------")
+
+		registry = CommandRegistry()
+
+		#: Write a plugin which registers its command when imported.
+		plugin_dir = tempfile.mkdtemp()
+		with open(os.path.join(plugin_dir, "lazy_plugin.py"), "w") as f:
+			f.write("from tests.testCommands import registry\n"
+				"@registry.command()\n"
+				"def wave(server_object, client, address, command_args):\n"
+				"\t''' Waves. '''\n")
+
+		sys.path.insert(0, plugin_dir)
+		sys.modules["tests.testCommands"].registry = registry
+
+		try:
+			registry.add_plugin("lazy_plugin", ["wave"])
+
+			#: Looking up another command does not import the plugin.
+			self.assertIsNone(registry.get("roll"))
+			self.assertNotIn("lazy_plugin", sys.modules)
+
+			self.assertEqual(registry["wave"].help, "Waves.")
+			self.assertIn("lazy_plugin", sys.modules)
+		finally:
+			sys.path.remove(plugin_dir)
+			sys.modules.pop("lazy_plugin", None)
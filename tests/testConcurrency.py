@@ -0,0 +1,163 @@
+import unittest
+import sys
+import threading
+import time
+
+from chatroom.concurrency import LaneQueue, ShardedDict
+from chatroom.host import chatroomServer
+from chatroom.limits import RateLimiter
+from chatroom.protocol import LaneMetrics
+from chatroom.transport import MemoryTransport
+
+from tests.testTransport import MemoryUser
+
+def run_threads(count: int, target):
+	""" Runs target(i) on count threads at once, and waits for them. """
+
+	barrier = threading.Barrier(count)
+
+	def run(i):
+		barrier.wait()
+		target(i)
+
+	threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join(30)
+
+class testConcurrency(unittest.TestCase):
+
+	def testShardedDictFunctionality(self):
+		print("\n---------- testShardedDictFunctionality ----------")
+
+		shared = ShardedDict({'': "Server"})
+		shared["a"] = 1
+		shared["b"] = 2
+		del shared["a"]
+
+		self.assertEqual(shared.get("a"), None)
+		self.assertEqual(shared.setdefault("b", 3), 2)
+		self.assertEqual(shared.pop("c", None), None)
+		self.assertEqual(sorted(shared.keys()), ['', "b"])
+		self.assertEqual(sorted(shared.values(), key=str), [2, "Server"])
+		self.assertIn("b", shared)
+		self.assertEqual(len(shared), 2)
+
+		with self.assertRaises(KeyError):
+			shared["a"]
+
+		#: Threads adding and removing their own keys never lose another's.
+		def churn(i):
+			for j in range(500):
+				shared[(i, j)] = j
+				if j % 2 == 0:
+					self.assertEqual(shared.pop((i, j)), j)
+
+		run_threads(16, churn)
+		shared.clear()
+
+		self.assertEqual(len(shared), 0)
+
+	def testLaneQueueFunctionality(self):
+		print("\n---------- testLaneQueueFunctionality ----------")
+
+		queue = LaneQueue(lambda item: item[0], 2)
+
+		for item in [(1, "a"), (0, "b"), (1, "c"), (0, "d")]:
+			queue.append(item)
+
+		#: Items come from the first lane with any, in the order they were added.
+		self.assertEqual(queue, [(0, "b"), (0, "d"), (1, "a"), (1, "c")])
+		self.assertEqual(queue.pop(), (0, "b"))
+
+		taken = queue.drain()
+		queue.append((1, "e"))
+		queue.requeue(taken)
+
+		self.assertEqual(list(queue), [(0, "d"), (1, "a"), (1, "c"), (1, "e")])
+		self.assertEqual(queue.drop(1), 3)
+		self.assertEqual(queue.pop(), (0, "d"))
+		self.assertEqual(queue.pop(), None)
+
+		#: Threads adding at once never lose an item.
+		run_threads(16, lambda i: [queue.append((i % 2, j)) for j in range(1000)])
+
+		self.assertEqual(len(queue), 16000)
+		self.assertEqual(queue.pop()[0], 0)
+
+	def testShardedStressFunctionality(self):
+		print("\n---------- testShardedStressFunctionality ----------")
+
+		limiter = RateLimiter(0, 1000)
+		metrics = LaneMetrics()
+		allowed = []
+
+		#: Every thread takes tokens from the same bucket, and from its own,
+		#: and records to the same metrics.
+		def hammer(i):
+			count = 0
+			for _ in range(200):
+				count += limiter.allow("shared")
+				limiter.allow(i)
+				metrics.record(2, .001)
+			allowed.append(count)
+
+		run_threads(16, hammer)
+
+		self.assertEqual(sum(allowed), 1000)
+		self.assertEqual(len(limiter.buckets), 17)
+		self.assertEqual(metrics.summary()["chat"][0], 16 * 200)
+
+	def testServerStressFunctionality(self):
+		print("\n---------- testServerStressFunctionality ----------")
+
+		self.server.set_rate_limit("message", 10 ** 6, 10 ** 6)
+		self.server.set_rate_limit("message", 10 ** 6, 10 ** 6, per_ip=True)
+
+		#: Users join, chat and leave at once, while the server sends them
+		#: each other's messages and closes some of them itself.
+		def visit(i):
+			user = MemoryUser(self.transport, "t_user{}".format(i))
+			user.reply("/token")
+
+			for j in range(20):
+				user.send("message {}".format(j))
+
+			if i % 2 == 0:
+				address = self.server.usernames["t_user{}".format(i)][1]
+				client = self.server.usernames["t_user{}".format(i)][0]
+				run_threads(2, lambda _: self.server.close_client(client, address, "stress"))
+			else:
+				user.connection.close()
+
+		run_threads(16, visit)
+
+		#: Wait for the server to notice the users that left. Sessions are
+		#: the last thing to be removed.
+		deadline = time.monotonic() + 10
+		while len(self.server.sessions) != 0 and time.monotonic() < deadline:
+			time.sleep(.01)
+
+		self.assertEqual(self.server.clientlist, [])
+		self.assertEqual(self.server.usrs.items(), [('', "Server")])
+		self.assertEqual(self.server.client_threads.keys(), [])
+		self.assertEqual(len(self.server.sessions), 0)
+		self.assertEqual(self.server.admission.total, 0)
+		self.assertEqual(self.server.admission.sessions, {})
+
+	def setUp(self):
+		print("\n")
+
+		#: Switch threads as often as possible, so that builds with the
+		#: GIL interleave almost as much as builds without it.
+		self.interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-6)
+
+		self.transport = MemoryTransport(local=True)
+		self.server = chatroomServer('localhost', 12345, transport=self.transport)
+		self.server.start(no_console=True)
+
+	def tearDown(self):
+		self.server.stop()
+		sys.setswitchinterval(self.interval)
@@ -0,0 +1,90 @@
+import unittest
+import os
+import tempfile
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.filters import KeywordAutomaton, FilterPipeline, KeywordFilter, LinkFilter
+
+class testFilters(unittest.TestCase):
+
+	def testKeywordAutomatonFunctionality(self):
+		print("\n---------- testKeywordAutomatonFunctionality ----------")
+
+		automaton = KeywordAutomaton(["he", "she", "his", "hers"], whole_words=False)
+
+		#: Overlapping keywords are all found, in one pass.
+		self.assertEqual(sorted(automaton.finditer("ushers")), [("he", 2), ("hers", 2), ("she", 1)])
+
+		#: By default, keywords only match whole words, regardless of case.
+		automaton = KeywordAutomaton(["ass", "spam eggs"])
+		self.assertIsNone(automaton.search("a classic"))
+		self.assertEqual(automaton.search("SPAM EGGS, please"), "spam eggs")
+
+	def testPipelineFunctionality(self):
+		print("\n---------- testPipelineFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "filters.rules")
+		with open(path, "w") as f:
+			f.write("# Moderation rules\nword darn\nregex buy\\s+now\nregex ^!{3,}\nlinks\n")
+
+		pipeline = FilterPipeline()
+		self.assertIsNone(pipeline.check("darn it"))
+
+		self.assertEqual(pipeline.load(path), 3)
+
+		results = [pipeline.check(text) for text in ("hello", "well DARN", "Buy   now!", "see www.example.com",
+							     "example.org/page", "!!!!")]
+
+		#: An invalid rules file is refused, and the old rules are kept.
+		with open(path, "w") as f:
+			f.write("regex (unclosed\n")
+
+		with self.assertRaises(ValueError):
+			pipeline.load(path)
+
+		summary = pipeline.summary()
+
+		#: Patterns with global flags or backreferences are kept apart, so
+		#: that they mean the same as they would on their own.
+		with open(path, "w") as f:
+			f.write("regex (?s)foo.bar\nregex baz\nregex (a)b\\1\n")
+
+		regex = FilterPipeline()
+		self.assertEqual(regex.load(path), 1)
+
+		matched = [regex.check(text) is not None for text in ("FOO\nbar", "Baz", "aba", "abb", "ab")]
+
+		self.assertEqual([result[0] if result else None for result in results],
+				 [None, "keywords", "regex", "links", "links", "regex"])
+		self.assertEqual(len(pipeline.filters), 3)
+		self.assertEqual(summary["keywords"][0], 6)
+		self.assertEqual(summary["keywords"][3], 1)
+		self.assertEqual(summary["links"][3], 2)
+		self.assertEqual(matched, [True, True, True, False, False])
+
+	def testServerFilterFunctionality(self):
+		print("\n---------- testServerFilterFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.filters.replace([KeywordFilter(["darn"]), LinkFilter()])
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		server.messages = []
+		client.send("darn it")
+		time.sleep(.1)
+
+		blocked = client.most_recent_message
+		queued = list(server.messages)
+
+		client.quit(False)
+		server.stop()
+
+		self.assertEqual(blocked, "Your message was not sent, as it contains a banned word.")
+		self.assertEqual(queued, [])
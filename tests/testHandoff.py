@@ -0,0 +1,227 @@
+import unittest
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.commands import server_command_list
+from chatroom.host import chatroomServer
+from chatroom.handoff import HandoffSender, HandoffReceiver
+from chatroom.handoff.unix_handoff import _recv_record
+from chatroom.protocol import Session, frames
+from chatroom.protocol.outbox import lane_for
+
+class testHandoff(unittest.TestCase):
+
+	def testUpgradeFunctionality(self):
+		print("\n---------- testUpgradeFunctionality ----------")
+
+		#: Setup a running server with a named client.
+		directory = tempfile.mkdtemp()
+		snapshot_path = os.path.join(directory, "server.snapshot")
+
+		old_server = chatroomServer('localhost', 12345, snapshot_path=snapshot_path)
+		old_server.start(no_console=True)
+		token = old_server.get_resume_token("t_other")
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: Start the new server, which waits for the handoff.
+		path = os.path.join(directory, "handoff.sock")
+		servers = []
+		new_thread = threading.Thread(target=lambda: servers.append(
+			chatroomServer('localhost', 12345, inherit=path, snapshot_path=snapshot_path)))
+		new_thread.start()
+
+		while not os.path.exists(path):
+			time.sleep(.01)
+
+		#: Hand over to the new server.
+		upgrade_thread = threading.Thread(target=old_server.upgrade, args=(path,),
+						  kwargs={"drain_timeout": .5})
+		upgrade_thread.start()
+
+		new_thread.join()
+		new_server = servers[0]
+		new_server.start(no_console=True)
+
+		#: Send a message, and connect another client, while the old
+		#: server is draining.
+		client.send("hello")
+		spare_client = chatroomClient()
+		spare_client.join('localhost', 12345, silent=True)
+
+		upgrade_thread.join()
+		time.sleep(1.2) #: Allow time for the message to be broadcast.
+
+		#: Check results before cleaning up.
+		clients = len(new_server.clientlist)
+		username = new_server.usrs.get("127.0.0.1")
+		tokens = dict(new_server.resume_tokens)
+		recieved = client.most_recent_message
+		connected = client.client.fileno() != -1
+
+		client.quit(False)
+		spare_client.quit(False)
+		new_server.stop()
+
+		#: The client kept its connection and username, its message was
+		#: broadcast by the new server, and the new client was adopted.
+		self.assertTrue(connected)
+		self.assertEqual(clients, 2)
+		self.assertEqual(username, "t_user")
+		self.assertIn("hello", recieved)
+
+		#: The new server started with the old server's state.
+		self.assertEqual(tokens.get(token), "t_other")
+
+	def testLargeSessionFunctionality(self):
+		print("\n---------- testLargeSessionFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "handoff.sock")
+		receivers = []
+		receive_thread = threading.Thread(target=lambda: receivers.append(HandoffReceiver(path)))
+		receive_thread.start()
+
+		while not os.path.exists(path):
+			time.sleep(.01)
+
+		sender = HandoffSender(path)
+		receive_thread.join()
+
+		#: A session with far more queued than fits in a single packet.
+		client, other = socket.socketpair()
+		session = Session(client, "127.0.0.1", 7, 1)
+		outbox = [(.5, (frames.CHAT, "{:04d}".format(i) * 250, 0, None)) for i in range(100)]
+
+		results = []
+		read_thread = threading.Thread(target=lambda: results.append(receivers[0].receive()))
+		read_thread.start()
+
+		sender.send_listener(other)
+		sender.send_session(session, "t_user", outbox)
+		sender.ready()
+		read_thread.join()
+
+		_, sessions, _ = results[0]
+
+		self.assertEqual(len(sessions), 1)
+		self.assertEqual(sessions[0]["username"], "t_user")
+		self.assertEqual(sessions[0]["outbox"], outbox)
+
+		sender.done()
+		receivers[0].close()
+		client.close()
+		other.close()
+
+	def testHandoffOutboxFunctionality(self):
+		print("\n---------- testHandoffOutboxFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		client, other = socket.socketpair()
+		session = Session(client, "127.0.0.1", 7, 1)
+
+		outbox = [(lane_for(frame_type), .5, (frame_type, "x" * 1000, 0, None))
+			  for frame_type in [frames.CHAT, frames.NOTICE, frames.CHAT, frames.REPLY]]
+
+		#: Everything queued is handed over to a client that is keeping up.
+		self.assertEqual(len(server.handoff_outbox(session, outbox)), 4)
+
+		#: A client too far behind to be sent chat is not handed it either.
+		session.lag_state = server.lag_policy.DEGRADE
+		kept = server.handoff_outbox(session, outbox)
+
+		self.assertEqual([message[0] for _, message in kept], [frames.NOTICE, frames.REPLY])
+		self.assertEqual(session.missed, 2)
+
+		#: Nor is a client with more queued than the DEGRADE limit.
+		session.lag_state = 0
+		server.lag_policy.set_limits(server.lag_policy.DEGRADE, None, 2500)
+
+		self.assertEqual(len(server.handoff_outbox(session, outbox)), 2)
+
+		server.server.close()
+		server.mailboxes.close()
+		client.close()
+		other.close()
+
+	def testFailedUpgradeFunctionality(self):
+		print("\n---------- testFailedUpgradeFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: A successor that takes the listener, but goes away before
+		#: acknowledging the session.
+		path = os.path.join(tempfile.mkdtemp(), "handoff.sock")
+		listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		listener.bind(path)
+		listener.listen(1)
+
+		def fail():
+			channel, _ = listener.accept()
+			for _ in range(2):
+				_, sockets = _recv_record(channel)
+				for s in sockets:
+					s.close()
+			channel.close()
+
+		fail_thread = threading.Thread(target=fail)
+		fail_thread.start()
+
+		upgraded = server.upgrade(path, drain_timeout=.1)
+		fail_thread.join()
+		listener.close()
+
+		#: The server kept its client, which can still chat.
+		client.send("still here")
+		time.sleep(1.2)
+
+		recieved = [line.text for line in client.scrollback.find("still here")]
+		clients = len(server.clientlist)
+
+		client.quit(False)
+		server.stop()
+
+		self.assertFalse(upgraded)
+		self.assertEqual(clients, 1)
+		self.assertEqual(recieved, ["(t_user - user): still here"])
+
+	def testMissingSuccessorFunctionality(self):
+		print("\n---------- testMissingSuccessorFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: Nothing is waiting at the path, so the console command keeps
+		#: this server running rather than exiting.
+		path = os.path.join(tempfile.mkdtemp(), "missing.sock")
+		server_command_list["upgrade"][0](server, ["upgrade", path])
+
+		draining = server.draining
+
+		client.send("still here")
+		time.sleep(1.2)
+
+		recieved = [line.text for line in client.scrollback.find("still here")]
+
+		client.quit(False)
+		server.stop()
+
+		self.assertFalse(draining)
+		self.assertEqual(recieved, ["(t_user - user): still here"])
@@ -3,6 +3,8 @@ import socket
 import time
 import traceback
 import threading
+import os
+import tempfile
 
 from chatroom.client import chatroomClient
 from chatroom.host import chatroomServer
@@ -121,7 +123,7 @@ class testHost(unittest.TestCase):
 	def testChangePermissionsFunctionality(self):
 		print("---------- testChangePermissionsFunctionality ----------")
 
-		self.server.permission_types["TEST"] = Permissions('TEST', -1)
+		self.server.permission_types["TEST"] = Permissions('TEST', -1, self.permissions_dir)
 
 		#: Setup
 		self.server.start(no_console=True)
@@ -181,9 +183,33 @@ class testHost(unittest.TestCase):
 		self.assertEqual(spare_client.most_recent_message, "(server): test")
 
 
+	def testListenUnixFunctionality(self):
+		print("---------- testListenUnixFunctionality ----------")
+
+		#: Setup a Unix socket, giving local clients admin permissions.
+		path = os.path.join(tempfile.mkdtemp(), "chatroom.sock")
+		self.server.listen_unix(path, "admin")
+		self.server.start(no_console=True)
+
+		#: Connect over the Unix socket.
+		self.client.join(path, silent=True)
+		self.client.send("t_user")
+		time.sleep(.1) #: Allow time for the server to see the username.
+
+		addr = self.server.get_ip("t_user")
+
+		#: The client should have a local address, and the local permission level,
+		#: without it being saved to the permission files.
+		self.assertTrue(self.server.is_local(addr))
+		self.assertEqual(self.server.permissions[addr].permission, "admin")
+		self.assertNotIn(addr, self.server.permission_types["admin"].get_clients())
+
 	def setUp(self):
 		print("\n")
-		self.server = chatroomServer('localhost', 12345)
+
+		#: Keep the permission files out of the package.
+		self.permissions_dir = tempfile.mkdtemp()
+		self.server = chatroomServer('localhost', 12345, permissions_dir=self.permissions_dir)
 		self.client = chatroomClient()
 
 	def tearDown(self):
@@ -0,0 +1,331 @@
+import unittest
+import socket
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.limits import TokenBucket, RateLimiter, LagPolicy, MemoryBudget, AdmissionControl, consume_all
+from chatroom.protocol import frames, Session
+
+class testLimits(unittest.TestCase):
+
+	def testTokenBucketFunctionality(self):
+		print("\n---------- testTokenBucketFunctionality ----------")
+
+		bucket = TokenBucket(10, 3)
+
+		#: A full bucket allows a burst, and then refuses.
+		self.assertTrue(all(bucket.consume() for _ in range(3)))
+		self.assertFalse(bucket.consume())
+
+		#: After waiting, the bucket should have refilled.
+		time.sleep(.15)
+		self.assertTrue(bucket.consume())
+
+		#: A refusal from one bucket leaves the others untouched.
+		session, address = TokenBucket(0, 1), TokenBucket(0, 0)
+		self.assertFalse(consume_all([session, address]))
+		self.assertEqual(session.tokens, 1)
+
+		address.burst = address.tokens = 1
+		self.assertTrue(consume_all([session, address]))
+		self.assertEqual((session.tokens, address.tokens), (0, 0))
+
+	def testRateLimiterFunctionality(self):
+		print("\n---------- testRateLimiterFunctionality ----------")
+
+		limiter = RateLimiter(0, 1)
+
+		#: Each key has its own bucket.
+		self.assertTrue(limiter.allow("a"))
+		self.assertFalse(limiter.allow("a"))
+		self.assertTrue(limiter.allow("b"))
+
+		#: Forgetting a key gives it a new, full bucket.
+		limiter.forget("a")
+		self.assertTrue(limiter.allow("a"))
+
+		#: Only buckets that have refilled, or gone unused for too long,
+		#: are expired.
+		limiter.allow("c", 0)
+		self.assertEqual(limiter.expire(), 1)
+		self.assertEqual(sorted(limiter.buckets), ["a", "b"])
+
+		self.assertEqual(limiter.expire(max_idle=0), 2)
+		self.assertEqual(limiter.buckets, {})
+
+		limiter = RateLimiter(20, 1)
+		limiter.allow("a")
+		self.assertEqual(limiter.expire(), 0)
+
+		time.sleep(.1)
+		self.assertEqual(limiter.expire(), 1)
+
+	def testServerThrottleFunctionality(self):
+		print("\n---------- testServerThrottleFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.set_rate_limit("message", 0, 1)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: The first message is within the limit, the second is not.
+		server.messages = []
+		client.send("first")
+		time.sleep(.1)
+		client.send("second")
+		time.sleep(.1)
+
+		#: Check results before cleaning up, as the close message will
+		#: replace the most recent message.
+		throttle_msg = client.most_recent_message
+		throttle_type = client.scrollback.latest().type
+		queued = list(server.messages)
+
+		client.quit(False)
+		server.stop()
+
+		self.assertFalse(any("second" in msg[0] for msg in queued))
+		self.assertEqual(throttle_msg, "You are sending messages too quickly, please slow down.")
+
+		#: Throttled messages are refused in the same way as throttled commands.
+		self.assertEqual(throttle_type, frames.ERROR)
+
+	def testReconnectThrottleFunctionality(self):
+		print("\n---------- testReconnectThrottleFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.set_rate_limit("message", 0, 1, per_ip=True)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		client.send("first")
+		time.sleep(.1)
+		client.quit(False)
+		time.sleep(.1)
+
+		#: Reconnecting from the same address doesn't refill its bucket.
+		server.messages = []
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		client.send("second")
+		time.sleep(.1)
+
+		throttle_msg = client.most_recent_message
+		queued = list(server.messages)
+
+		client.quit(False)
+		server.stop()
+
+		self.assertFalse(any("second" in msg[0] for msg in queued))
+		self.assertEqual(throttle_msg, "You are sending messages too quickly, please slow down.")
+
+	def testLagPolicyFunctionality(self):
+		print("\n---------- testLagPolicyFunctionality ----------")
+
+		policy = LagPolicy(warn_age=1, degrade_age=2, disconnect_age=3,
+				   warn_bytes=100, degrade_bytes=200, disconnect_bytes=None)
+
+		self.assertEqual(policy.assess(0, 0), LagPolicy.OK)
+		self.assertEqual(policy.assess(150, 0), LagPolicy.WARN)
+		self.assertEqual(policy.assess(0, 2.5), LagPolicy.DEGRADE)
+		self.assertEqual(policy.assess(10 ** 9, 0), LagPolicy.DEGRADE)
+		self.assertEqual(policy.assess(0, 4), LagPolicy.DISCONNECT)
+
+	def testSlowConsumerFunctionality(self):
+		print("\n---------- testSlowConsumerFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.lag_policy = LagPolicy(warn_age=None, degrade_age=None, disconnect_age=None,
+					      warn_bytes=1000, degrade_bytes=20000, disconnect_bytes=None)
+
+		#: A client that never reads, with as little buffer as possible.
+		server_end, client_end = socket.socketpair()
+		for end in (server_end, client_end):
+			end.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+			end.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+
+		session = Session(server_end, "10.0.0.1", 1, version=frames.VERSION)
+		server.clientlist.append((server_end, "10.0.0.1"))
+		server.sessions[server_end] = session
+
+		session.send_many([(frames.CHAT, "x" * 1000, 2) for _ in range(100)])
+		time.sleep(.2)
+
+		behind = session.lag()
+		server.check_lag()
+		degraded = session.lag_state
+
+		#: Chat is dropped, and only counted, while the client is behind.
+		queued = session.lag()[0]
+
+		server_end.close()
+		client_end.close()
+		server.server.close()
+
+		self.assertGreater(behind[0], 20000)
+		self.assertEqual(degraded, LagPolicy.DEGRADE)
+		self.assertLess(queued, 1000)
+		self.assertGreater(session.missed, 0)
+
+	def testEvictionFunctionality(self):
+		print("\n---------- testEvictionFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.lag_policy = LagPolicy(warn_age=None, degrade_age=None, disconnect_age=None,
+					      warn_bytes=None, degrade_bytes=None, disconnect_bytes=20000)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: A client that never reads, whose writer is stuck in sendall.
+		server_end, client_end = socket.socketpair()
+		for end in (server_end, client_end):
+			end.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+			end.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+
+		session = Session(server_end, "10.0.0.1", 1, version=frames.VERSION)
+		server.sessions[server_end] = session
+		with server.clients_lock:
+			server.clientlist.append((server_end, "10.0.0.1"))
+
+		session.send_many([(frames.CHAT, "x" * 1000, 2) for _ in range(100)])
+
+		#: Removing it doesn't hold up chat to everyone else.
+		started = time.time()
+		server.send_all("on time")
+
+		while "on time" not in (client.most_recent_message or "") and time.time() - started < 5:
+			time.sleep(.01)
+
+		elapsed = time.time() - started
+		evicted = (server_end, "10.0.0.1") not in server.clientlist
+
+		client.quit(False)
+		server.stop()
+		client_end.close()
+
+		self.assertTrue(evicted)
+		self.assertLess(elapsed, .5)
+
+	def testMemoryBudgetFunctionality(self):
+		print("\n---------- testMemoryBudgetFunctionality ----------")
+
+		budget = MemoryBudget(1000, refuse=0.5, trim=0.75, drop=1.0)
+
+		self.assertEqual(budget.update({"history": 100}), MemoryBudget.NORMAL)
+		self.assertEqual(budget.update({"history": 600}), MemoryBudget.REFUSE)
+		self.assertEqual(budget.update({"history": 600, "messages": 500}), MemoryBudget.DROP)
+		self.assertEqual(budget.update({}), MemoryBudget.NORMAL)
+
+		#: Passing straight to DROP counts as entering every stage before it.
+		self.assertEqual(budget.summary()["entered"], {"normal": 0, "refuse": 1, "trim": 1, "drop": 1})
+
+	def testLoadSheddingFunctionality(self):
+		print("\n---------- testLoadSheddingFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.memory_budget = MemoryBudget(10000)
+
+		server.history.clear()
+		server.history.extend(("x" * 200, "") for _ in range(60))
+		server.broadcast("notice", "")
+		server.check_memory()
+
+		#: Over budget, history is trimmed and chat is no longer queued.
+		server.broadcast("chat", "10.0.0.1", frames.CHAT)
+		summary = server.memory_budget.summary()
+
+		server.server.close()
+
+		self.assertEqual(summary["stage"], "drop")
+		self.assertEqual(len(server.history), 10)
+		self.assertEqual(summary["shed"]["history"], 50)
+		self.assertEqual(summary["shed"]["chat"], 1)
+		self.assertEqual([message[0] for message in server.messages], ["notice"])
+
+	def testDropQueuedChatFunctionality(self):
+		print("\n---------- testDropQueuedChatFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+
+		#: A large backlog of chat, with notices among it.
+		for i in range(5000):
+			server.broadcast("chat {}".format(i), "10.0.0.1", frames.CHAT)
+			if i % 1000 == 0:
+				server.broadcast("notice {}".format(i), "")
+
+		server.memory_budget = MemoryBudget(1000)
+		server.check_memory()
+		server.server.close()
+
+		#: The chat is thrown away, and the notices kept in order.
+		self.assertEqual(server.memory_budget.summary()["shed"]["chat"], 5000)
+		self.assertEqual([message[0] for message in server.messages],
+				 ["notice {}".format(i) for i in range(0, 5000, 1000)])
+
+	def testAdmissionFunctionality(self):
+		print("\n---------- testAdmissionFunctionality ----------")
+
+		control = AdmissionControl(max_sessions=3, max_per_address=2, accept_rate=0, accept_burst=10)
+
+		self.assertIsNone(control.admit("a"))
+		control.add("a")
+		control.add("a")
+		self.assertEqual(control.admit("a"), "address")
+
+		control.add("b")
+		self.assertEqual(control.admit("c"), "sessions")
+
+		#: Closing a session makes room for another.
+		control.release("a")
+		self.assertIsNone(control.admit("c"))
+
+		control.deny("c")
+		self.assertEqual(control.admit("c"), "denied")
+
+		#: The accept bucket only refills at accept_rate.
+		control.allow("c")
+		results = [control.admit("c") for _ in range(10)]
+
+		self.assertEqual(results.count("rate"), 4)
+		self.assertEqual(control.refused, {"denied": 1, "rate": 4, "sessions": 1, "address": 1})
+
+	def testServerAdmissionFunctionality(self):
+		print("\n---------- testServerAdmissionFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.admission.max_per_address = 1
+		server.start(no_console=True)
+
+		first = socket.create_connection(('localhost', 12345))
+		time.sleep(.1)
+
+		#: A second connection from the same address is told why, and closed.
+		second = socket.create_connection(('localhost', 12345))
+		second.settimeout(5)
+		refusal = second.recv(1024)
+
+		first.close()
+		second.close()
+		time.sleep(.1)
+		sessions = server.admission.total
+
+		server.stop()
+
+		self.assertIn(b"Too many connections", refusal)
+		self.assertEqual(sessions, 0)
@@ -0,0 +1,123 @@
+import unittest
+import os
+import tempfile
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.protocol import frames
+from chatroom.mailboxes import MailboxStore
+
+class testMessages(unittest.TestCase):
+
+	def testDirectMessageFunctionality(self):
+		print("\n---------- testDirectMessageFunctionality ----------")
+
+		#: The recipient connects over the Unix socket, so that the two
+		#: clients have different addresses.
+		self.server.listen_unix(os.path.join(tempfile.mkdtemp(), "chatroom.sock"))
+		self.server.start(no_console=True)
+
+		self.client.join('localhost', 12345, silent=True)
+		self.client.send("t_alice")
+		self.recipient.join(self.server.unix_path, silent=True)
+		self.recipient.send("t_bob")
+		time.sleep(.1)
+
+		self.server.messages = []
+
+		#: Usernames are matched regardless of case.
+		sent = self.client.get_reply(self.client.request("/msg T_BOB hello there"), timeout=1)
+		offline = self.client.get_reply(self.client.request("/msg t_carol hello"), timeout=1)
+		reserved = self.client.get_reply(self.client.request("/msg server hello"), timeout=1)
+		time.sleep(.1)
+
+		self.assertEqual(sent, (frames.REPLY, "Message sent to T_BOB."))
+		self.assertEqual(offline[0], frames.REPLY)
+		self.assertEqual(reserved, (frames.ERROR, "server can't be sent messages."))
+		self.assertEqual(self.server.mailboxes.collect("server"), [])
+		self.assertEqual(self.recipient.most_recent_message, "(private) t_alice: hello there")
+
+		#: The message should not have been broadcast.
+		self.assertEqual(self.server.messages, [])
+
+	def testOfflineMailFunctionality(self):
+		print("\n---------- testOfflineMailFunctionality ----------")
+
+		self.server.listen_unix(os.path.join(tempfile.mkdtemp(), "chatroom.sock"))
+		self.server.start(no_console=True)
+
+		self.client.join('localhost', 12345, silent=True)
+		self.client.send("t_alice")
+		time.sleep(.1)
+
+		#: t_bob is not connected, so the messages wait in his mailbox.
+		stored = self.client.get_reply(self.client.request("/msg t_bob first"), timeout=1)
+		self.client.get_reply(self.client.request("/msg t_bob second"), timeout=1)
+
+		self.recipient.join(self.server.unix_path, silent=True)
+		self.recipient.send("t_bob")
+		time.sleep(.1)
+
+		self.assertEqual(stored, (frames.REPLY,
+			"t_bob is not online, so they will get your message when they next connect."))
+		self.assertTrue(self.recipient.most_recent_message.endswith("t_alice: second"))
+
+		#: Delivered mail is removed from the mailbox.
+		self.assertEqual(self.server.mailboxes.collect("t_bob"), [])
+
+	def testMailboxStoreFunctionality(self):
+		print("\n---------- testMailboxStoreFunctionality ----------")
+
+		store = MailboxStore(":memory:", max_messages=2, max_age=60)
+
+		#: Mailboxes are bounded, and usernames match regardless of case.
+		self.assertTrue(store.add("Bob", "alice", "one"))
+		self.assertTrue(store.add("bob", "alice", "two"))
+		self.assertFalse(store.add("BOB", "alice", "three"))
+
+		mail = store.collect("bob")
+		self.assertEqual([message for _, _, message, _ in mail], ["one", "two"])
+
+		store.discard([mail[0][0]])
+		self.assertEqual(len(store.collect("bob")), 1)
+
+		#: Expired mail is not delivered, and makes room for new mail.
+		store.max_age = -1
+		self.assertEqual(store.collect("bob"), [])
+		self.assertTrue(store.add("bob", "alice", "four"))
+
+		store.close()
+
+		#: Senders can't fill the database by mailing made-up users.
+		store = MailboxStore(":memory:", max_sent=3, max_total=5)
+
+		self.assertTrue(all(store.add("nobody{}".format(i), "alice", "hi") for i in range(3)))
+		self.assertFalse(store.add("nobody3", "alice", "hi"))
+
+		self.assertTrue(store.add("bob", "carol", "one"))
+		self.assertTrue(store.add("bob", "carol", "two"))
+		self.assertFalse(store.add("bob", "dave", "three"))
+
+		store.close()
+
+		#: Mail kept in a file is still there once reopened.
+		server = chatroomServer('localhost', 12345, mailboxes_path=os.path.join(tempfile.mkdtemp(), "mailboxes.db"))
+		server.mailboxes.add("bob", "alice", "five")
+		server.mailboxes.close()
+		server.server.close()
+
+		store = MailboxStore(server.mailboxes.path)
+		self.assertEqual([message for _, _, message, _ in store.collect("bob")], ["five"])
+		store.close()
+
+	def setUp(self):
+		print("\n")
+		self.server = chatroomServer('localhost', 12345)
+		self.client = chatroomClient()
+		self.recipient = chatroomClient()
+
+	def tearDown(self):
+		self.client.quit(False)
+		self.recipient.quit(False)
+		self.server.stop()
@@ -0,0 +1,116 @@
+import unittest
+import os
+import tempfile
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.commands import client_commands
+from chatroom.host import chatroomServer
+from chatroom.presence import PresenceCoalescer, UserIndex
+from chatroom.protocol import frames
+
+class testPresence(unittest.TestCase):
+
+	def testSmallRoomFunctionality(self):
+		print("\n---------- testSmallRoomFunctionality ----------")
+
+		presence = PresenceCoalescer(window=60, threshold=2)
+		presence.connected("alice", "1.1.1.1")
+		presence.disconnected("bob", "2.2.2.2")
+
+		#: Nothing is announced until the window has passed.
+		self.assertEqual(presence.flush(), [])
+
+		#: Few enough users are announced one by one.
+		self.assertEqual(presence.flush(force=True), [("alice has connected.", "1.1.1.1"),
+								("bob Has disconnected.", "2.2.2.2")])
+		self.assertEqual(presence.flush(force=True), [])
+
+	def testSummaryFunctionality(self):
+		print("\n---------- testSummaryFunctionality ----------")
+
+		presence = PresenceCoalescer(window=0, threshold=2)
+
+		for i in range(3):
+			presence.connected("user{}".format(i), "")
+		presence.disconnected("leaver", "")
+
+		#: A user who leaves and comes back is not announced.
+		presence.disconnected("blip", "")
+		presence.connected("BLIP", "")
+
+		self.assertEqual(presence.flush(), [("3 users have connected and 1 users have disconnected.", "")])
+
+	def testUserIndexFunctionality(self):
+		print("\n---------- testUserIndexFunctionality ----------")
+
+		index = UserIndex()
+		for name in ["carol", "Bob", "alice", "bobby", "dave"]:
+			self.assertTrue(index.claim(name, name, ""))
+
+		#: Names are unique regardless of case.
+		self.assertFalse(index.claim("BOB", None, ""))
+		self.assertEqual(index.get("BOB"), ("Bob", ""))
+
+		#: Pages are in order, and can be filtered by prefix.
+		self.assertEqual(index.page(1, 2), (["alice", "Bob"], 5))
+		self.assertEqual(index.page(3, 2), (["dave"], 5))
+		self.assertEqual(index.page(1, 2, "BO"), (["Bob", "bobby"], 2))
+
+		#: Listing after a name carries on from it, in any case.
+		self.assertEqual(index.after("", 2), (["alice", "Bob"], 3))
+		self.assertEqual(index.after("BOB", 2), (["bobby", "carol"], 1))
+		self.assertEqual(index.after("dave", 2), ([], 0))
+
+		#: Only the client that has a name can release it.
+		index.release("bob", "someone else")
+		self.assertIn("bob", index)
+		index.release("bob", "Bob")
+		self.assertEqual(index.page(1, 10, "bo"), (["bobby"], 1))
+
+	def testSubscribeFunctionality(self):
+		print("\n---------- testSubscribeFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.listen_unix(os.path.join(tempfile.mkdtemp(), "chatroom.sock"))
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: Send the list a couple of users at a time, as it would be for
+		#: a room too large to fit in one frame.
+		for i in range(3):
+			server.usernames.claim("bot{}".format(i), None, "")
+
+		chunk_size = client_commands.USER_LIST_CHUNK_SIZE
+		client_commands.USER_LIST_CHUNK_SIZE = 2
+
+		try:
+			subscribed = client.subscribe_presence()
+		finally:
+			client_commands.USER_LIST_CHUNK_SIZE = chunk_size
+		members = set(client.members)
+
+		#: Another user connects, which the subscriber should be told about.
+		other = chatroomClient()
+		other.join(server.unix_path, silent=True)
+		other.send("t_other")
+
+		#: Changes are held for a second, and handle_messaging checks for
+		#: them once a second.
+		time.sleep(2.2)
+
+		joined = set(client.members)
+		page = client.get_reply(client.request("/user_list 1 t_"), timeout=1)
+
+		other.quit(False)
+		client.quit(False)
+		server.stop()
+
+		self.assertTrue(subscribed)
+		self.assertEqual(members, {"Server", "t_user", "bot0", "bot1", "bot2"})
+		self.assertEqual(joined, {"Server", "t_user", "t_other", "bot0", "bot1", "bot2"})
+		self.assertEqual(page, (frames.REPLY, "Users (page 1 of 1):\nt_other\nt_user"))
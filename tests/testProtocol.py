@@ -0,0 +1,260 @@
+import unittest
+import socket
+import threading
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.protocol import frames, outbox, FrameReader, StreamCompressor, StreamDecompressor
+from chatroom.protocol import Outbox, LaneMetrics, Session
+
+class testProtocol(unittest.TestCase):
+
+	def testFrameReaderFunctionality(self):
+		print("\n---------- testFrameReaderFunctionality ----------")
+
+		data = frames.encode_frame(frames.CHAT, 1, 7, "hello".encode())
+		data += frames.encode_frame(frames.CLOSE, 2, 0, "bye".encode())
+
+		#: Frames split across reads are only returned once complete.
+		reader = FrameReader()
+		self.assertEqual(reader.feed(data[:5]), [])
+		recieved = reader.feed(data[5:])
+
+		self.assertEqual([(f.type, f.seq, f.sender, f.payload) for f in recieved],
+				 [(frames.CHAT, 1, 7, b"hello"), (frames.CLOSE, 2, 0, b"bye")])
+
+		#: A length over the limit is refused, rather than buffered.
+		reader = FrameReader()
+		with self.assertRaises(frames.ProtocolError):
+			reader.feed(frames.HEADER.pack(frames.CHAT, 0, 1, 0, frames.MAX_PAYLOAD + 1))
+
+	def testNegotiationFunctionality(self):
+		print("\n---------- testNegotiationFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.start(no_console=True)
+
+		#: One client speaks frames, and one plain text.
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+
+		text_client = chatroomClient(binary=False)
+		text_client.join('localhost', 12345, silent=True)
+		text_client.send("t_text")
+		time.sleep(.1)
+
+		versions = sorted(session.version for session in server.sessions.values())
+
+		client.send("/token")
+		time.sleep(.1)
+
+		#: Check results before cleaning up.
+		negotiated = client.negotiated
+		reply = client.most_recent_message
+		tokens = dict(server.resume_tokens)
+
+		client.quit(False)
+		text_client.quit(False)
+		server.stop()
+
+		self.assertEqual(versions, [0, frames.VERSION])
+		self.assertTrue(negotiated)
+		self.assertIn(reply, tokens)
+
+	def testSplitHelloFunctionality(self):
+		print("\n---------- testSplitHelloFunctionality ----------")
+
+		server_end, client_end = socket.socketpair()
+		client_end.settimeout(5)
+
+		#: A hello that arrives a byte at a time is still a hello.
+		session = Session(server_end, "127.0.0.1", 1)
+		for byte in frames.encode_hello(frames.VERSION, 0):
+			session.feed(bytes([byte]))
+
+		split = (session.negotiated, session.version, client_end.recv(100))
+
+		session.feed(frames.encode_frame(frames.CHAT, 1, 0, b"t_user"))
+		pending = list(session.pending)
+
+		#: A version 1 hello has no options byte, and plain text is not
+		#: held back.
+		old = Session(server_end, "127.0.0.1", 2)
+		old.feed(frames.encode_hello(1))
+		text = Session(server_end, "127.0.0.1", 3)
+		text.feed(b"t_text")
+
+		for each in (session, old, text):
+			each.close()
+		server_end.close()
+		client_end.close()
+
+		self.assertEqual(split, (True, frames.VERSION, frames.encode_hello(frames.VERSION, 0)))
+		self.assertEqual(pending, [(frames.CHAT, "t_user", 1)])
+		self.assertEqual((old.negotiated, old.version), (True, 1))
+		self.assertEqual((text.negotiated, text.version, list(text.pending)),
+				 (True, 0, [(frames.CHAT, "t_text", None)]))
+
+	def testCompressionFunctionality(self):
+		print("\n---------- testCompressionFunctionality ----------")
+
+		compressor = StreamCompressor(threshold=16)
+		decompressor = StreamDecompressor()
+
+		#: Short payloads are sent raw.
+		self.assertEqual(compressor.compress(b"hi"), (0, b"hi"))
+
+		#: Only the first compressed payload starts a new stream, and later
+		#: payloads are compressed against it.
+		line = "(t_user - user): the same line again and again".encode()
+		first_flags, first = compressor.compress(line)
+		second_flags, second = compressor.compress(line)
+
+		self.assertTrue(first_flags & frames.FLAG_RESET)
+		self.assertFalse(second_flags & frames.FLAG_RESET)
+		self.assertLess(len(second), len(first))
+
+		self.assertEqual(decompressor.decompress(first_flags, first), line)
+		self.assertEqual(decompressor.decompress(second_flags, second), line)
+
+	def testCompressedSessionFunctionality(self):
+		print("\n---------- testCompressedSessionFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		options = [session.options for session in server.sessions.values()]
+
+		#: A long reply is compressed, and should still be readable.
+		client.send("/commands")
+		time.sleep(.1)
+
+		reply = client.most_recent_message
+
+		client.quit(False)
+		server.stop()
+
+		self.assertEqual(options, [frames.OPTION_COMPRESSION])
+		self.assertEqual(client.options, frames.OPTION_COMPRESSION)
+		self.assertIn("/quit", reply)
+
+		#: Private messages are sent raw, outside of the compressed stream.
+		server_end, client_end = socket.socketpair()
+		session = Session(server_end, "127.0.0.1", 1, version=frames.VERSION)
+		session.negotiated = True
+		session.set_options(frames.OPTION_COMPRESSION)
+
+		secret = "(t_other - user) whispers: a private message " * 10
+		session.send(frames.DIRECT, secret)
+		session.send(frames.CHAT, secret)
+		session.flush(timeout=5)
+
+		client_end.settimeout(5)
+		reader = FrameReader()
+		recieved = []
+		while len(recieved) < 2:
+			recieved += reader.feed(client_end.recv(65536))
+
+		session.close()
+		server_end.close()
+		client_end.close()
+
+		self.assertEqual((recieved[0].flags, recieved[0].payload.decode()), (0, secret))
+		self.assertTrue(recieved[1].flags & frames.FLAG_RESET)
+
+	def testRequestFunctionality(self):
+		print("\n---------- testRequestFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: Send both commands before waiting for either response.
+		token_request = client.request("/token")
+		invalid_request = client.request("/not_a_command")
+
+		invalid_reply = client.get_reply(invalid_request, timeout=1)
+		token_reply = client.get_reply(token_request, timeout=1)
+		tokens = dict(server.resume_tokens)
+
+		client.quit(False)
+		server.stop()
+
+		self.assertEqual(invalid_reply, (frames.ERROR, "not_a_command is not a valid command."))
+		self.assertEqual(token_reply[0], frames.REPLY)
+		self.assertIn(token_reply[1], tokens)
+
+	def testOutboxFunctionality(self):
+		print("\n---------- testOutboxFunctionality ----------")
+
+		queue = Outbox(max_wait=0.5)
+		now = time.monotonic()
+
+		queue.put(outbox.CHAT, "chat 1", now)
+		queue.put(outbox.CHAT, "chat 2", now)
+		queue.put(outbox.DIRECT, "direct", now)
+		queue.put(outbox.CONTROL, "close", now)
+
+		#: Higher lanes go first, and each lane stays in order.
+		ordered = [item for _, _, item in queue.take()]
+
+		#: A chat message that waited too long goes ahead of newer control traffic.
+		queue.put(outbox.CHAT, "stale chat", now - 1)
+		queue.put(outbox.CONTROL, "notice")
+		starved = [item for _, _, item in queue.take(1)]
+
+		self.assertEqual(ordered, ["close", "direct", "chat 1", "chat 2"])
+		self.assertEqual(starved, ["stale chat"])
+		self.assertEqual(len(queue), 1)
+		self.assertEqual(outbox.lane_for(frames.PING), outbox.CONTROL)
+		self.assertEqual(outbox.lane_for(frames.CHAT), outbox.CHAT)
+
+	def testLaneFunctionality(self):
+		print("\n---------- testLaneFunctionality ----------")
+
+		server_end, client_end = socket.socketpair()
+		metrics = LaneMetrics()
+
+		session = Session(server_end, "127.0.0.1", 1, version=frames.VERSION, metrics=metrics)
+		session.negotiated = True
+
+		#: The messages are written by the session's own thread, which
+		#: says when they have been.
+		delivered = threading.Event()
+		session.send_many([(frames.CHAT, "line {}".format(i), 2) for i in range(50)], on_written=delivered.set)
+		session.send(frames.NOTICE, "shutting down")
+		written = session.flush(timeout=5)
+
+		client_end.settimeout(5)
+		reader = FrameReader()
+		recieved = []
+		while len(recieved) < 51:
+			recieved += reader.feed(client_end.recv(65536))
+
+		session.close()
+		server_end.close()
+		client_end.close()
+
+		summary = metrics.summary()
+
+		self.assertTrue(written)
+		self.assertTrue(delivered.wait(5))
+		self.assertEqual([frame.seq for frame in recieved], list(range(1, 52)))
+		self.assertEqual(sorted(frame.payload.decode() for frame in recieved if frame.type == frames.CHAT),
+				 sorted("line {}".format(i) for i in range(50)))
+		self.assertEqual(summary["chat"][0] + summary["control"][0], 51)
+
+		#: Once closed, nothing more can be sent.
+		with self.assertRaises(OSError):
+			session.send(frames.NOTICE, "too late")
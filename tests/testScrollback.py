@@ -0,0 +1,102 @@
+import unittest
+import os
+import tempfile
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.protocol import frames
+from chatroom.scrollback import Scrollback
+
+class testScrollback(unittest.TestCase):
+
+	def testScrollbackFunctionality(self):
+		print("\n---------- testScrollbackFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "scrollback")
+		scrollback = Scrollback(path, max_memory=1000, block_size=300)
+
+		for i in range(1000):
+			scrollback.add(frames.CHAT, "(user{} - user): message {}".format(i % 7, i), recieved=i)
+
+		#: Only the newest lines are kept in memory, and the rest are
+		#: compressed into the file.
+		self.assertEqual(len(scrollback), 1000)
+		self.assertLessEqual(scrollback.memory_usage(), 1000)
+		self.assertGreater(len(scrollback.blocks), 1)
+		self.assertLess(os.path.getsize(path), sum(len("(userN - user): message {}".format(i)) for i in range(1000)) / 2)
+		self.assertEqual(scrollback.latest().text, "(user5 - user): message 999")
+
+		#: Lines can be read across blocks, and from the file into memory.
+		lines = scrollback.lines(0, 1000)
+		self.assertEqual([line.number for line in lines], list(range(1000)))
+		self.assertEqual([line.time for line in lines], list(range(1000)))
+		self.assertEqual(lines[123].text, "(user4 - user): message 123")
+
+		self.assertEqual([line.number for line in scrollback.page(1, 20)], list(range(980, 1000)))
+		self.assertEqual([line.number for line in scrollback.page(50, 20)], list(range(0, 20)))
+		self.assertEqual(scrollback.page(51, 20), [])
+		self.assertEqual(scrollback.pages(20), 50)
+
+		#: Searches ignore case, and go from the newest line back.
+		found = scrollback.find("MESSAGE 99", limit=5)
+		self.assertEqual([line.number for line in found], [999, 998, 997, 996, 995])
+
+		found = scrollback.find("message 99", limit=20, before=990)
+		self.assertEqual([line.number for line in found], [99])
+
+		self.assertEqual(scrollback.find("nobody said this"), [])
+
+		#: Once closed, the file is gone, but the newest lines can still be read.
+		scrollback.close()
+		scrollback.add(frames.CHAT, "after closing " * 100)
+
+		self.assertEqual(scrollback.find("message 1"), [])
+		self.assertEqual(scrollback.page(1, 1)[0].text, "after closing " * 100)
+
+	def testBrowseFunctionality(self):
+		print("\n---------- testBrowseFunctionality ----------")
+
+		self.client.join('localhost', 12345, silent=True)
+		self.client.send("t_alice")
+		time.sleep(.1)
+
+		for i in range(30):
+			self.server.send_all("note {}".format(i))
+		time.sleep(.2)
+
+		self.server.messages = []
+
+		#: Commands that look back through the scrollback are not sent.
+		lines = self.client.browse("/find NOTE 2")
+		self.assertEqual(lines[0], "Messages containing \"NOTE 2\":")
+		self.assertEqual([line.split("] ", 1)[1] for line in lines[1:]], ["(server): note {}".format(i) for i in [2] + list(range(20, 30))])
+		self.assertEqual(self.client.browse("/more"), ["No more messages."])
+
+		lines = self.client.browse("/scroll")
+		self.assertTrue(lines[0].startswith("Page 1 of "))
+		self.assertEqual(lines[-1].split("] ", 1)[1], "(server): note 29")
+		self.assertEqual(len(lines), 21)
+
+		lines = self.client.browse("/more")
+		self.assertTrue(lines[0].startswith("Page 2 of "))
+		self.assertEqual(lines[-1].split("] ", 1)[1], "(server): note 9")
+
+		self.assertEqual(self.client.browse("/scroll two"), ["Usage: /scroll [page]"])
+		self.assertEqual(self.client.browse("/find"), ["Usage: /find [text]"])
+		self.assertEqual(self.client.browse("hello /find"), None)
+
+		time.sleep(.1)
+		self.assertEqual(self.server.messages, [])
+
+	def setUp(self):
+		print("\n")
+		self.server = chatroomServer('localhost', 12345)
+		self.server.start(no_console=True)
+
+		#: Keep little in memory, so that the file is used.
+		self.client = chatroomClient(scrollback=Scrollback(max_memory=200, block_size=100))
+
+	def tearDown(self):
+		self.client.quit(False)
+		self.server.stop()
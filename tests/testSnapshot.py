@@ -0,0 +1,80 @@
+import unittest
+import os
+import tempfile
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.snapshot import save_snapshot, load_snapshot
+
+class testSnapshot(unittest.TestCase):
+
+	def testSaveLoadFunctionality(self):
+		print("\n---------- testSaveLoadFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "test.snapshot")
+
+		save_snapshot(path, [("127.0.0.1", "admin")], [("hello", "127.0.0.1")], [("abc", "bob")])
+		state = load_snapshot(path)
+
+		self.assertEqual(state["permissions"], [("127.0.0.1", "admin")])
+		self.assertEqual(state["history"], [("hello", "127.0.0.1")])
+		self.assertEqual(state["tokens"], [("abc", "bob")])
+
+		#: Strings too long to store are cut short between characters.
+		save_snapshot(path, [], [("a" + "é" * 40000, "")], [])
+		message = load_snapshot(path)["history"][0][0]
+
+		self.assertEqual(message, "a" + "é" * 32767)
+
+	def testFallbackFunctionality(self):
+		print("\n---------- testFallbackFunctionality ----------")
+
+		directory = tempfile.mkdtemp()
+		path = os.path.join(directory, "test.snapshot")
+		source = os.path.join(directory, "users.perm")
+
+		#: A missing snapshot can't be loaded.
+		self.assertIsNone(load_snapshot(path))
+
+		#: A broken snapshot can't be loaded.
+		with open(path, 'wb') as s_file:
+			s_file.write(b"CRSS\x01\xff")
+		self.assertIsNone(load_snapshot(path))
+
+		#: A snapshot older than its sources can't be loaded.
+		save_snapshot(path, [], [], [])
+		with open(source, 'w') as p_file:
+			p_file.write("127.0.0.1\n")
+		os.utime(source, (time.time() + 10, time.time() + 10))
+		self.assertIsNone(load_snapshot(path, [source]))
+
+	def testWarmStartFunctionality(self):
+		print("\n---------- testWarmStartFunctionality ----------")
+
+		path = os.path.join(tempfile.mkdtemp(), "server.snapshot")
+
+		#: Save some state from one server.
+		server = chatroomServer('localhost', 12345, snapshot_path=path)
+		server.history.append(("(server): hello", ""))
+		token = server.get_resume_token("t_user")
+		server.save_snapshot()
+		server.server.close()
+
+		#: A new server should start with that state, and a client should
+		#: be able to reclaim its username with the token.
+		server = chatroomServer('localhost', 12345, snapshot_path=path)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("/resume {}".format(token))
+		time.sleep(.1)
+
+		username_msg = client.most_recent_message
+
+		client.quit(False)
+		server.stop()
+
+		self.assertIn(("(server): hello", ""), server.history)
+		self.assertEqual(username_msg, "Username set to t_user.")
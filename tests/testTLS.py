@@ -0,0 +1,131 @@
+import unittest
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.protocol import frames, tls
+
+class testTLS(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+
+		#: Generate a self-signed certificate for localhost.
+		if shutil.which("openssl") is None:
+			raise unittest.SkipTest("openssl is needed to generate a test certificate.")
+
+		cls.directory = tempfile.mkdtemp()
+		cls.cert = os.path.join(cls.directory, "cert.pem")
+		cls.key = os.path.join(cls.directory, "key.pem")
+
+		subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+				"-keyout", cls.key, "-out", cls.cert, "-subj", "/CN=localhost",
+				"-addext", "subjectAltName=DNS:localhost"],
+			       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.directory, ignore_errors=True)
+
+	def testEncryptedFunctionality(self):
+		print("\n---------- testEncryptedFunctionality ----------")
+
+		self.server.start(no_console=True)
+
+		#: A client that never does its handshake should not stop others joining.
+		stalled = socket.create_connection(('localhost', 12345))
+
+		client = chatroomClient(tls_context=tls.client_context(self.cert))
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		reply = client.get_reply(client.request("/token"), timeout=2)
+		secured = [type(session.client) for session in self.server.sessions.values()]
+
+		client.quit(False)
+		stalled.close()
+
+		self.assertEqual(reply[0], frames.REPLY)
+		self.assertIsInstance(client.client, ssl.SSLSocket)
+		self.assertEqual(secured, [ssl.SSLSocket])
+
+	def testPendingHandshakeFunctionality(self):
+		print("\n---------- testPendingHandshakeFunctionality ----------")
+
+		self.server.admission.max_per_address = 1
+		self.server.tls_handshake_timeout = .5
+		self.server.start(no_console=True)
+
+		#: A connection doing its handshake counts against the limits.
+		stalled = socket.create_connection(('localhost', 12345))
+		time.sleep(.1)
+
+		refused = socket.create_connection(('localhost', 12345))
+		time.sleep(.1)
+
+		pending = dict(self.server.admission.sessions)
+		refusals = self.server.admission.refused["address"]
+
+		#: Once the handshake times out, it stops counting.
+		time.sleep(.6)
+		released = dict(self.server.admission.sessions)
+
+		stalled.close()
+		refused.close()
+
+		self.assertEqual(pending, {"127.0.0.1": 1})
+		self.assertEqual(refusals, 1)
+		self.assertEqual(released, {})
+
+	def testResumptionFunctionality(self):
+		print("\n---------- testResumptionFunctionality ----------")
+
+		self.server.start(no_console=True)
+		context = tls.client_context(self.cert)
+
+		first = chatroomClient(tls_context=context)
+		first.join('localhost', 12345, silent=True)
+		first.send("t_user")
+		first.get_reply(first.request("/token"), timeout=2)
+		first.quit(False)
+		time.sleep(.1)
+
+		#: The next client passes on the first client's session.
+		second = chatroomClient(tls_context=context, tls_session=first.tls_session)
+		second.join('localhost', 12345, silent=True)
+		second.send("t_user")
+		time.sleep(.1)
+
+		resumed = second.client.session_reused
+		second.quit(False)
+
+		self.assertIsNotNone(first.tls_session)
+		self.assertTrue(resumed)
+
+	def testUntrustedFunctionality(self):
+		print("\n---------- testUntrustedFunctionality ----------")
+
+		self.server.start(no_console=True)
+
+		#: Without trusting the self-signed certificate, the client refuses it.
+		client = chatroomClient(tls_context=tls.client_context())
+
+		with self.assertRaises(ssl.SSLCertVerificationError):
+			client.join('localhost', 12345, silent=True)
+
+		client.client.close()
+
+	def setUp(self):
+		print("\n")
+		self.server = chatroomServer('localhost', 12345)
+		self.server.enable_tls(self.cert, self.key)
+
+	def tearDown(self):
+		self.server.stop()
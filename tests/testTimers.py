@@ -0,0 +1,68 @@
+import unittest
+import socket
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.timers import TimerWheel
+
+class testTimers(unittest.TestCase):
+
+	def testScheduleFunctionality(self):
+		print("\n---------- testScheduleFunctionality ----------")
+
+		wheel = TimerWheel(tick=1, slots=4, levels=3)
+		start = wheel.start_time
+
+		#: Schedule timers on each level of the wheel.
+		wheel.schedule("a", 2)
+		wheel.schedule("b", 9)
+		wheel.schedule("c", 40)
+
+		#: Each timer expires on the tick it was scheduled for.
+		self.assertEqual(wheel.advance(start + 1), [])
+		self.assertEqual(wheel.advance(start + 2), ["a"])
+		self.assertEqual(wheel.advance(start + 8), [])
+		self.assertEqual(wheel.advance(start + 9), ["b"])
+		self.assertEqual(wheel.advance(start + 39), [])
+		self.assertEqual(wheel.advance(start + 40), ["c"])
+		self.assertEqual(len(wheel), 0)
+
+	def testCancelFunctionality(self):
+		print("\n---------- testCancelFunctionality ----------")
+
+		wheel = TimerWheel(tick=1, slots=4, levels=3)
+		start = wheel.start_time
+
+		wheel.schedule("a", 5)
+		wheel.schedule("b", 5)
+		wheel.cancel("a")
+
+		#: Rescheduling replaces the old timer.
+		wheel.schedule("b", 10)
+
+		self.assertEqual(wheel.advance(start + 5), [])
+		self.assertEqual(wheel.advance(start + 10), ["b"])
+
+	def testHeartbeatFunctionality(self):
+		print("\n---------- testHeartbeatFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.start(inactivity_timeout=1, pong_timeout=1, no_console=True)
+
+		#: A chatroomClient responds to pings, so it should stay connected,
+		#: while a bare socket does not, so it should be removed.
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+
+		silent_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		silent_socket.connect(('localhost', 12345))
+
+		time.sleep(3.5)
+		remaining = len(server.clientlist)
+
+		client.quit(False)
+		silent_socket.close()
+		server.stop()
+
+		self.assertEqual(remaining, 1)
@@ -0,0 +1,128 @@
+import unittest
+import os
+import tempfile
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.transfers import FileSpool, TransferServer
+
+class testTransfers(unittest.TestCase):
+
+	def testSpoolFunctionality(self):
+		print("\n---------- testSpoolFunctionality ----------")
+
+		spool = FileSpool(max_file_size=100, max_total=150)
+
+		first = spool.reserve("a.txt", 100)
+
+		#: Reserved space counts, so a second large upload does not fit.
+		with self.assertRaises(ValueError):
+			spool.reserve("b.txt", 60)
+		with self.assertRaises(ValueError):
+			spool.reserve("c.txt", 101)
+
+		with open(spool.path(first), "wb") as f:
+			f.write(b"x" * 100)
+
+		#: Paths sent by clients are reduced to a file name.
+		shared = spool.commit(first, "../../etc/a.txt", "t_user")
+
+		second = spool.reserve("b.txt", 50)
+		spool.abort(second)
+		directory = spool.directory
+		spool.close()
+
+		self.assertEqual((shared.name, shared.size, shared.owner), ("a.txt", 100, "t_user"))
+		self.assertEqual(spool.used, 0)
+		self.assertFalse(os.path.exists(directory))
+
+	def testSpoolLimitsFunctionality(self):
+		print("\n---------- testSpoolLimitsFunctionality ----------")
+
+		spool = FileSpool(max_file_size=100, max_total=200, max_age=60, max_reservations=1)
+
+		def share(name):
+			file_id = spool.reserve(name, 100)
+			with open(spool.path(file_id), "wb") as f:
+				f.write(b"x" * 100)
+			return spool.commit(file_id, name, "t_user")
+
+		first = share("a.txt")
+		second = share("b.txt")
+
+		#: A full spool makes room by removing the oldest file.
+		third = share("c.txt")
+
+		self.assertEqual(sorted(spool.files), [second.id, third.id])
+		self.assertFalse(os.path.exists(first.path))
+
+		#: Files are removed once they are too old.
+		spool.max_age = 0
+		self.assertEqual(spool.expire(), 2)
+		self.assertEqual(spool.files, {})
+		self.assertFalse(os.path.exists(third.path))
+
+		#: Each user may only have so many uploads waiting.
+		spool.reserve("d.txt", 50, "t_alice")
+		with self.assertRaises(ValueError):
+			spool.reserve("e.txt", 50, "t_alice")
+		spool.reserve("e.txt", 50, "t_bob")
+
+		#: Unfinished uploads are never removed, so they can fill the spool.
+		spool.reserve("f.txt", 100, "t_carol")
+		with self.assertRaises(ValueError):
+			spool.reserve("g.txt", 1, "t_dave")
+
+		spool.close()
+
+		#: Reservations for tickets that are never used are freed when
+		#: the tickets expire, without waiting for another ticket.
+		spool = FileSpool(max_file_size=100, max_total=100)
+		transfers = TransferServer(spool, ticket_timeout=0)
+
+		transfers.expect_upload("a.txt", 100, "t_user")
+		time.sleep(.01)
+		transfers.expire()
+
+		self.assertEqual(spool.used, 0)
+		spool.close()
+
+	def testTransferFunctionality(self):
+		print("\n---------- testTransferFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		directory = tempfile.mkdtemp()
+		data = os.urandom(300 * 1024)
+
+		with open(os.path.join(directory, "upload.bin"), "wb") as f:
+			f.write(data)
+
+		#: Once uploaded, the file is announced to the room.
+		file_id = client.upload(os.path.join(directory, "upload.bin"))
+		time.sleep(.1)
+		announced = [message[0] for message in list(server.messages) + list(server.history)]
+
+		os.mkdir(os.path.join(directory, "downloads"))
+		path = client.download(file_id, os.path.join(directory, "downloads"))
+
+		with open(path, "rb") as f:
+			downloaded = f.read()
+
+		listing = client.get_reply(client.request("/download"), timeout=1)
+		missing = client.get_reply(client.request("/download 99"), timeout=1)
+
+		client.quit(False)
+		server.stop()
+
+		self.assertEqual(downloaded, data)
+		self.assertTrue(any("/download {}".format(file_id) in message for message in announced))
+		self.assertIn("upload.bin (307200 bytes, from t_user)", listing[1])
+		self.assertEqual(missing[1], "There is no file 99.")
@@ -0,0 +1,197 @@
+import unittest
+import io
+import os
+import tempfile
+import threading
+import time
+
+from chatroom.host import chatroomServer
+from chatroom.handoff import HandoffReceiver
+from chatroom.protocol import frames, FrameReader
+from chatroom.transport import MemoryTransport
+
+class MemoryUser:
+	""" A client speaking frames over a MemoryTransport, which waits for
+	    the frames it expects rather than sleeping. """
+
+	def __init__(self, transport, username: str):
+		self.connection = transport.connect(('localhost', 12345))
+		self.connection.settimeout(5)
+		self.reader = FrameReader()
+		self.frames = []
+		self.seq = 0
+
+		#: Ask for frames, without compression, and wait for the response.
+		#: Anything sent before it (eg the prompt) is plain text.
+		hello = frames.encode_hello(frames.VERSION, 0)
+		self.connection.sendall(hello)
+
+		data = b""
+		while hello not in data:
+			data += self.connection.recv(65536)
+
+		self.frames += self.reader.feed(data.partition(hello)[2])
+
+		self.send(username)
+
+	def send(self, msg: str):
+		frame_type, text = frames.from_client_text(msg)
+		self.seq += 1
+		self.connection.sendall(frames.encode_frame(frame_type, self.seq, 0, text.encode()))
+		return self.seq
+
+	def expect(self, predicate):
+		""" Waits for the first frame matching predicate, and returns it. """
+
+		while True:
+			for frame in self.frames:
+				if predicate(frame):
+					self.frames.remove(frame)
+					return frame
+
+			data = self.connection.recv(65536)
+			if len(data) == 0:
+				raise ConnectionError("The server closed the connection.")
+
+			self.frames += self.reader.feed(data)
+
+	def reply(self, command: str):
+		seq = self.send(command)
+		frame = self.expect(lambda frame: frame.ref == seq)
+		return frame.type, frame.payload.decode()
+
+class testTransport(unittest.TestCase):
+
+	def testMemorySocketFunctionality(self):
+		print("\n---------- testMemorySocketFunctionality ----------")
+
+		transport = MemoryTransport()
+
+		with self.assertRaises(ConnectionRefusedError):
+			transport.connect(('localhost', 1))
+
+		listener = transport.listen(('localhost', 1))
+		client_end = transport.connect(('localhost', 1))
+		server_end, address = listener.accept()
+
+		#: There is no file descriptor to hand to anything else.
+		with self.assertRaises(io.UnsupportedOperation):
+			server_end.fileno()
+
+		client_end.sendall(b"hello")
+		server_end.settimeout(0.0)
+		recieved = server_end.recv(3) + server_end.recv(10)
+
+		with self.assertRaises(BlockingIOError):
+			server_end.recv(10)
+
+		#: Closing one end is seen as the end of the stream by the other.
+		client_end.close()
+		ended = server_end.recv(10)
+
+		with self.assertRaises(OSError):
+			server_end.sendall(b"too late")
+
+		listener.close()
+
+		self.assertEqual(recieved, b"hello")
+		self.assertEqual(ended, b"")
+		self.assertEqual(client_end.fileno(), -1)
+		self.assertEqual(listener.fileno(), -1)
+		self.assertTrue(address[0].startswith("memory-remote:"))
+
+		#: Only a transport created as local gives local addresses.
+		local = MemoryTransport(local=True)
+		listener = local.listen(('localhost', 1))
+		local.connect(('localhost', 1)).close()
+
+		self.assertTrue(listener.accept()[1][0].startswith("memory:"))
+		listener.close()
+
+	def testMemoryFanOutFunctionality(self):
+		print("\n---------- testMemoryFanOutFunctionality ----------")
+
+		users = [MemoryUser(self.transport, "t_user{}".format(i)) for i in range(3)]
+
+		#: Wait until every user has joined, so they all see the message.
+		for user in users:
+			user.reply("/token")
+
+		users[0].send("hello everyone")
+
+		recieved = [user.expect(lambda frame: frame.type == frames.CHAT) for user in users[1:]]
+
+		self.assertTrue(all(frame.payload.decode().endswith("hello everyone") for frame in recieved))
+		self.assertEqual(len({frame.sender for frame in recieved}), 1)
+
+	def testMemoryCommandFunctionality(self):
+		print("\n---------- testMemoryCommandFunctionality ----------")
+
+		user = MemoryUser(self.transport, "t_user")
+		other = MemoryUser(self.transport, "t_other")
+		other.reply("/token")
+
+		#: Local clients are given the local permission level, which
+		#: is not enough to look up permissions.
+		refused = user.reply("/permissions t_other")
+
+		self.server.change_permissions(self.server.usernames["t_user"][1], "admin")
+		allowed = user.reply("/permissions t_other")
+
+		listing = user.reply("/user_list")
+
+		self.assertEqual(refused[0], frames.ERROR)
+		self.assertEqual(allowed[0], frames.REPLY)
+		self.assertIn("user", allowed[1])
+		self.assertIn("t_other", listing[1])
+
+	def testMemoryUpgradeFunctionality(self):
+		print("\n---------- testMemoryUpgradeFunctionality ----------")
+
+		user = MemoryUser(self.transport, "t_user")
+		user.reply("/token")
+
+		path = os.path.join(tempfile.mkdtemp(), "handoff.sock")
+		receivers = []
+		receive_thread = threading.Thread(target=lambda: receivers.append(HandoffReceiver(path)))
+		receive_thread.start()
+
+		while not os.path.exists(path):
+			time.sleep(.01)
+
+		#: In-memory sockets can't be handed to another process, so the
+		#: handoff fails, and the server carries on with its clients.
+		upgraded = self.server.upgrade(path)
+		receive_thread.join()
+		receivers[0].close()
+
+		self.assertFalse(upgraded)
+		self.assertEqual(user.reply("/token")[0], frames.REPLY)
+
+	def testMemoryThroughputFunctionality(self):
+		print("\n---------- testMemoryThroughputFunctionality ----------")
+
+		self.server.set_rate_limit("message", 10 ** 6, 10 ** 6)
+		self.server.set_rate_limit("message", 10 ** 6, 10 ** 6, per_ip=True)
+
+		sender = MemoryUser(self.transport, "t_sender")
+		reciever = MemoryUser(self.transport, "t_reciever")
+		reciever.reply("/token")
+
+		for i in range(1000):
+			sender.send("message {}".format(i))
+
+		recieved = [reciever.expect(lambda frame: frame.type == frames.CHAT).payload.decode()
+			    for _ in range(1000)]
+
+		self.assertTrue(all(text.endswith("message {}".format(i)) for i, text in enumerate(recieved)))
+
+	def setUp(self):
+		print("\n")
+		#: Local clients aren't saved to the permission files.
+		self.transport = MemoryTransport(local=True)
+		self.server = chatroomServer('localhost', 12345, transport=self.transport)
+		self.server.start(no_console=True)
+
+	def tearDown(self):
+		self.server.stop()
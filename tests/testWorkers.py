@@ -0,0 +1,122 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+
+from chatroom.client import chatroomClient
+from chatroom.host import chatroomServer
+from chatroom.protocol import frames
+from chatroom.workers import WorkerPool
+from chatroom.permissions.permissions import Permissions
+
+class testWorkers(unittest.TestCase):
+
+	def testWorkerPoolFunctionality(self):
+		print("\n---------- testWorkerPoolFunctionality ----------")
+
+		pool = WorkerPool(workers=1, max_queue=1)
+		pool.start()
+
+		release = threading.Event()
+		done = []
+
+		#: The first job holds the only worker, and the second waits.
+		self.assertTrue(pool.submit(release.wait))
+		time.sleep(.05)
+		self.assertTrue(pool.submit(done.append, "second"))
+
+		#: The queue is full, so the third is refused.
+		self.assertEqual((pool.active, pool.depth), (1, 1))
+		self.assertFalse(pool.submit(done.append, "third"))
+
+		release.set()
+		time.sleep(.05)
+
+		self.assertEqual(done, ["second"])
+		self.assertEqual((pool.active, pool.depth), (0, 0))
+
+		pool.stop()
+
+		#: Once stopped, jobs are refused rather than left to wait forever.
+		self.assertFalse(pool.submit(done.append, "late"))
+
+		#: Stopping more workers than the queue holds, while it is full,
+		#: doesn't block, and stops every worker.
+		pool = WorkerPool(workers=3, max_queue=1)
+		pool.start()
+		threads = list(pool._threads)
+
+		release = threading.Event()
+		for _ in range(3):
+			pool.submit(release.wait)
+		time.sleep(.05)
+		self.assertTrue(pool.submit(done.append, "dropped"))
+
+		pool.stop()
+		release.set()
+
+		for thread in threads:
+			thread.join(1)
+
+		self.assertFalse(any(thread.is_alive() for thread in threads))
+		self.assertEqual(done, ["second"])
+
+	def testBlockingCommandFunctionality(self):
+		print("\n---------- testBlockingCommandFunctionality ----------")
+
+		directory = tempfile.mkdtemp()
+		server = chatroomServer('localhost', 12345, permissions_dir=directory)
+		server.start(no_console=True)
+
+		client = chatroomClient()
+		client.join('localhost', 12345, silent=True)
+		client.send("t_user")
+		time.sleep(.1)
+
+		#: promote_user is run by the worker pool, and its reply should
+		#: still reference the request. Only set the permission in memory.
+		server.permissions[server.get_ip("t_user")] = Permissions('owner', 2, directory)
+		request = client.request("/promote_user t_user not_a_permission")
+		reply = client.get_reply(request, timeout=1)
+
+		client.quit(False)
+		server.stop()
+
+		self.assertTrue(server.client_command_list["promote_user"].blocking)
+		self.assertEqual(reply, (frames.REPLY, "not_a_permission is not a valid permission type."))
+
+	def testConcurrentPromotionFunctionality(self):
+		print("\n---------- testConcurrentPromotionFunctionality ----------")
+
+		server = chatroomServer('localhost', 12345, permissions_dir=tempfile.mkdtemp())
+
+		#: Promote and demote many addresses at once, as the worker pool does.
+		def promote(i):
+			address = "10.99.0.{}".format(i)
+			for permission in ("user", "admin", "user", "admin"):
+				server.change_permissions(address, permission)
+
+		threads = [threading.Thread(target=promote, args=(i,)) for i in range(16)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		#: Each address is in exactly one permission file, which agrees with
+		#: the server's own list.
+		files = {name: p_type.get_clients() for name, p_type in server.permission_types.items()}
+
+		for i in range(16):
+			address = "10.99.0.{}".format(i)
+			found = [name for name, clients in files.items() for client in clients if client == address]
+
+			self.assertEqual(found, ["admin"])
+			self.assertEqual(server.permissions[address].permission, "admin")
+
+		#: No temporary files are left behind.
+		directory = os.path.dirname(server.permission_types["user"].permission_file)
+		self.assertEqual([name for name in os.listdir(directory) if name.endswith(".tmp")], [])
+
+		server.server.close()
+		server.mailboxes.close()